@@ -0,0 +1,485 @@
+# Deterministic micro-benchmarks for the game and the multiplayer server.
+#
+#     python benchmark.py run                       # print timings
+#     python benchmark.py run --save baseline.json  # record a baseline
+#     python benchmark.py compare baseline.json     # exit 1 on regressions
+#
+# Every benchmark uses fixed seeds and scripted inputs, so the same code
+# does the same work on every run.
+
+import os
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import argparse
+import asyncio
+import json
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pygame
+
+import leaderboard
+import track_pack
+from track_data import BRANDS_HATCH_MAP, GAME_MAP, TILESIZE
+from web_multiplayer import event_log, heatmaps, racing_env, replay, server
+
+
+SEED = 1234
+DEFAULT_REPEATS = 7
+DEFAULT_THRESHOLD = 0.15
+BENCHMARKS = {}
+
+
+def benchmark(name: str, number: int):
+    def register(setup):
+        BENCHMARKS[name] = (setup, number)
+        return setup
+    return register
+
+
+class NullWebSocket:
+    async def send_text(self, text: str):
+        pass
+
+
+class ScriptedKeys:
+    def __init__(self):
+        self.pressed = set()
+
+    def __getitem__(self, key):
+        return key in self.pressed
+
+
+def input_script(rng: random.Random, length: int):
+    script = []
+    for _ in range(length):
+        steer = rng.choice((-1.0, 0.0, 0.0, 1.0))
+        handbrake = rng.random() < 0.15
+        script.append(
+            server.InputState(
+                up=True, left=steer < 0, right=steer > 0, handbrake=handbrake,
+                throttle=1.0, steer=steer,
+            )
+        )
+    return script
+
+
+def make_room(player_count: int, rows=None) -> server.RoomState:
+    room = server.RoomState(room_id='bench')
+    if rows is not None:
+        server.set_room_track(room, 'bench', rows, 'Bench', server.DEFAULT_SPAWN_ROTATION_DEG)
+    for index in range(player_count):
+        player = server.PlayerState(
+            player_id=f'p{index}',
+            name=f'Bot {index}',
+            x=room.spawn_x,
+            y=room.spawn_y,
+            rotation_deg=room.spawn_rotation_deg,
+            websocket=NullWebSocket(),
+        )
+        server.set_player_car(player, index % len(server.WEB_CAR_MODELS))
+        room.players[player.player_id] = player
+    server.start_countdown(room)
+    room.phase = 'racing'
+    return room
+
+
+@benchmark('server.step_player_physics', number=2000)
+def bench_step_player_physics():
+    rng = random.Random(SEED)
+    room = make_room(8)
+    players = list(room.players.values())
+    script = input_script(rng, 240)
+    dt = 1.0 / server.TICK_HZ
+    state = {'step': 0}
+
+    def op():
+        step = state['step']
+        state['step'] = step + 1
+        player = players[step % len(players)]
+        player.input_state = script[(step // len(players)) % len(script)]
+        server.step_player_physics(room, player, dt)
+
+    return op
+
+
+@benchmark('server.solve_car_collisions', number=500)
+def bench_solve_car_collisions():
+    rng = random.Random(SEED)
+    room = make_room(16)
+    players = list(room.players.values())
+    # A tight pack around the spawn so a good share of pairs are in contact.
+    start = [
+        (room.spawn_x + rng.uniform(-60.0, 60.0), room.spawn_y + rng.uniform(-60.0, 60.0),
+         rng.uniform(-200.0, 200.0), rng.uniform(-200.0, 200.0))
+        for _ in players
+    ]
+
+    def op():
+        for player, (x, y, vx, vy) in zip(players, start):
+            player.x, player.y, player.vx, player.vy = x, y, vx, vy
+        server.solve_car_collisions(players)
+
+    return op
+
+
+@benchmark('server.drive_bots', number=2000)
+def bench_drive_bots():
+    room = make_room(0)
+    server.set_room_track(room, 'brands_hatch', BRANDS_HATCH_MAP, 'Brands Hatch', server.DEFAULT_SPAWN_ROTATION_DEG)
+    server.set_room_bots(room, server.MAX_BOTS_PER_ROOM)
+    server.start_countdown(room)
+    room.phase = 'racing'
+    bots = list(room.players.values())
+    dt = 1.0 / server.TICK_HZ
+    # Spread the bots round the lap so the controller sees straights and corners.
+    for _ in range(600):
+        server.drive_bots(room, bots)
+        for bot in bots:
+            server.step_player_physics(room, bot, dt)
+    start = [(bot.x, bot.y, bot.vx, bot.vy, bot.rotation_deg, bot.next_sector) for bot in bots]
+
+    def op():
+        for bot, (x, y, vx, vy, rotation_deg, next_sector) in zip(bots, start):
+            bot.x, bot.y, bot.vx, bot.vy, bot.rotation_deg, bot.next_sector = x, y, vx, vy, rotation_deg, next_sector
+            bot.bot.idle_ticks = bot.bot.slow_ticks = bot.bot.reverse_ticks = 0
+        server.drive_bots(room, bots)
+
+    return op
+
+
+@benchmark('racing_env.VectorRacingEnv.step', number=200)
+def bench_racing_env_step():
+    vector = racing_env.VectorRacingEnv(16, track_id='brands_hatch', cars=2)
+    rng = random.Random(SEED)
+    actions = [
+        [[(1.0, 0.0, rng.uniform(-1.0, 1.0), 0.0) for _ in range(env.cars)] for env in vector.envs]
+        for _ in range(50)
+    ]
+    vector.reset(SEED)
+    step = 0
+
+    def op():
+        nonlocal step
+        # Reseeded every 50 steps so each run covers the same stretch of track.
+        if step % len(actions) == 0:
+            vector.reset(SEED)
+        vector.step(actions[step % len(actions)])
+        step += 1
+
+    return op
+
+
+@benchmark('replay.ReplayRecorder.record_tick', number=2000)
+def bench_replay_record_tick():
+    room = make_room(8, BRANDS_HATCH_MAP)
+    scripts = [input_script(random.Random(SEED + index), 64) for index in range(8)]
+    recorder = replay.ReplayRecorder(room)
+    players = list(room.players.values())
+    state = {'tick': 0}
+
+    def op():
+        # Every car's input changes every tick: the worst case for the log.
+        tick = state['tick']
+        state['tick'] = tick + 1
+        for player, script in zip(players, scripts):
+            player.input_state = script[tick % len(script)]
+        recorder.record_tick(room)
+
+    return op
+
+
+@benchmark('server.log_race_event', number=5000)
+def bench_log_race_event():
+    # What a lap costs the tick; the writer thread does the encoding.
+    room = make_room(1)
+    room.race_id = 'bench'
+    player = next(iter(room.players.values()))
+    fields = server.player_event_fields(player)
+
+    def op():
+        server.log_race_event(room, 'lap', lap=1, lapMs=61234.5, **fields)
+
+    return op
+
+
+@benchmark('server.record_heatmap_samples', number=5000)
+def bench_record_heatmap_samples():
+    rng = random.Random(SEED)
+    room = make_room(8, BRANDS_HATCH_MAP)
+    for player in room.players.values():
+        player.x += rng.uniform(-400.0, 400.0)
+        player.vx = rng.uniform(-300.0, 300.0)
+
+    def op():
+        # Every call is a sampling tick.
+        server.record_heatmap_samples(room)
+
+    return op
+
+
+@benchmark('server.validate_map_rows', number=50)
+def bench_validate_map_rows():
+    tracks = [list(BRANDS_HATCH_MAP), list(GAME_MAP)]
+
+    def op():
+        for rows in tracks:
+            server.validate_map_rows(rows)
+
+    return op
+
+
+@benchmark('server.find_nearest_road_tile', number=200)
+def bench_find_nearest_road_tile():
+    rng = random.Random(SEED)
+    room = make_room(0, BRANDS_HATCH_MAP)
+    width = room.track_width_tiles * TILESIZE
+    height = room.track_height_tiles * TILESIZE
+    points = [(rng.uniform(0, width), rng.uniform(0, height)) for _ in range(64)]
+    state = {'index': 0}
+
+    def op():
+        x, y = points[state['index'] % len(points)]
+        state['index'] += 1
+        server.find_nearest_road_tile(room, x, y)
+
+    return op
+
+
+@benchmark('server.find_nearest_road_tile.pack', number=2000)
+def bench_find_nearest_road_tile_pack():
+    rng = random.Random(SEED)
+    room = make_room(0)
+    server.set_room_track(room, 'brands_hatch', BRANDS_HATCH_MAP, 'Brands Hatch', server.DEFAULT_SPAWN_ROTATION_DEG)
+    width = room.track_width_tiles * TILESIZE
+    height = room.track_height_tiles * TILESIZE
+    points = [(rng.uniform(0, width), rng.uniform(0, height)) for _ in range(64)]
+    state = {'index': 0}
+
+    def op():
+        x, y = points[state['index'] % len(points)]
+        state['index'] += 1
+        server.find_nearest_road_tile(room, x, y)
+
+    return op
+
+
+@benchmark('track_pack.read_pack', number=200)
+def bench_read_pack():
+    path = track_pack.pack_path('brands_hatch')
+
+    def op():
+        track_pack.read_pack(path)
+
+    return op
+
+
+@benchmark('server.broadcast_room_state', number=300)
+def bench_broadcast_room_state():
+    rng = random.Random(SEED)
+    room = make_room(8)
+    for player in room.players.values():
+        player.x += rng.uniform(-400.0, 400.0)
+        player.y += rng.uniform(-400.0, 400.0)
+        player.vx = rng.uniform(-300.0, 300.0)
+        player.vy = rng.uniform(-300.0, 300.0)
+    loop = asyncio.new_event_loop()
+
+    async def tick():
+        # Leaderboards ride along twice a second; keep them out so every
+        # call does the same work.
+        room.last_leaderboard_push_time = server.now_seconds()
+        await server.broadcast_room_state(room, from_tick=True)
+        # Let the no-op sends finish so every recipient is due next tick.
+        await asyncio.sleep(0)
+        room.tick += 1
+
+    def op():
+        loop.run_until_complete(tick())
+
+    return op
+
+
+def make_game():
+    from game import Game
+
+    random.seed(SEED)
+    game = Game()
+    game.game_mode = 'brands_hatch'
+    return game
+
+
+@benchmark('sprites.Car.update', number=600)
+def bench_car_update():
+    game = make_game()
+    game.new()
+    game.dt = 1.0 / 60
+    car = game.players[0]
+    keys = ScriptedKeys()
+    rng = random.Random(SEED)
+    script = [
+        {pygame.K_w} | rng.choice(({pygame.K_a}, {pygame.K_d}, set(), set())) | ({pygame.K_LSHIFT} if rng.random() < 0.15 else set())
+        for _ in range(120)
+    ]
+    state = {'step': 0}
+    pygame.key.get_pressed = lambda: keys
+
+    def op():
+        keys.pressed = script[state['step'] % len(script)]
+        state['step'] += 1
+        car.update()
+
+    return op
+
+
+@benchmark('game.Game.create_map_image', number=3)
+def bench_create_map_image():
+    game = make_game()
+
+    def op():
+        random.seed(SEED)
+        game.create_map_image()
+
+    return op
+
+
+@benchmark('leaderboard.Leaderboard.add_score', number=50)
+def bench_add_score():
+    rng = random.Random(SEED)
+    names = [f'Driver{i}' for i in range(20)]
+    for path in (leaderboard.LEADERBOARD_FILE, leaderboard.LEADERBOARD_BACKUP_FILE):
+        if os.path.exists(path):
+            os.remove(path)
+    board = leaderboard.Leaderboard()
+    state = {'index': 0}
+
+    def op():
+        index = state['index']
+        state['index'] = index + 1
+        board.add_score('brands_hatch', '3_laps', names[index % len(names)], rng.randint(60000, 120000))
+
+    return op
+
+
+def redirect_leaderboard(directory: str):
+    # Keep benchmarks away from the real leaderboard files.
+    leaderboard.LEADERBOARD_FILE = os.path.join(directory, 'leaderboard.json')
+    leaderboard.LEADERBOARD_TMP_FILE = f'{leaderboard.LEADERBOARD_FILE}.tmp'
+    leaderboard.LEADERBOARD_BACKUP_FILE = f'{leaderboard.LEADERBOARD_FILE}.bak'
+    server.LEADERBOARD_FILE = os.path.join(directory, 'web_leaderboard.json')
+    replay.REPLAY_DIR = Path(directory) / 'replays'
+    server.EVENT_LOG = event_log.EventLog(Path(directory) / 'events')
+    server.HEATMAPS = heatmaps.HeatmapStore(Path(directory) / 'heatmaps')
+
+
+def time_benchmark(name: str, repeats: int):
+    setup, number = BENCHMARKS[name]
+    samples = []
+    real_get_pressed = pygame.key.get_pressed
+    try:
+        for _ in range(repeats):
+            # Fresh state every repeat so each one does identical work.
+            op = setup()
+            started = time.perf_counter_ns()
+            for _ in range(number):
+                op()
+            samples.append((time.perf_counter_ns() - started) / number / 1000.0)
+    finally:
+        pygame.key.get_pressed = real_get_pressed
+    return {
+        'number': number,
+        'repeats': repeats,
+        'median_us': round(statistics.median(samples), 3),
+        'min_us': round(min(samples), 3),
+    }
+
+
+def run_benchmarks(names, repeats: int):
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        redirect_leaderboard(directory)
+        for name in names:
+            results[name] = time_benchmark(name, repeats)
+            print(f'{name:40s} {results[name]["median_us"]:12.2f} us/op  (min {results[name]["min_us"]:.2f})', flush=True)
+    return results
+
+
+def selected_names(pattern: str | None):
+    names = [name for name in BENCHMARKS if not pattern or pattern in name]
+    if not names:
+        sys.exit(f'No benchmark matches {pattern!r}')
+    return names
+
+
+def environment_info():
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'pygame': pygame.version.ver,
+    }
+
+
+def command_run(args):
+    results = run_benchmarks(selected_names(args.filter), args.repeats)
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as file:
+            json.dump({'environment': environment_info(), 'results': results}, file, indent=2)
+        print(f'Saved baseline to {args.save}')
+
+
+def command_compare(args):
+    with open(args.baseline, 'r', encoding='utf-8') as file:
+        baseline = json.load(file)['results']
+    names = [name for name in selected_names(args.filter) if name in baseline]
+    results = run_benchmarks(names, args.repeats)
+
+    regressions = []
+    print()
+    for name in names:
+        before = baseline[name]['median_us']
+        after = results[name]['median_us']
+        change = (after - before) / before if before > 0 else 0.0
+        marker = ''
+        if change > args.threshold:
+            marker = '  REGRESSION'
+            regressions.append(name)
+        elif change < -args.threshold:
+            marker = '  faster'
+        print(f'{name:40s} {before:12.2f} -> {after:12.2f} us/op  {change * 100.0:+7.1f}%{marker}')
+
+    if regressions:
+        print(f'\n{len(regressions)} benchmark(s) regressed by more than {args.threshold * 100.0:.0f}%')
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ChunkyDrift micro-benchmarks.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='run the benchmarks')
+    run_parser.add_argument('--save', help='write the results to this baseline file')
+    run_parser.set_defaults(handler=command_run)
+
+    compare_parser = subparsers.add_parser('compare', help='run and compare against a baseline')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='allowed slowdown, 0.15 = 15%%')
+    compare_parser.set_defaults(handler=command_compare)
+
+    for sub in (run_parser, compare_parser):
+        sub.add_argument('--filter', help='only run benchmarks whose name contains this')
+        sub.add_argument('--repeats', type=int, default=DEFAULT_REPEATS)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == '__main__':
+    main()
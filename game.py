@@ -4,6 +4,7 @@ import random
 from settings import *
 from sprites import *
 from leaderboard import Leaderboard
+from track_geometry import track_sectors_for
 
 class Game:
     def __init__(self):
@@ -71,6 +72,7 @@ class Game:
             current_map = STUNT_MAP
         elif self.game_mode == 'brands_hatch':
             current_map = BRANDS_HATCH_MAP
+        self.track_sectors = track_sectors_for(tuple(current_map))
             
         self.create_map_image()
 
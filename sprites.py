@@ -165,7 +165,7 @@ class Car(pygame.sprite.Sprite):
         self.z_vel = 0
         self.on_ground = True
         self.laps = 0
-        self.checkpoint_passed = False
+        self.next_sector = 0
         self.sync_visual_to_rotation()
 
     def sync_visual_to_rotation(self):
@@ -637,18 +637,17 @@ class Car(pygame.sprite.Sprite):
         self.hit_rect.center = self.pos
         
         # --- LAP COUNTING ---
-        if hasattr(self.game, 'checkpoints'):
-            hits = pygame.sprite.spritecollide(self, self.game.checkpoints, False)
-            if hits:
-                self.checkpoint_passed = True
-        
-        if hasattr(self.game, 'finish_lines'):
-            hits = pygame.sprite.spritecollide(self, self.game.finish_lines, False)
-            if hits:
-                if self.checkpoint_passed:
+        # Checkpoint groups must be passed in order, then the finish line.
+        sectors = getattr(self.game, 'track_sectors', None)
+        if sectors is not None:
+            gate = sectors.gate_at(int(self.pos.x // TILESIZE), int(self.pos.y // TILESIZE))
+            if gate == self.next_sector:
+                if gate == sectors.finish_index:
                     self.laps += 1
-                    self.checkpoint_passed = False
+                    self.next_sector = 0
                     print(f"Player {self.player_id} completed lap {self.laps}!")
+                else:
+                    self.next_sector += 1
 
 class Wall(pygame.sprite.Sprite):
     def __init__(self, game, x, y, tile_type='1'):
@@ -0,0 +1,66 @@
+import base64
+import math
+import random
+
+from web_multiplayer.ghosts import (
+    GHOST_POSITION_SCALE,
+    GHOST_ROTATION_SCALE,
+    GhostStore,
+    decode_trace,
+    encode_trace,
+    read_zigzag_varints,
+    zigzag_varints,
+)
+
+
+def test_zigzag_varint_round_trip():
+    values = [0, 1, -1, 63, -64, 64, -65, 127, 128, -128, 2 ** 31, -2 ** 31, 2 ** 62, -2 ** 62]
+    assert read_zigzag_varints(zigzag_varints(values)) == values
+    assert zigzag_varints([0, -1, 1]) == bytes([0, 1, 2])
+
+
+def test_trace_round_trip():
+    rng = random.Random(3)
+    samples = []
+    x, y, rotation = 1200.0, 340.0, 350.0
+    for _ in range(200):
+        x += rng.uniform(-40.0, 40.0)
+        y += rng.uniform(-40.0, 40.0)
+        rotation = (rotation + rng.uniform(-25.0, 25.0)) % 360.0
+        samples += (x, y, rotation)
+
+    decoded = decode_trace(encode_trace(samples))
+    assert len(decoded) == len(samples)
+    for index in range(0, len(samples), 3):
+        assert abs(decoded[index] - samples[index]) <= 0.5 / GHOST_POSITION_SCALE
+        assert abs(decoded[index + 1] - samples[index + 1]) <= 0.5 / GHOST_POSITION_SCALE
+        # Rotation comes back unwrapped; compare it round the circle.
+        turn = (decoded[index + 2] - samples[index + 2] + 180.0) % 360.0 - 180.0
+        assert abs(turn) <= 0.5 / GHOST_ROTATION_SCALE + 1e-9
+
+
+def test_trace_wraps_through_zero():
+    samples = []
+    for step in range(20):
+        samples += (100.0, 100.0, (350.0 + step * 2.0) % 360.0)
+    encoded = encode_trace(samples)
+    decoded = decode_trace(encoded)
+    # Short turns stay short: after the first sample, one byte per channel.
+    data = base64.b64decode(encoded)
+    first = zigzag_varints(read_zigzag_varints(data)[:3])
+    assert len(data) == len(first) + len(samples) - 3
+    assert all(math.isclose(b - a, 2.0) for a, b in zip(decoded[2::3], decoded[5::3]))
+
+
+def test_store_keeps_fastest(tmp_path):
+    store = GhostStore(tmp_path)
+    samples = [10.0, 20.0, 90.0, 12.0, 22.0, 95.0]
+    assert store.offer('loop', '1_laps', 'hash', 'Ann', 20000.0, 100.0, 5.0, samples)
+    assert not store.offer('loop', '1_laps', 'hash', 'Bob', 21000.0, 100.0, 5.0, samples)
+    assert store.offer('loop', '1_laps', 'hash', 'Cat', 19000.0, 100.0, 5.0, samples)
+
+    reloaded = GhostStore(tmp_path).get('loop', '1_laps', 'hash')
+    assert reloaded['name'] == 'Cat' and reloaded['lapMs'] == 19000
+    assert decode_trace(reloaded['data']) == samples
+    # A ghost driven on other rows is not handed out.
+    assert GhostStore(tmp_path).get('loop', '1_laps', 'other') is None
@@ -0,0 +1,129 @@
+import pytest
+
+from web_multiplayer import replay, server, verification
+from web_multiplayer.track_store import track_hash
+
+
+RACE_TICKS = 90 * server.TICK_HZ
+
+
+def scripted_race(directory):
+    # One lap of Brands Hatch: a human steered by the bot controller (its
+    # inputs quantized like a client's) and a server bot. The room is
+    # headless so nothing reaches the logs or boards; the recorder is
+    # attached by hand. Returns the replay path, each tick's car poses
+    # (taken at the top of the tick, where keyframes are written) and the
+    # finish times.
+    room = server.RoomState(room_id='test-replay', headless=True)
+    track = server.resolve_track('brands_hatch')
+    server.set_room_track(room, track['id'], track['rows'], track['name'], server.normalize_spawn_rotation(track.get('spawnRotationDeg', 90)))
+    room.laps_to_win = 1
+    human = server.PlayerState(player_id='human', name='Human', x=room.spawn_x, y=room.spawn_y, rotation_deg=room.spawn_rotation_deg, websocket=None)
+    room.players[human.player_id] = human
+    server.set_room_bots(room, 1)
+    server.start_countdown(room)
+    room.countdown_end_time = 0.0
+    server.maybe_begin_race(room)
+    room.recorder = replay.ReplayRecorder(room, directory)
+
+    controller = server.BotState()
+    dt = 1.0 / server.TICK_HZ
+    poses = []
+    while room.phase == 'racing' and room.tick < RACE_TICKS:
+        controller.idle_ticks = 0  # never take the controller's unrecorded respawn
+        human.bot = controller
+        server.drive_bots(room, [human])
+        human.bot = None
+        state = human.input_state
+        state.throttle = server.quantize_axis(state.throttle, 0.0, 1.0)
+        state.brake = server.quantize_axis(state.brake, 0.0, 1.0)
+        state.steer = server.quantize_axis(state.steer, -1.0, 1.0)
+
+        replay.record_tick(room)
+        poses.append({player.player_id: (player.x, player.y, player.rotation_deg) for player in room.players.values()})
+        replay.simulate_tick(room, dt)
+
+    results = {player.player_id: player.race_total_time for player in room.players.values() if player.finished}
+    return replay.finish_recording(room), poses, results
+
+
+@pytest.fixture(scope='module')
+def race(tmp_path_factory):
+    path, poses, results = scripted_race(tmp_path_factory.mktemp('replays'))
+    assert path is not None and 'human' in results
+    return replay.ReplayFile(path), poses, results
+
+
+def car_poses(player):
+    return {car.player_id: (car.x, car.y, car.rotation_deg) for car in player.cars if car.player_id in player.room.players}
+
+
+def test_header_round_trip(race):
+    replay_file, poses, _ = race
+    assert replay_file.complete
+    assert replay_file.track_id == 'brands_hatch'
+    assert replay_file.laps_to_win == 1
+    assert replay_file.ticks == len(poses)
+    assert [(car[0] == 'human', bool(car[3])) for car in replay_file.cars] == [(True, False), (False, True)]
+    assert replay_file.keyframes[0][0] == 0
+
+
+def test_resimulation_matches_live_race(race):
+    # Inputs alone, keyframes never applied: the invariant verification
+    # relies on.
+    replay_file, poses, results = race
+    player = replay.ReplayPlayer(replay_file)
+    player.snap = False
+    for tick, expected in enumerate(poses):
+        player.advance(tick - player.tick)
+        assert car_poses(player) == expected, f'drift at tick {tick}'
+    player.advance(replay_file.ticks)
+    assert {car.player_id: car.race_total_time for car in player.cars if car.finished} == results
+
+
+def test_seek_restores_from_keyframes(race):
+    replay_file, poses, results = race
+    player = replay.ReplayPlayer(replay_file)
+    key_ticks = [tick for tick, _ in replay_file.keyframes]
+    targets = key_ticks[1:4] + [key_ticks[2] + 37, len(poses) // 2, 5]
+    for tick in targets:
+        player.seek(tick)
+        assert player.tick == tick
+        assert car_poses(player) == poses[tick], f'seek to {tick}'
+    player.seek(key_ticks[-1])
+    player.advance(replay_file.ticks)
+    assert {car.player_id: car.race_total_time for car in player.cars if car.finished} == results
+
+
+def test_verify_run(race):
+    replay_file, _, results = race
+    rows_hash = track_hash(replay_file.rows)
+    path = str(replay_file.path)
+    assert verification.verify_run(path, 'human', results['human'], rows_hash)['status'] == 'verified'
+    assert verification.verify_run(path, 'human', results['human'] - 500.0, rows_hash)['status'] == 'rejected'
+    assert verification.verify_run(path, 'human', results['human'], 'not-the-track')['status'] == 'rejected'
+
+
+def test_index_prunes_and_pages(tmp_path, monkeypatch):
+    monkeypatch.setattr(replay, 'REPLAY_KEEP_PER_ROOM', 3)
+    monkeypatch.setattr(replay, 'REPLAY_KEEP_TOTAL', 5)
+    index = replay.ReplayIndex(tmp_path)
+    now = replay.time.time()
+    stale = now - (replay.REPLAY_MAX_AGE_DAYS + 1) * 86400
+    for number, (room, started_at) in enumerate([('a', stale)] + [('a', now)] * 4 + [('b', now)] * 3):
+        race_id = f'{number:012x}'
+        path = tmp_path / room / f'{race_id}{replay.REPLAY_SUFFIX}'
+        path.parent.mkdir(exist_ok=True)
+        path.write_bytes(b'')
+        index.add({'raceId': race_id, 'roomId': room, 'startedAt': started_at + number, 'path': f'{room}/{path.name}'})
+
+    # The stale race goes by age, one of room a's by the room cap, then the
+    # oldest survivor by the total cap.
+    kept = ['000000000007', '000000000006', '000000000005', '000000000004', '000000000003']
+    assert sorted(path.stem for path in tmp_path.glob('*/*.cdr')) == sorted(kept)
+    for reloaded in (index, replay.ReplayIndex(tmp_path)):
+        page, total = reloaded.page()
+        assert total == 5 and [entry['raceId'] for entry in page] == kept
+        assert all('path' not in entry for entry in page)
+        assert [entry['raceId'] for entry in reloaded.page('a', offset=1, limit=1)[0]] == ['000000000003']
+        assert reloaded.find('000000000001') is None
@@ -0,0 +1,88 @@
+import random
+
+import pytest
+
+from track_data import BRANDS_HATCH_MAP
+from track_pack import (
+    MAX_RUN,
+    NO_ROAD,
+    TrackPackError,
+    build_road_mask,
+    decode_pack,
+    decode_rle,
+    encode_pack,
+    encode_rle,
+    read_pack,
+    write_pack,
+)
+
+
+EDGE_ROWS = [
+    '#' * (MAX_RUN + 3),  # a run longer than one RLE pair can hold
+    '#' + 'P' + '.' * (MAX_RUN - 1) + 'C#',  # exactly MAX_RUN of a kind after a single tile
+    '#' + '.C' * ((MAX_RUN + 1) // 2) + '#',  # no runs at all
+    'F' * (MAX_RUN + 3),
+]
+
+
+def test_rle_round_trip_edges():
+    for tiles in [b'', b'#', b'#' * MAX_RUN, b'#' * (MAX_RUN + 1), b'#' * (2 * MAX_RUN), bytes(range(256))]:
+        assert decode_rle(encode_rle(tiles)) == tiles
+
+
+def test_write_read_round_trip(tmp_path):
+    path = tmp_path / 'edge.ctp'
+    write_pack(path, EDGE_ROWS, 'Edge Rows', 135.0)
+    pack = read_pack(path)
+    assert pack.rows == EDGE_ROWS
+    assert (pack.width, pack.height) == (len(EDGE_ROWS[0]), len(EDGE_ROWS))
+    assert pack.name == 'Edge Rows'
+    assert pack.spawn_rotation_deg == 135.0
+    assert pack.spawn == (1, 1)
+    assert bytes(pack.road_mask) == build_road_mask(''.join(EDGE_ROWS).encode('ascii'))
+
+
+def test_preset_round_trip(tmp_path):
+    path = tmp_path / 'brands_hatch.ctp'
+    write_pack(path, BRANDS_HATCH_MAP, 'Brands Hatch', 90.0)
+    pack = read_pack(path)
+    assert pack.rows == list(BRANDS_HATCH_MAP)
+    nearest = pack.nearest_road
+    assert nearest is not None and len(nearest) == pack.width * pack.height
+    # Every tile points at a road tile, and road tiles at themselves.
+    for index, target in enumerate(nearest):
+        assert target != NO_ROAD and pack.road_mask[target]
+        if pack.road_mask[index]:
+            assert target == index
+
+
+def test_tile_plane_only():
+    pack = decode_pack(encode_pack(EDGE_ROWS, layers=False))
+    assert pack.rows == EDGE_ROWS
+    assert pack.road_mask is None and pack.nearest_road is None
+
+
+def test_no_road_layer():
+    pack = decode_pack(encode_pack(['###', '###']))
+    assert pack.spawn is None
+    assert list(pack.nearest_road) == [NO_ROAD] * 6
+
+
+def test_corruption_is_detected():
+    data = bytearray(encode_pack(BRANDS_HATCH_MAP, 'Brands Hatch'))
+    rng = random.Random(7)
+    for _ in range(20):
+        index = rng.randrange(len(data) - 64, len(data))  # inside the layers
+        corrupted = bytearray(data)
+        corrupted[index] ^= 0xFF
+        with pytest.raises(TrackPackError):
+            decode_pack(bytes(corrupted))
+    with pytest.raises(TrackPackError):
+        decode_pack(bytes(data[:10]))
+    with pytest.raises(TrackPackError):
+        decode_pack(b'XXXX' + bytes(data[4:]))
+
+
+def test_rejects_ragged_rows():
+    with pytest.raises(TrackPackError):
+        encode_pack(['###', '##'])
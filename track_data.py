@@ -0,0 +1,29 @@
+# Track and car data shared by the pygame game, the track editor and the web
+# server. Keep this module free of third-party imports so the server can load
+# it without pulling in pygame.
+
+from track_pack import load_pack
+
+TILESIZE = 16
+
+# Map Layout
+# 1 = Wall/Grass, . = Road, P = Player Start, F = Finish Line, C = Checkpoint
+# The maps are binary packs in tracks/ (see track_pack.py). Edit them with
+# track_editor.py or rebuild one from a text map with `python track_pack.py build`.
+GAME_MAP = load_pack('rally_loop').rows
+BRANDS_HATCH_MAP = load_pack('brands_hatch').rows
+STUNT_MAP = load_pack('stunt_track').rows
+
+# Car Models
+CAR_MODELS = [
+    {"name": "Focus RS", "color": (0, 70, 220), "accel": 400, "max_speed": 650, "grip": 0.95, "drag": 0.992, "friction": 150},
+    {"name": "Subaru WRX", "color": (0, 50, 200), "accel": 420, "max_speed": 640, "grip": 0.96, "drag": 0.991, "friction": 160},
+    {"name": "Evo X", "color": (220, 20, 20), "accel": 410, "max_speed": 645, "grip": 0.94, "drag": 0.992, "friction": 150},
+    {"name": "Citroen C3", "color": (180, 20, 20), "accel": 430, "max_speed": 620, "grip": 0.97, "drag": 0.990, "friction": 170},
+    {"name": "Toyota Yaris", "color": (230, 230, 230), "accel": 450, "max_speed": 610, "grip": 0.98, "drag": 0.989, "friction": 180},
+    {"name": "Audi Quattro", "color": (240, 240, 200), "accel": 380, "max_speed": 680, "grip": 0.92, "drag": 0.995, "friction": 140},
+    {"name": "Lancia Delta", "color": (20, 20, 100), "accel": 390, "max_speed": 660, "grip": 0.93, "drag": 0.993, "friction": 145},
+    {"name": "Peugeot 205", "color": (255, 215, 0), "accel": 440, "max_speed": 630, "grip": 0.95, "drag": 0.990, "friction": 160},
+    {"name": "Mini Cooper", "color": (0, 100, 0), "accel": 460, "max_speed": 600, "grip": 0.99, "drag": 0.985, "friction": 200},
+    {"name": "Porsche 911", "color": (200, 200, 200), "accel": 480, "max_speed": 720, "grip": 0.85, "drag": 0.994, "friction": 120} # Drift Monster
+]
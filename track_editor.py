@@ -1,11 +1,13 @@
-import json
 import os
 import re
 from pathlib import Path
 
 import pygame
 
-from settings import BRANDS_HATCH_MAP, GAME_MAP, STUNT_MAP
+from track_data import BRANDS_HATCH_MAP, GAME_MAP, STUNT_MAP
+from track_pack import TrackPackError, pack_path, write_pack
+from web_multiplayer.heatmaps import HEATMAP_DIR, load_heatmap
+from web_multiplayer.track_store import TrackStore, track_hash
 
 
 TILE_WALL = '1'
@@ -50,8 +52,11 @@ BUILTIN_TRACKS = [
 ]
 
 CUSTOM_TRACKS_FILE = Path(__file__).parent / 'web_multiplayer' / 'custom_tracks.json'
+TRACK_STORE_DIR = Path(__file__).parent / 'web_multiplayer' / 'tracks'
 DEFAULT_SPAWN_ROTATION_DEG = 90.0
 SPAWN_ROTATIONS = [0.0, 90.0, 180.0, 270.0]
+HEATMAP_MODES = [None, 'wallHits', 'respawns', 'meanSpeed']
+HEATMAP_LABELS = {'wallHits': 'wall hits', 'respawns': 'respawns', 'meanSpeed': 'mean speed'}
 SPAWN_LABELS = {
     0.0: 'Left',
     90.0: 'Up',
@@ -84,41 +89,24 @@ def normalize_spawn_rotation(value, default=DEFAULT_SPAWN_ROTATION_DEG):
     return float(closest)
 
 
-def load_custom_tracks(path):
-    if not path.exists():
-        return []
-    try:
-        with open(path, 'r', encoding='utf-8') as file:
-            data = json.load(file)
-        items = data.get('tracks', []) if isinstance(data, dict) else []
-        tracks = []
-        for item in items:
-            track_id = str(item.get('id', '')).strip()
-            name = str(item.get('name', track_id)).strip() or track_id
-            rows = normalize_rows(item.get('rows', []))
-            if not track_id or not rows:
-                continue
-            width = len(rows[0])
-            if width == 0 or any(len(row) != width for row in rows):
-                continue
-            tracks.append(
-                {
-                    'id': track_id,
-                    'name': name,
-                    'rows': rows,
-                    'spawnRotationDeg': normalize_spawn_rotation(item.get('spawnRotationDeg', DEFAULT_SPAWN_ROTATION_DEG)),
-                }
-            )
-        return tracks
-    except Exception:
-        return []
+def load_custom_track_entries(store):
+    store.migrate_from_json(CUSTOM_TRACKS_FILE)
+    return [entry for entry in store.list_entries() if entry.get('id') and entry.get('hash')]
 
 
-def save_custom_tracks(path, tracks):
-    path.parent.mkdir(parents=True, exist_ok=True)
-    payload = {'tracks': tracks}
-    with open(path, 'w', encoding='utf-8') as file:
-        json.dump(payload, file, indent=2)
+def load_custom_track(store, track_id):
+    track = store.load_track(track_id)
+    if track is None:
+        return None
+    rows = normalize_rows(track['rows'])
+    if not rows:
+        return None
+    width = len(rows[0])
+    if width == 0 or any(len(row) != width for row in rows):
+        return None
+    track['rows'] = rows
+    track['spawnRotationDeg'] = normalize_spawn_rotation(track.get('spawnRotationDeg', DEFAULT_SPAWN_ROTATION_DEG))
+    return track
 
 
 def choose_mode():
@@ -133,32 +121,43 @@ def choose_mode():
 
 
 def choose_existing_track():
-    custom_tracks = load_custom_tracks(CUSTOM_TRACKS_FILE)
+    store = TrackStore(TRACK_STORE_DIR)
+    custom_entries = load_custom_track_entries(store)
     combined = []
     builtin_ids = {track['id'] for track in BUILTIN_TRACKS}
 
     combined.extend(BUILTIN_TRACKS)
-    for track in custom_tracks:
-        if track['id'] in builtin_ids:
+    for entry in custom_entries:
+        if entry['id'] in builtin_ids:
             for index, existing in enumerate(combined):
-                if existing['id'] == track['id']:
-                    combined[index] = track
+                if existing['id'] == entry['id']:
+                    combined[index] = entry
                     break
         else:
-            combined.append(track)
+            combined.append(entry)
 
     print('\nAvailable tracks to edit:')
     for index, track in enumerate(combined, start=1):
         rotation = normalize_spawn_rotation(track.get('spawnRotationDeg', DEFAULT_SPAWN_ROTATION_DEG))
         facing = SPAWN_LABELS.get(rotation, str(int(rotation)))
-        print(f"{index}) {track['name']} [{track['id']}] ({len(track['rows'][0])}x{len(track['rows'])}) Spawn:{facing}")
+        width = track['width'] if 'hash' in track else len(track['rows'][0])
+        height = track['height'] if 'hash' in track else len(track['rows'])
+        print(f"{index}) {track['name']} [{track['id']}] ({width}x{height}) Spawn:{facing}")
 
     while True:
         raw = input(f'Select track 1-{len(combined)}: ').strip()
         if raw.isdigit():
             selected = int(raw)
             if 1 <= selected <= len(combined):
-                return combined[selected - 1]
+                track = combined[selected - 1]
+                if 'hash' not in track:
+                    return track
+                # Only the chosen track body is read from the store.
+                loaded = load_custom_track(store, track['id'])
+                if loaded is not None:
+                    return loaded
+                print('That track could not be loaded.')
+                continue
         print('Invalid selection.')
 
 
@@ -229,8 +228,11 @@ class TrackEditor:
         self.default_python_path = 'custom_track_python.txt'
         self.default_snippet_path = 'custom_track_settings_snippet.txt'
         self.repo_root = Path(__file__).parent
-        self.custom_tracks_path = self.repo_root / 'web_multiplayer' / 'custom_tracks.json'
-        self.settings_file_path = os.path.join(os.path.dirname(__file__), 'settings.py')
+        self.track_store = TrackStore(TRACK_STORE_DIR)
+        self.pack_path = pack_path(self.track_id)
+        self.heatmap_mode = 0
+        self.heatmap_surface = None
+        self.heatmap_peak = 0
 
     def set_status(self, text):
         self.status_text = text
@@ -328,74 +330,74 @@ class TrackEditor:
         except OSError as exc:
             self.set_status(f'Export failed: {exc}')
 
-    def write_back_to_settings(self):
-        if not os.path.exists(self.settings_file_path):
-            self.set_status(f'Write failed: settings.py not found')
-            return
-
+    def write_track_pack(self):
+        rows = [''.join(row) for row in self.grid]
         try:
-            with open(self.settings_file_path, 'r', encoding='utf-8') as file:
-                lines = file.readlines()
-
-            start_index = None
-            for index, line in enumerate(lines):
-                if line.strip().startswith(f'{self.map_name} = ['):
-                    start_index = index
-                    break
-
-            if start_index is None:
-                self.set_status(f'Write failed: {self.map_name} block not found')
-                return
-
-            end_index = None
-            for index in range(start_index + 1, len(lines)):
-                if lines[index].strip() == ']':
-                    end_index = index
-                    break
-
-            if end_index is None:
-                self.set_status('Write failed: could not find end of map block')
-                return
-
-            block_lines = [f'{self.map_name} = [\n']
-            for row in self.grid:
-                block_lines.append(f'    "{"".join(row)}",\n')
-            block_lines.append(']\n')
-
-            updated_lines = lines[:start_index] + block_lines + lines[end_index + 1:]
-            with open(self.settings_file_path, 'w', encoding='utf-8') as file:
-                file.writelines(updated_lines)
-
-            self.set_status(f'Updated {self.map_name} in settings.py')
-        except OSError as exc:
+            size = write_pack(self.pack_path, rows, self.track_name, normalize_spawn_rotation(self.spawn_rotation_deg))
+        except (OSError, TrackPackError) as exc:
             self.set_status(f'Write failed: {exc}')
+            return
+        self.set_status(f'Wrote {self.pack_path.name} ({size} bytes)')
 
     def save_to_web_tracks(self):
-        tracks = load_custom_tracks(self.custom_tracks_path)
-        updated = False
         rows = [''.join(row) for row in self.grid]
-
-        for track in tracks:
-            if track['id'] == self.track_id:
-                track['name'] = self.track_name
-                track['rows'] = rows
-                track['spawnRotationDeg'] = normalize_spawn_rotation(self.spawn_rotation_deg)
-                updated = True
-                break
-
-        if not updated:
-            tracks.append(
-                {
-                    'id': self.track_id,
-                    'name': self.track_name,
-                    'rows': rows,
-                    'spawnRotationDeg': normalize_spawn_rotation(self.spawn_rotation_deg),
-                }
+        try:
+            self.track_store.save_track(
+                self.track_id,
+                self.track_name,
+                rows,
+                normalize_spawn_rotation(self.spawn_rotation_deg),
             )
-
-        save_custom_tracks(self.custom_tracks_path, tracks)
+        except OSError as exc:
+            self.set_status(f'Save failed: {exc}')
+            return
         self.set_status(f'Saved track "{self.track_name}" to web track library')
 
+    def cycle_heatmap(self):
+        # Re-read on every press, so a running server's latest flush shows up.
+        self.heatmap_mode = (self.heatmap_mode + 1) % len(HEATMAP_MODES)
+        self.heatmap_surface = None
+        mode = HEATMAP_MODES[self.heatmap_mode]
+        if mode is None:
+            self.set_status('Heatmap overlay off')
+            return
+
+        heatmap = load_heatmap(HEATMAP_DIR, self.track_id, 1)
+        if heatmap is None:
+            self.heatmap_mode = 0
+            self.set_status(f'No heatmap for {self.track_id} yet')
+            return
+        if (heatmap.width, heatmap.height) != (self.map_width, self.map_height):
+            self.heatmap_mode = 0
+            self.set_status('Heatmap is for a different map size')
+            return
+
+        if mode == 'wallHits':
+            values = list(heatmap.wall_hits)
+        elif mode == 'respawns':
+            values = list(heatmap.respawns)
+        else:
+            values = [total / count if count else 0.0 for total, count in zip(heatmap.speed_sum, heatmap.speed_samples)]
+        self.heatmap_peak = max(values, default=0)
+        peak = self.heatmap_peak or 1
+        surface = pygame.Surface((self.map_px_w, self.map_px_h), pygame.SRCALPHA)
+        for index, value in enumerate(values):
+            if not value:
+                continue
+            share = value / peak
+            if mode == 'meanSpeed':
+                # Slow blue to fast red.
+                color = (int(255 * share), 60, int(255 * (1.0 - share)), 170)
+            else:
+                # Square root so a few hot spots do not hide everything else.
+                color = (255, int(200 * (1.0 - share ** 0.5)), 0, int(60 + 170 * share ** 0.5))
+            row, col = divmod(index, self.map_width)
+            surface.fill(color, (col * self.tile_size, row * self.tile_size, self.tile_size, self.tile_size))
+        self.heatmap_surface = surface
+
+        stale = heatmap.rows_hash != track_hash([''.join(row) for row in self.grid])
+        self.set_status(f'Heatmap: {HEATMAP_LABELS[mode]}' + (' (older layout)' if stale else ''))
+
     def draw_map(self):
         for row in range(self.map_height):
             for col in range(self.map_width):
@@ -421,6 +423,9 @@ class TrackEditor:
 
                 pygame.draw.rect(self.screen, GRID_LINE_COLOR, rect, 1)
 
+        if self.heatmap_surface is not None:
+            self.screen.blit(self.heatmap_surface, (0, 0))
+
     def draw_panel(self):
         panel_rect = pygame.Rect(self.map_px_w, 0, self.panel_w, self.map_px_h)
         pygame.draw.rect(self.screen, PANEL_BG, panel_rect)
@@ -445,6 +450,13 @@ class TrackEditor:
         self.screen.blit(active_text, (x, y))
         y += 28
 
+        mode = HEATMAP_MODES[self.heatmap_mode]
+        if mode is not None:
+            peak = f'{self.heatmap_peak:.0f} px/s' if mode == 'meanSpeed' else str(self.heatmap_peak)
+            heat_text = self.small_font.render(f'Heatmap: {HEATMAP_LABELS[mode]} (max {peak})', True, (255, 160, 90))
+            self.screen.blit(heat_text, (x, y))
+            y += 24
+
         hints = [
             'Left click/drag: paint current tool',
             'Right click/drag: paint Wall',
@@ -456,7 +468,9 @@ class TrackEditor:
             'E: Export Python list',
             'X: Export settings snippet',
             'K: Save/update this track for website selector',
+            'W: Write track pack (tracks/<id>.ctp)',
             'Q/E: Rotate spawn direction left/right',
+            'H: Heatmap overlay (hits/respawns/speed)',
             'ESC: Quit',
             '',
             'Tip: Start tile (P) is unique.',
@@ -495,6 +509,10 @@ class TrackEditor:
                     self.export_settings_snippet()
                 elif event.key == pygame.K_k:
                     self.save_to_web_tracks()
+                elif event.key == pygame.K_w:
+                    self.write_track_pack()
+                elif event.key == pygame.K_h:
+                    self.cycle_heatmap()
                 elif event.key == pygame.K_q:
                     self.rotate_spawn_direction(-1)
                 elif event.key == pygame.K_e:
@@ -0,0 +1,473 @@
+# Track geometry shared by the web server and the game. Stdlib only, like
+# track_data.py and track_pack.py.
+
+import heapq
+import math
+from array import array
+from collections import deque
+from functools import lru_cache
+
+from track_pack import NO_ROAD, build_road_mask, nearest_road_tiles
+
+
+DIAGONAL = math.sqrt(2.0)
+WALL_COST = 1.5  # extra step cost next to a wall, falling off with the square of the clearance
+STEPS = (
+    (1, 0, 1.0), (-1, 0, 1.0), (0, 1, 1.0), (0, -1, 1.0),
+    (1, 1, DIAGONAL), (1, -1, DIAGONAL), (-1, 1, DIAGONAL), (-1, -1, DIAGONAL),
+)
+
+
+def geodesic_distance(road_mask, width: int, height: int, targets, blocked=frozenset(), tile_cost=None):
+    # Dijkstra over road tiles towards the target tiles. Blocked tiles get a
+    # distance but are never expanded, so a path cannot pass through another
+    # gate. Diagonal steps need both side tiles to be road (no corner cutting).
+    # tile_cost, if given, scales the cost of stepping onto each tile.
+    distance = [math.inf] * (width * height)
+    heap = []
+    for index in targets:
+        distance[index] = 0.0
+        heap.append((0.0, index))
+    heapq.heapify(heap)
+
+    while heap:
+        dist, index = heapq.heappop(heap)
+        if dist > distance[index] or (index in blocked and dist > 0.0):
+            continue
+        col, row = index % width, index // width
+        for dx, dy, cost in STEPS:
+            n_col, n_row = col + dx, row + dy
+            if not (0 <= n_col < width and 0 <= n_row < height):
+                continue
+            neighbour = n_row * width + n_col
+            if not road_mask[neighbour]:
+                continue
+            if dx and dy and not (road_mask[row * width + n_col] and road_mask[n_row * width + col]):
+                continue
+            next_dist = dist + (cost * tile_cost[neighbour] if tile_cost is not None else cost)
+            if next_dist < distance[neighbour]:
+                distance[neighbour] = next_dist
+                heapq.heappush(heap, (next_dist, neighbour))
+    return distance
+
+
+def label_components(tiles: bytes, width: int, height: int, tile: int):
+    # 8-connected components of one tile type, each a sorted list of indexes.
+    seen = bytearray(width * height)
+    components = []
+    for start, value in enumerate(tiles):
+        if value != tile or seen[start]:
+            continue
+        seen[start] = 1
+        component = []
+        stack = [start]
+        while stack:
+            index = stack.pop()
+            component.append(index)
+            col, row = index % width, index // width
+            for dx, dy, _ in STEPS:
+                n_col, n_row = col + dx, row + dy
+                if 0 <= n_col < width and 0 <= n_row < height:
+                    neighbour = n_row * width + n_col
+                    if tiles[neighbour] == tile and not seen[neighbour]:
+                        seen[neighbour] = 1
+                        stack.append(neighbour)
+        components.append(sorted(component))
+    return components
+
+
+class TrackSectors:
+    # Checkpoint groups (8-connected C regions) in lap order, then the finish
+    # (every F tile). labels holds gate index + 1 per tile and 0 elsewhere,
+    # so the tick finds the gate under a car with one index.
+    def __init__(self, rows):
+        self.width = len(rows[0])
+        self.height = len(rows)
+        tiles = ''.join(rows).encode('ascii')
+        checkpoints = label_components(tiles, self.width, self.height, ord('C'))
+        finish = [index for index, tile in enumerate(tiles) if tile == ord('F')]
+        if not checkpoints or not finish:
+            raise ValueError('A track needs at least one checkpoint and a finish line')
+
+        road_mask = build_road_mask(tiles)
+        self.gates = order_checkpoints(road_mask, self.width, self.height, checkpoints, finish, tiles.find(b'P')) + [finish]
+        # uint16: one checkpoint per tile on the largest map still fits.
+        self.labels = array('H', bytes(2 * self.width * self.height))
+        for number, gate in enumerate(self.gates, start=1):
+            for index in gate:
+                self.labels[index] = number
+
+    @property
+    def finish_index(self) -> int:
+        return len(self.gates) - 1
+
+    def gate_at(self, col: int, row: int) -> int:
+        # -1 when the tile is not part of any gate.
+        if 0 <= col < self.width and 0 <= row < self.height:
+            return self.labels[row * self.width + col] - 1
+        return -1
+
+
+def reachable_gates(road_mask, width, height, gates, source_tiles, blocked):
+    distance = geodesic_distance(road_mask, width, height, source_tiles, blocked)
+    return {index for index, gate in enumerate(gates) if any(math.isfinite(distance[tile]) for tile in gate)}
+
+
+def order_checkpoints(road_mask, width: int, height: int, checkpoints, finish, spawn_index: int):
+    # On a loop each gate touches two others when all gates block paths. The
+    # spawn sits between the last checkpoint and the finish, so walking the
+    # loop from the finish away from the spawn's segment gives lap order.
+    if len(checkpoints) == 1:
+        return checkpoints
+
+    gates = checkpoints + [finish]
+    finish_gate = len(gates) - 1
+    all_tiles = set().union(*map(set, gates))
+    neighbours = [
+        reachable_gates(road_mask, width, height, gates, gate, all_tiles - set(gate)) - {index}
+        for index, gate in enumerate(gates)
+    ]
+    behind = set()
+    if spawn_index >= 0:
+        behind = reachable_gates(road_mask, width, height, gates, [spawn_index], all_tiles) - {finish_gate}
+
+    order = []
+    previous = next(iter(behind)) if len(behind) == 1 else None
+    current = finish_gate
+    while True:
+        options = neighbours[current] - {previous, finish_gate} - set(order)
+        if len(options) != 1:
+            break
+        previous, current = current, options.pop()
+        order.append(current)
+
+    if len(order) != len(checkpoints):
+        # Not a simple loop (branches or shortcuts): fall back to distance
+        # from the finish along the road.
+        distance = geodesic_distance(road_mask, width, height, finish)
+        order = sorted(range(len(checkpoints)), key=lambda index: min(distance[tile] for tile in checkpoints[index]))
+    return [checkpoints[index] for index in order]
+
+
+class ProgressField:
+    # Lap progress for every tile, one table per gate a car may be heading
+    # for. A car that has to reach gate i next is at
+    #   (distance covered up to gate i - geodesic distance to gate i) / lap length
+    # of the lap, where the distance to gate i is measured with every other
+    # gate blocked so paths cannot shortcut through them. Off-road tiles take
+    # the value of their nearest road tile, so a lookup is one index.
+    def __init__(self, rows, gates=None):
+        self.width = len(rows[0])
+        self.height = len(rows)
+        tiles = ''.join(rows).encode('ascii')
+        road_mask = build_road_mask(tiles)
+        gates = [list(gate) for gate in (gates if gates is not None else TrackSectors(rows).gates)]
+        if len(gates) < 2 or not all(gates):
+            raise ValueError('A progress field needs at least two non-empty gates')
+
+        gate_tiles = [set(gate) for gate in gates]
+        all_gate_tiles = set().union(*gate_tiles)
+        distances = [
+            geodesic_distance(road_mask, self.width, self.height, gate, all_gate_tiles - gate_tiles[index])
+            for index, gate in enumerate(gates)
+        ]
+
+        # Segment i runs from the previous gate (the finish for i == 0) to gate i.
+        segments = [min(distances[index][tile] for tile in gates[index - 1]) for index in range(len(gates))]
+        if not all(math.isfinite(length) and length > 0 for length in segments):
+            raise ValueError('Gates are not connected by road')
+        self.lap_length = sum(segments)
+
+        nearest = nearest_road_tiles(road_mask, self.width, self.height)
+        self.tables = []
+        covered = 0.0
+        for index, distance in enumerate(distances):
+            covered += segments[index]
+            table = []
+            for tile in range(self.width * self.height):
+                source = nearest[tile]
+                remaining = distance[source] if source != NO_ROAD else math.inf
+                if math.isfinite(remaining):
+                    table.append(min(1.0, max(0.0, (covered - remaining) / self.lap_length)))
+                else:
+                    table.append(0.0)
+            self.tables.append(table)
+
+    @property
+    def gate_count(self) -> int:
+        return len(self.tables)
+
+    def progress(self, x: float, y: float, next_gate: int, tile_size: float) -> float:
+        col = min(self.width - 1, max(0, int(x // tile_size)))
+        row = min(self.height - 1, max(0, int(y // tile_size)))
+        return self.tables[next_gate][row * self.width + col]
+
+
+def wall_clearance(road_mask, width: int, height: int):
+    # Tiles from each road tile to the nearest wall (or the map edge), 8-way.
+    clearance = [0] * (width * height)
+    queue = deque()
+    for index, road in enumerate(road_mask):
+        col, row = index % width, index // width
+        if road and (col in (0, width - 1) or row in (0, height - 1)):
+            clearance[index] = 1
+            queue.append(index)
+        elif not road:
+            queue.append(index)
+    while queue:
+        index = queue.popleft()
+        col, row = index % width, index // width
+        for dx, dy, _ in STEPS:
+            n_col, n_row = col + dx, row + dy
+            if 0 <= n_col < width and 0 <= n_row < height:
+                neighbour = n_row * width + n_col
+                if road_mask[neighbour] and not clearance[neighbour]:
+                    clearance[neighbour] = clearance[index] + 1
+                    queue.append(neighbour)
+    return clearance
+
+
+def spawn_before_finish(road_mask, width: int, height: int, gates, spawn_index: int, spawn_rotation_deg: float) -> bool:
+    # Whether a car leaving the spawn drives towards the finish (it starts on
+    # the run in to the line) or away from it (it starts just past the line).
+    # Cars drive along -(cos, sin) of their rotation.
+    radians = math.radians(spawn_rotation_deg)
+    col, row = spawn_index % width, spawn_index // width
+    ahead_col, ahead_row = col - round(math.cos(radians)), row - round(math.sin(radians))
+    if not (0 <= ahead_col < width and 0 <= ahead_row < height):
+        return True
+    finish_distance = geodesic_distance(road_mask, width, height, gates[-1], set().union(*map(set, gates[:-1])))
+    return finish_distance[ahead_row * width + ahead_col] < finish_distance[spawn_index]
+
+
+def segment_masks(road_mask, width: int, height: int, gates, spawn_index: int, spawn_rotation_deg=None):
+    # Road mask per gate i covering the segment from gate i - 1 (the finish
+    # for i == 0) to gate i, plus every gate tile. Segments are the pieces of
+    # road left once the gates are cut out. With a single checkpoint both
+    # pieces touch both gates, so the spawn and its heading pick which one is
+    # which. Falls back to the whole road when the layout is not a loop.
+    gate_of = {tile: index for index, gate in enumerate(gates) for tile in gate}
+    open_road = bytes(1 if road and index not in gate_of else 0 for index, road in enumerate(road_mask))
+    pieces = []
+    for piece in label_components(open_road, width, height, 1):
+        touching = set()
+        for index in piece:
+            col, row = index % width, index // width
+            for dx, dy, _ in STEPS:
+                n_col, n_row = col + dx, row + dy
+                if 0 <= n_col < width and 0 <= n_row < height and n_row * width + n_col in gate_of:
+                    touching.add(gate_of[n_row * width + n_col])
+        pieces.append((set(piece), touching))
+
+    count = len(gates)
+    spawn_segment = None
+    if count == 2 and spawn_index >= 0 and spawn_rotation_deg is not None:
+        before = spawn_before_finish(road_mask, width, height, gates, spawn_index, spawn_rotation_deg)
+        spawn_segment = count - 1 if before else 0
+
+    masks = []
+    for index in range(count):
+        ends = {(index - 1) % count, index}
+        chosen = [piece for piece, touching in pieces if ends <= touching]
+        if spawn_segment is not None and len(chosen) > 1:
+            chosen = [piece for piece in chosen if (spawn_index in piece) == (index == spawn_segment)]
+        if not chosen or (count == 2 and spawn_segment is None):
+            masks.append(road_mask)
+            continue
+        mask = bytearray(width * height)
+        for tile in gate_of:
+            mask[tile] = 1
+        for piece in chosen:
+            for tile in piece:
+                mask[tile] = 1
+        masks.append(bytes(mask))
+    return masks
+
+
+class FlowField:
+    # Steering targets for server bots. For a car heading for gate i, the
+    # target of a tile is where walking a few steps down gate i's geodesic
+    # distance ends up; a walk that reaches the gate carries on towards the
+    # next one, so targets swing through a gate instead of stopping on it.
+    # Steps next to a wall cost more, so cutting down the distance field
+    # takes corners on the inside without scraping the barrier, which is a
+    # serviceable racing line. targets looks a few tiles ahead for
+    # steering, brake_targets further ahead so a bot sees a corner coming.
+    # Off-road tiles use their nearest road tile.
+    #
+    # Each gate's field only covers its own segment (the road between the
+    # previous gate and it), so a walk carried through gate i cannot turn
+    # back into the segment it came from. A car on another segment (one that
+    # spawned behind the line or got turned round) follows the lap from
+    # there, and tiles on no segment fall back to the unrestricted field.
+    def __init__(self, rows, gates=None, spawn_rotation_deg=None, lookahead: int = 4, brake_lookahead: int = 12):
+        self.width = len(rows[0])
+        self.height = len(rows)
+        tiles = ''.join(rows).encode('ascii')
+        road_mask = build_road_mask(tiles)
+        gates = [list(gate) for gate in (gates if gates is not None else TrackSectors(rows).gates)]
+        if len(gates) < 2 or not all(gates):
+            raise ValueError('A flow field needs at least two non-empty gates')
+
+        gate_tiles = [set(gate) for gate in gates]
+        all_gate_tiles = set().union(*gate_tiles)
+        masks = segment_masks(road_mask, self.width, self.height, gates, tiles.find(b'P'), spawn_rotation_deg)
+        tile_cost = [1.0 + WALL_COST / (clear * clear) if clear else 1.0 for clear in wall_clearance(road_mask, self.width, self.height)]
+        self.segment = [
+            geodesic_distance(masks[index], self.width, self.height, gate, all_gate_tiles - gate_tiles[index], tile_cost)
+            for index, gate in enumerate(gates)
+        ]
+        free = [
+            geodesic_distance(road_mask, self.width, self.height, gate, all_gate_tiles - gate_tiles[index], tile_cost)
+            for index, gate in enumerate(gates)
+        ]
+        self.segment_steps = [self.downhill_steps(road_mask, distance) for distance in self.segment]
+        self.free_steps = [self.downhill_steps(road_mask, distance) for distance in free]
+
+        # The segment each non-gate tile lies on, so a car on the wrong
+        # segment is still sent the way the lap runs.
+        self.segment_of = [-1] * (self.width * self.height)
+        for index, distance in enumerate(self.segment):
+            for tile, dist in enumerate(distance):
+                if self.segment_of[tile] < 0 and tile not in all_gate_tiles and math.isfinite(dist):
+                    self.segment_of[tile] = index
+
+        nearest = nearest_road_tiles(road_mask, self.width, self.height)
+        self.targets = [self.walk_table(nearest, index, lookahead) for index in range(len(gates))]
+        self.brake_targets = [self.walk_table(nearest, index, brake_lookahead) for index in range(len(gates))]
+
+    def walk_table(self, nearest, index: int, lookahead: int):
+        table = []
+        gate_count = len(self.segment)
+        for tile in range(self.width * self.height):
+            current, gate = nearest[tile], index
+            if current == NO_ROAD:
+                table.append(tile)
+                continue
+            on_segment = math.isfinite(self.segment[index][current])
+            if not on_segment and self.segment_of[current] >= 0:
+                # Off this gate's segment: follow the lap round to it.
+                gate, on_segment = self.segment_of[current], True
+            for _ in range(lookahead):
+                if on_segment:
+                    if self.segment[gate][current] == 0.0:
+                        gate = (gate + 1) % gate_count
+                    step = self.segment_steps[gate][current]
+                else:
+                    step = self.free_steps[gate][current]
+                if step == current:
+                    break
+                current = step
+            table.append(current)
+        return table
+
+    def downhill_steps(self, road_mask, distance):
+        # The neighbour with the smallest distance, or the tile itself at a
+        # gate or where the field cannot reach.
+        width, height = self.width, self.height
+        steps = list(range(width * height))
+        for index, dist in enumerate(distance):
+            if not math.isfinite(dist) or dist == 0.0:
+                continue
+            col, row = index % width, index // width
+            best = dist
+            for dx, dy, _ in STEPS:
+                n_col, n_row = col + dx, row + dy
+                if not (0 <= n_col < width and 0 <= n_row < height):
+                    continue
+                neighbour = n_row * width + n_col
+                if dx and dy and not (road_mask[row * width + n_col] and road_mask[n_row * width + col]):
+                    continue
+                if distance[neighbour] < best:
+                    best = distance[neighbour]
+                    steps[index] = neighbour
+        return steps
+
+    def target(self, x: float, y: float, next_gate: int, tile_size: float):
+        # Centre of the target tile in world units.
+        col = min(self.width - 1, max(0, int(x // tile_size)))
+        row = min(self.height - 1, max(0, int(y // tile_size)))
+        tile = self.targets[next_gate][row * self.width + col]
+        return ((tile % self.width) + 0.5) * tile_size, ((tile // self.width) + 0.5) * tile_size
+
+
+@lru_cache(maxsize=32)
+def track_sectors_for(rows: tuple):
+    try:
+        return TrackSectors(rows)
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=32)
+def progress_field_for(rows: tuple):
+    sectors = track_sectors_for(rows)
+    if sectors is None:
+        return None
+    try:
+        return ProgressField(rows, sectors.gates)
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=32)
+def flow_field_for(rows: tuple, spawn_rotation_deg: float):
+    sectors = track_sectors_for(rows)
+    if sectors is None:
+        return None
+    try:
+        return FlowField(rows, sectors.gates, spawn_rotation_deg)
+    except ValueError:
+        return None
+
+
+class WallRays:
+    # Distance from each tile centre to the first wall (or the map edge)
+    # along each of `directions` evenly spaced headings, in tiles and capped
+    # at max_tiles. Direction d points along (cos, sin) of d * 360 / directions
+    # degrees, so a ray reading is one index instead of a march.
+    def __init__(self, rows, directions: int = 16, max_tiles: float = 24.0):
+        self.width = len(rows[0])
+        self.height = len(rows)
+        self.directions = directions
+        road_mask = build_road_mask(''.join(rows).encode('ascii'))
+        self.distances = []
+        headings = [
+            (math.cos(2.0 * math.pi * index / directions), math.sin(2.0 * math.pi * index / directions))
+            for index in range(directions)
+        ]
+        for tile in range(self.width * self.height):
+            col, row = tile % self.width, tile // self.width
+            for dx, dy in headings:
+                self.distances.append(cast_ray(road_mask, self.width, self.height, col, row, dx, dy, max_tiles))
+
+
+def cast_ray(road_mask, width: int, height: int, col: int, row: int, dx: float, dy: float, max_tiles: float) -> float:
+    # Grid traversal from the centre of (col, row) until the ray enters a
+    # tile that is not road.
+    if not road_mask[row * width + col]:
+        return 0.0
+    step_col = 1 if dx > 0 else -1
+    step_row = 1 if dy > 0 else -1
+    delta_x = abs(1.0 / dx) if abs(dx) > 1e-9 else math.inf
+    delta_y = abs(1.0 / dy) if abs(dy) > 1e-9 else math.inf
+    next_x = 0.5 * delta_x
+    next_y = 0.5 * delta_y
+    while True:
+        if next_x < next_y:
+            travelled = next_x
+            next_x += delta_x
+            col += step_col
+        else:
+            travelled = next_y
+            next_y += delta_y
+            row += step_row
+        if travelled >= max_tiles:
+            return max_tiles
+        if not (0 <= col < width and 0 <= row < height) or not road_mask[row * width + col]:
+            return travelled
+
+
+@lru_cache(maxsize=32)
+def wall_rays_for(rows: tuple, directions: int = 16):
+    return WallRays(rows, directions)
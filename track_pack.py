@@ -0,0 +1,286 @@
+# Binary track packs (.ctp) shared by the game, the track editor and the web
+# server. Stdlib only, like track_data.py.
+#
+#     python track_pack.py show tracks/brands_hatch.ctp
+#     python track_pack.py build tracks/my_track.ctp my_track.txt --name "My Track" --rotation 90
+#
+# Layout, all little-endian:
+#   header   magic 'CDTP', version, header size, width, height, spawn col/row
+#            (-1 when there is no P tile), spawn rotation, CRC32 of the tile
+#            plane, layer count, name length
+#   name     UTF-8
+#   table    per layer: tag, offset, length, CRC32
+#   layers   'TILE' run-length tile plane (count, tile byte pairs), always present
+#            'ROAD' one byte per tile, 1 where a car can drive
+#            'NEAR' uint32 per tile, index of a nearby road tile (0xFFFFFFFF if none);
+#                   see nearest_road_tiles
+
+import argparse
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import zlib
+from collections import deque
+from functools import lru_cache
+from pathlib import Path
+
+
+PACK_MAGIC = b'CDTP'
+PACK_VERSION = 1
+PACK_SUFFIX = '.ctp'
+PACK_DIR = Path(__file__).parent / 'tracks'
+
+HEADER = struct.Struct('<4sHHHHhhfIHH')
+LAYER_ENTRY = struct.Struct('<4sIII')
+LAYER_ALIGN = 4
+MAX_RUN = 255
+
+ROAD_TILES = frozenset(b'.PFC^vB')
+NO_ROAD = 0xFFFFFFFF
+NEIGHBOURS = ((-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1))
+
+
+class TrackPackError(ValueError):
+    pass
+
+
+def encode_rle(tiles: bytes) -> bytes:
+    out = bytearray()
+    index = 0
+    size = len(tiles)
+    while index < size:
+        tile = tiles[index]
+        end = index + 1
+        limit = min(size, index + MAX_RUN)
+        while end < limit and tiles[end] == tile:
+            end += 1
+        out += bytes((end - index, tile))
+        index = end
+    return bytes(out)
+
+
+def decode_rle(data) -> bytes:
+    if len(data) % 2:
+        raise TrackPackError('Tile plane has an odd length')
+    return b''.join(bytes((tile,)) * count for count, tile in zip(data[0::2], data[1::2]))
+
+
+def build_road_mask(tiles: bytes) -> bytes:
+    return bytes(1 if tile in ROAD_TILES else 0 for tile in tiles)
+
+
+def nearest_road_tiles(road_mask: bytes, width: int, height: int) -> list:
+    # Multi-source BFS from every road tile, keeping for each tile the seed
+    # with the smallest squared distance between tile centres. Seeds only
+    # spread through neighbours that improved, so a few tiles end up with a
+    # slightly farther road tile than the nearest; callers that need the
+    # exact one treat this as an upper bound (see the server's
+    # find_nearest_road_tile).
+    nearest = [NO_ROAD] * (width * height)
+    best = [float('inf')] * (width * height)
+    queue = deque()
+    for index, road in enumerate(road_mask):
+        if road:
+            nearest[index] = index
+            best[index] = 0
+            queue.append(index)
+
+    while queue:
+        index = queue.popleft()
+        seed = nearest[index]
+        seed_col, seed_row = seed % width, seed // width
+        col, row = index % width, index // width
+        for dx, dy in NEIGHBOURS:
+            n_col, n_row = col + dx, row + dy
+            if not (0 <= n_col < width and 0 <= n_row < height):
+                continue
+            neighbour = n_row * width + n_col
+            dist = (n_col - seed_col) ** 2 + (n_row - seed_row) ** 2
+            if dist < best[neighbour]:
+                best[neighbour] = dist
+                nearest[neighbour] = seed
+                queue.append(neighbour)
+
+    return nearest
+
+
+def build_nearest_road(road_mask: bytes, width: int, height: int) -> bytes:
+    nearest = nearest_road_tiles(road_mask, width, height)
+    return struct.pack(f'<{len(nearest)}I', *nearest)
+
+
+def encode_pack(rows, name: str = '', spawn_rotation_deg: float = 0.0, layers: bool = True) -> bytes:
+    rows = [str(row) for row in rows]
+    if not rows or not rows[0]:
+        raise TrackPackError('Track is empty')
+    width, height = len(rows[0]), len(rows)
+    if any(len(row) != width for row in rows):
+        raise TrackPackError('All track rows must have the same width')
+    try:
+        tiles = ''.join(rows).encode('ascii')
+    except UnicodeEncodeError:
+        raise TrackPackError('Track tiles must be ASCII') from None
+
+    spawn_index = tiles.find(b'P')
+    spawn_col, spawn_row = (spawn_index % width, spawn_index // width) if spawn_index >= 0 else (-1, -1)
+
+    payloads = [(b'TILE', encode_rle(tiles))]
+    if layers:
+        road_mask = build_road_mask(tiles)
+        payloads.append((b'ROAD', road_mask))
+        payloads.append((b'NEAR', build_nearest_road(road_mask, width, height)))
+
+    name_bytes = name.encode('utf-8')
+    offset = HEADER.size + len(name_bytes) + LAYER_ENTRY.size * len(payloads)
+    table = bytearray()
+    body = bytearray()
+    for tag, payload in payloads:
+        padding = -(offset + len(body)) % LAYER_ALIGN
+        body += b'\0' * padding
+        table += LAYER_ENTRY.pack(tag, offset + len(body), len(payload), zlib.crc32(payload))
+        body += payload
+
+    header = HEADER.pack(
+        PACK_MAGIC, PACK_VERSION, HEADER.size, width, height, spawn_col, spawn_row,
+        float(spawn_rotation_deg), zlib.crc32(tiles), len(payloads), len(name_bytes),
+    )
+    return header + name_bytes + bytes(table) + bytes(body)
+
+
+class TrackPack:
+    def __init__(self, buffer, source=None):
+        # buffer may be an mmap; layers stay zero-copy views into it.
+        self.source = source
+        self.buffer = buffer
+        view = memoryview(buffer)
+        if len(view) < HEADER.size:
+            raise TrackPackError('Track pack is truncated')
+        (magic, version, header_size, self.width, self.height, spawn_col, spawn_row,
+         self.spawn_rotation_deg, tiles_crc, layer_count, name_length) = HEADER.unpack_from(view)
+        if magic != PACK_MAGIC:
+            raise TrackPackError('Not a track pack')
+        if version > PACK_VERSION:
+            raise TrackPackError(f'Unsupported track pack version {version}')
+
+        offset = header_size
+        self.name = bytes(view[offset:offset + name_length]).decode('utf-8')
+        offset += name_length
+        self.spawn = (spawn_col, spawn_row) if spawn_col >= 0 else None
+
+        self.layers = {}
+        for _ in range(layer_count):
+            tag, start, length, crc = LAYER_ENTRY.unpack_from(view, offset)
+            offset += LAYER_ENTRY.size
+            payload = view[start:start + length]
+            if len(payload) != length or zlib.crc32(payload) != crc:
+                raise TrackPackError(f'Layer {tag.decode("ascii", "replace")} is corrupt')
+            self.layers[tag.decode('ascii')] = payload
+
+        if 'TILE' not in self.layers:
+            raise TrackPackError('Track pack has no tile plane')
+        self.tiles = decode_rle(self.layers['TILE'])
+        if len(self.tiles) != self.width * self.height or zlib.crc32(self.tiles) != tiles_crc:
+            raise TrackPackError('Tile plane checksum mismatch')
+        self.rows = [
+            self.tiles[row * self.width:(row + 1) * self.width].decode('ascii')
+            for row in range(self.height)
+        ]
+
+    @property
+    def road_mask(self):
+        return self.layers.get('ROAD')
+
+    @property
+    def nearest_road(self):
+        layer = self.layers.get('NEAR')
+        if layer is None or sys.byteorder != 'little':
+            return None
+        return layer.cast('I')
+
+
+def decode_pack(data: bytes) -> TrackPack:
+    return TrackPack(data)
+
+
+def read_pack(path) -> TrackPack:
+    with open(path, 'rb') as file:
+        try:
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise TrackPackError(f'{path} is empty') from None
+    return TrackPack(buffer, source=Path(path))
+
+
+def pack_path(track_id: str) -> Path:
+    return PACK_DIR / f'{track_id}{PACK_SUFFIX}'
+
+
+@lru_cache(maxsize=None)
+def load_pack(track_id: str) -> TrackPack:
+    return read_pack(pack_path(track_id))
+
+
+def write_pack(path, rows, name: str = '', spawn_rotation_deg: float = 0.0):
+    data = encode_pack(rows, name, spawn_rotation_deg)
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=f'.{path.name}.', suffix='.tmp', dir=path.parent)
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    return len(data)
+
+
+def command_show(args):
+    pack = read_pack(args.pack)
+    spawn = f'{pack.spawn[0]},{pack.spawn[1]}' if pack.spawn else 'none'
+    print(f'{pack.name or "(unnamed)"}: {pack.width}x{pack.height}, spawn {spawn}, rotation {pack.spawn_rotation_deg:g}')
+    print('layers: ' + ', '.join(f'{tag} {len(layer)}B' for tag, layer in pack.layers.items()))
+    if not args.header_only:
+        print('\n'.join(pack.rows))
+
+
+def command_build(args):
+    with open(args.rows, 'r', encoding='utf-8') as file:
+        rows = [line.rstrip('\n\r') for line in file if line.strip()]
+    size = write_pack(args.pack, rows, args.name or Path(args.pack).stem, args.rotation)
+    print(f'Wrote {args.pack} ({size} bytes)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect and build ChunkyDrift track packs.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    show_parser = subparsers.add_parser('show', help='print a pack header and its rows')
+    show_parser.add_argument('pack')
+    show_parser.add_argument('--header-only', action='store_true')
+    show_parser.set_defaults(handler=command_show)
+
+    build_parser = subparsers.add_parser('build', help='build a pack from a text map (one row per line)')
+    build_parser.add_argument('pack')
+    build_parser.add_argument('rows')
+    build_parser.add_argument('--name', default='')
+    build_parser.add_argument('--rotation', type=float, default=0.0)
+    build_parser.set_defaults(handler=command_build)
+
+    args = parser.parse_args()
+    try:
+        args.handler(args)
+    except (OSError, TrackPackError) as exc:
+        sys.exit(f'Error: {exc}')
+
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,13 @@ const ctx = canvas.getContext('2d');
 const roomInput = document.getElementById('roomInput');
 const nameInput = document.getElementById('nameInput');
 const connectBtn = document.getElementById('connectBtn');
+const spectateBtn = document.getElementById('spectateBtn');
+const replayBtn = document.getElementById('replayBtn');
+const replayControls = document.getElementById('replayControls');
+const replaySpeedSelect = document.getElementById('replaySpeedSelect');
+const replayPauseBtn = document.getElementById('replayPauseBtn');
+const replaySeek = document.getElementById('replaySeek');
+const replayTimeText = document.getElementById('replayTimeText');
 const fullscreenBtn = document.getElementById('fullscreenBtn');
 const readyBtn = document.getElementById('readyBtn');
 const startRaceBtn = document.getElementById('startRaceBtn');
@@ -31,6 +38,8 @@ const mapEditorCanvas = document.getElementById('mapEditorCanvas');
 const mapEditorCtx = mapEditorCanvas.getContext('2d');
 const tileToolButtons = Array.from(document.querySelectorAll('.tile-tool'));
 const lapsSelect = document.getElementById('lapsSelect');
+const botsSelect = document.getElementById('botsSelect');
+const ghostSelect = document.getElementById('ghostSelect');
 const statusText = document.getElementById('statusText');
 const phaseText = document.getElementById('phaseText');
 const roomLeaderboard = document.getElementById('roomLeaderboard');
@@ -39,6 +48,8 @@ const roomLeaderboardMoreBtn = document.getElementById('roomLeaderboardMoreBtn')
 const globalLeaderboardMoreBtn = document.getElementById('globalLeaderboardMoreBtn');
 const gameArea = document.getElementById('gameArea');
 const hudLap = document.getElementById('hudLap');
+const hudPosition = document.getElementById('hudPosition');
+const hudSplit = document.getElementById('hudSplit');
 const hudLapTime = document.getElementById('hudLapTime');
 const hudRaceTime = document.getElementById('hudRaceTime');
 const hudBestLap = document.getElementById('hudBestLap');
@@ -64,8 +75,14 @@ const trackPreviewName = document.getElementById('trackPreviewName');
 
 let socket = null;
 let connected = false;
+let spectating = false;
+let replaying = false;
+let replayPaused = false;
+let replaySeeking = false;
+let lastReplayId = null;
 let playerId = null;
 let players = [];
+const playersById = new Map();
 let mapData = null;
 let availableTracks = [];
 let carModels = [];
@@ -99,10 +116,13 @@ const SELF_RECONCILE_BLEND = 0.35;
 let serverClockOffsetMs = 0;
 let rttMsSmoothed = 0;
 let interpolationBackTimeMs = 90;
+let snapshotIntervalMs = 1000 / 60;
 const playerNetState = {};
 let lastInputSignature = '';
 let lastInputSentAt = 0;
 let trackedLapCount = 0;
+let trackGhost = null;
+let raceClockSyncedAt = 0;
 let trackedLapStartRaceMs = 0;
 let keyboardHandbrake = false;
 let hideHudRequested = false;
@@ -187,6 +207,7 @@ function applySiteContent() {
   }
 
   if (connectBtn && content.buttons?.connect) connectBtn.textContent = content.buttons.connect;
+  if (spectateBtn && content.buttons?.spectate) spectateBtn.textContent = content.buttons.spectate;
   if (fullscreenBtn && content.buttons?.fullscreen) fullscreenBtn.textContent = content.buttons.fullscreen;
   if (applyTrackBtn && content.buttons?.applyTrack) applyTrackBtn.textContent = content.buttons.applyTrack;
   if (openDesignerBtn && content.buttons?.openDesigner) openDesignerBtn.textContent = content.buttons.openDesigner;
@@ -213,9 +234,15 @@ function setStatus(text, isError = false) {
   statusText.style.color = isError ? '#fca5a5' : '#86efac';
 }
 
-function wsUrl(room, name) {
+function wsUrl(room, name, spectate = false, replayId = null) {
   const protocol = window.location.protocol === 'https:' ? 'wss' : 'ws';
   const host = window.location.host;
+  if (replayId) {
+    return `${protocol}://${host}/ws/replay/${encodeURIComponent(replayId)}`;
+  }
+  if (spectate) {
+    return `${protocol}://${host}/ws/${encodeURIComponent(room)}/spectate`;
+  }
   return `${protocol}://${host}/ws/${encodeURIComponent(room)}/${encodeURIComponent(name)}`;
 }
 
@@ -342,7 +369,7 @@ function initMobileControls() {
 }
 
 function sendInputUpdate(force = false) {
-  if (!socket || socket.readyState !== WebSocket.OPEN) return;
+  if (!socket || socket.readyState !== WebSocket.OPEN || spectating) return;
 
   const now = performance.now();
   const signature = inputSignature();
@@ -379,11 +406,26 @@ function updateLatencyModel(rttMs) {
   } else {
     rttMsSmoothed += (rttMs - rttMsSmoothed) * 0.2;
   }
+  updateInterpolationWindow();
+}
 
+function updateSnapshotRate(snapshotHz) {
+  const hz = Number(snapshotHz);
+  if (!Number.isFinite(hz) || hz <= 0) return;
+  const intervalMs = 1000 / hz;
+  if (intervalMs === snapshotIntervalMs) return;
+  snapshotIntervalMs = intervalMs;
+  updateInterpolationWindow();
+}
+
+function updateInterpolationWindow() {
+  // The server lowers the snapshot rate for slow links, so always keep at
+  // least two snapshot intervals buffered behind the newest sample.
   const target = INTERPOLATION_BASELINE_MS + rttMsSmoothed * 0.5;
+  const minimum = Math.max(INTERPOLATION_BACK_TIME_MIN_MS, snapshotIntervalMs * 2);
   interpolationBackTimeMs = Math.max(
-    INTERPOLATION_BACK_TIME_MIN_MS,
-    Math.min(INTERPOLATION_BACK_TIME_MAX_MS, target)
+    minimum,
+    Math.min(Math.max(INTERPOLATION_BACK_TIME_MAX_MS, minimum), target)
   );
 }
 
@@ -441,6 +483,15 @@ async function requestRaceFullscreen() {
   }
 }
 
+function formatStanding(me, phase) {
+  const standings = (phase === 'racing' || phase === 'finished') && Array.isArray(roomState.standings) ? roomState.standings : [];
+  const index = me ? standings.findIndex((entry) => entry[0] === me.id) : -1;
+  if (index < 0) return '-';
+  const position = `P${index + 1}/${standings.length}`;
+  if (index === 0) return position;
+  return `${position} +${(Number(standings[index][1] || 0) / 1000).toFixed(3)}s`;
+}
+
 function refreshRaceHud() {
   const me = findMe();
   const phase = roomState.phase || 'lobby';
@@ -459,6 +510,9 @@ function refreshRaceHud() {
   const lapTimeMs = Math.max(0, raceElapsedMs - trackedLapStartRaceMs);
 
   hudLap.textContent = me ? `${lapCurrent}/${lapsToWin || 0}` : '-';
+  hudPosition.textContent = formatStanding(me, phase);
+  const splits = me && Array.isArray(me.splits) ? me.splits : [];
+  hudSplit.textContent = splits.length ? `S${splits.length} ${formatMs(splits[splits.length - 1])}` : '--:--.---';
   hudLapTime.textContent = formatMs(lapTimeMs);
   hudRaceTime.textContent = formatMs(raceElapsedMs);
   hudBestLap.textContent = me && me.bestLapMs ? formatMs(me.bestLapMs) : '--:--.---';
@@ -493,7 +547,7 @@ function refreshRoomPlayers() {
   for (const player of ordered) {
     const li = document.createElement('li');
     const isMe = player.id === playerId;
-    const readyText = player.ready ? 'READY' : 'UNREADY';
+    const readyText = player.bot ? 'BOT' : player.ready ? 'READY' : 'UNREADY';
     li.textContent = `${isMe ? 'You' : player.name} — ${readyText}`;
     roomPlayersList.appendChild(li);
   }
@@ -531,59 +585,85 @@ function drawTrackPreview() {
   }
 }
 
-function ingestPlayerState(serverPlayers, serverTimeSeconds) {
+function recordNetSample(id, x, y, rotationDeg, vx, vy, serverTimeMs) {
+  const state = playerNetState[id];
+
+  if (!state) {
+    playerNetState[id] = {
+      prevX: x,
+      prevY: y,
+      prevRot: rotationDeg,
+      prevServerMs: serverTimeMs,
+      targetX: x,
+      targetY: y,
+      targetRot: rotationDeg,
+      targetServerMs: serverTimeMs,
+      velocityX: 0,
+      velocityY: 0,
+      rotationVelocity: 0,
+    };
+    return;
+  }
+
+  const dtMs = Math.max(1, serverTimeMs - state.targetServerMs);
+  state.prevX = state.targetX;
+  state.prevY = state.targetY;
+  state.prevRot = state.targetRot;
+  state.prevServerMs = state.targetServerMs;
+
+  state.targetX = x;
+  state.targetY = y;
+  state.targetRot = rotationDeg;
+  state.targetServerMs = serverTimeMs;
+
+  state.velocityX = Number.isFinite(vx) ? vx : (state.targetX - state.prevX) / (dtMs / 1000);
+  state.velocityY = Number.isFinite(vy) ? vy : (state.targetY - state.prevY) / (dtMs / 1000);
+  state.rotationVelocity = normalizeAngleDeg(state.targetRot - state.prevRot) / (dtMs / 1000);
+}
+
+function forgetPlayer(id) {
+  playersById.delete(id);
+  delete playerNetState[id];
+  delete tireTrackState[id];
+  delete lastParticleSpawnByPlayer[id];
+  delete lastTireMarkSpawnByPlayer[id];
+}
+
+function ingestPlayerState(serverPlayers, serverTimeSeconds, roster = null, summary = null) {
   const serverTimeMs = typeof serverTimeSeconds === 'number'
     ? serverTimeSeconds * 1000
     : performance.now() + serverClockOffsetMs;
 
-  players = serverPlayers || [];
-  const activeIds = new Set();
-
-  for (const player of players) {
-    activeIds.add(player.id);
-    const state = playerNetState[player.id];
-
-    if (!state) {
-      playerNetState[player.id] = {
-        prevX: player.x,
-        prevY: player.y,
-        prevRot: player.rotationDeg,
-        prevServerMs: serverTimeMs,
-        targetX: player.x,
-        targetY: player.y,
-        targetRot: player.rotationDeg,
-        targetServerMs: serverTimeMs,
-        velocityX: 0,
-        velocityY: 0,
-        rotationVelocity: 0,
-      };
-      continue;
-    }
-
-    const dtMs = Math.max(1, serverTimeMs - state.targetServerMs);
-    state.prevX = state.targetX;
-    state.prevY = state.targetY;
-    state.prevRot = state.targetRot;
-    state.prevServerMs = state.targetServerMs;
-
-    state.targetX = player.x;
-    state.targetY = player.y;
-    state.targetRot = player.rotationDeg;
-    state.targetServerMs = serverTimeMs;
+  // Snapshots are filtered per recipient: distant cars arrive at a reduced rate
+  // and may only appear in the low-rate summary, so keep the last full state.
+  for (const player of serverPlayers || []) {
+    playersById.set(player.id, player);
+    recordNetSample(player.id, player.x, player.y, player.rotationDeg, player.vx, player.vy, serverTimeMs);
+  }
 
-    state.velocityX = Number.isFinite(player.vx) ? player.vx : (state.targetX - state.prevX) / (dtMs / 1000);
-    state.velocityY = Number.isFinite(player.vy) ? player.vy : (state.targetY - state.prevY) / (dtMs / 1000);
-    state.rotationVelocity = normalizeAngleDeg(state.targetRot - state.prevRot) / (dtMs / 1000);
+  for (const [id, x, y] of summary || []) {
+    const known = playersById.get(id);
+    if (!known) continue;
+    known.x = x;
+    known.y = y;
+    recordNetSample(id, x, y, known.rotationDeg, undefined, undefined, serverTimeMs);
   }
 
-  for (const id of Object.keys(playerNetState)) {
-    if (!activeIds.has(id)) {
-      delete playerNetState[id];
-      delete tireTrackState[id];
-      delete lastParticleSpawnByPlayer[id];
-      delete lastTireMarkSpawnByPlayer[id];
+  if (Array.isArray(roster)) {
+    const activeIds = new Set(roster);
+    for (const id of [...playersById.keys()]) {
+      if (!activeIds.has(id)) {
+        forgetPlayer(id);
+      }
+    }
+    for (const id of Object.keys(playerNetState)) {
+      if (!activeIds.has(id)) {
+        forgetPlayer(id);
+      }
     }
   }
+
+  players = [...playersById.values()];
 }
 
 function getRenderedPlayers(renderTimeMs) {
@@ -935,10 +1015,80 @@ function initMapEditor() {
 }
 
 function send(type, extra = {}) {
-  if (!socket || socket.readyState !== WebSocket.OPEN) return;
+  if (!socket || socket.readyState !== WebSocket.OPEN || spectating) return;
   socket.send(JSON.stringify({ type, ...extra }));
 }
 
+function ghostEnabled() {
+  return ghostSelect?.value === 'on';
+}
+
+function decodeGhost(ghost) {
+  // Zigzag varint deltas of quantized x, y and rotation; see
+  // web_multiplayer/ghosts.py. Decoded once, then only interpolated.
+  const bytes = Uint8Array.from(atob(ghost.data || ''), (char) => char.charCodeAt(0));
+  const samples = new Float32Array(Math.max(0, Number(ghost.count || 0)) * 3);
+  const scales = [ghost.positionScale || 4, ghost.positionScale || 4, ghost.rotationScale || 2];
+  const totals = [0, 0, 0];
+  let index = 0;
+  let value = 0;
+  let shift = 0;
+  for (const byte of bytes) {
+    value += (byte & 0x7f) * 2 ** shift;
+    if (byte & 0x80) {
+      shift += 7;
+      continue;
+    }
+    if (index >= samples.length) break;
+    const channel = index % 3;
+    totals[channel] += value % 2 === 1 ? -(value + 1) / 2 : value / 2;
+    samples[index] = totals[channel] / scales[channel];
+    index += 1;
+    value = 0;
+    shift = 0;
+  }
+  return {
+    name: ghost.name || 'Record',
+    lapMs: Number(ghost.lapMs || 0),
+    sampleMs: Number(ghost.sampleMs || 100),
+    offsetMs: Number(ghost.offsetMs || 0),
+    count: Math.floor(index / 3),
+    samples,
+  };
+}
+
+function ghostPose(ghost, lapMs) {
+  const position = (lapMs - ghost.offsetMs) / ghost.sampleMs;
+  if (position < 0 || position > ghost.count - 1) return null;
+  const index = Math.floor(position);
+  const next = Math.min(ghost.count - 1, index + 1);
+  const t = position - index;
+  const a = index * 3;
+  const b = next * 3;
+  const s = ghost.samples;
+  return {
+    x: s[a] + (s[b] - s[a]) * t,
+    y: s[a + 1] + (s[b + 1] - s[a + 1]) * t,
+    rotationDeg: s[a + 2] + (s[b + 2] - s[a + 2]) * t,
+  };
+}
+
+function sendReplayControl(extra) {
+  if (!socket || socket.readyState !== WebSocket.OPEN || !replaying) return;
+  socket.send(JSON.stringify({ type: 'replay_control', ...extra }));
+}
+
+function refreshReplayControls(replay = null) {
+  replayControls?.classList.toggle('hidden', !replaying);
+  if (replayBtn) replayBtn.disabled = !lastReplayId;
+  if (!replay || !replaySeek) return;
+  replaySeek.max = String(replay.durationMs || 0);
+  if (!replaySeeking) replaySeek.value = String(replay.positionMs || 0);
+  replayTimeText.textContent = `${formatMs(replay.positionMs || 0)} / ${formatMs(replay.durationMs || 0)}`;
+  replayPaused = Boolean(replay.paused);
+  replayPauseBtn.textContent = replayPaused ? 'Play' : 'Pause';
+}
+
 function sendGarage(readyOverride = null) {
   const me = findMe();
   const ready = readyOverride !== null ? readyOverride : Boolean(me?.ready);
@@ -949,7 +1099,7 @@ function sendGarage(readyOverride = null) {
   });
 }
 
-function connect() {
+function connect(spectate = false, replayId = null) {
   if (socket) {
     socket.close();
     socket = null;
@@ -958,7 +1108,11 @@ function connect() {
   const room = roomInput.value.trim() || 'brands-public';
   const name = nameInput.value.trim() || 'Player';
 
-  socket = new WebSocket(wsUrl(room, name));
+  // Replays arrive as spectator frames from a re-simulated race.
+  spectating = spectate || Boolean(replayId);
+  replaying = Boolean(replayId);
+  refreshReplayControls();
+  socket = new WebSocket(wsUrl(room, name, spectate, replayId));
   setStatus(`Connecting to room '${room}'...`);
 
   socket.onopen = () => {
@@ -967,13 +1121,20 @@ function connect() {
     lastInputSentAt = 0;
     trackedLapCount = 0;
     trackedLapStartRaceMs = 0;
-    setStatus(`Connected to '${room}'`);
+    setStatus(replayId ? `Replay ${replayId}` : spectate ? `Watching '${room}'` : `Connected to '${room}'`);
+    if (replayId) sendReplayControl({ speed: Number(replaySpeedSelect?.value || 1) });
   };
 
-  socket.onclose = () => {
+  socket.onclose = (event) => {
     connected = false;
     playerId = null;
+    if (event.target === socket) {
+      // Not when this is the previous socket closing under a new connection.
+      replaying = false;
+      refreshReplayControls();
+    }
     players = [];
+    playersById.clear();
     Object.keys(playerNetState).forEach((id) => delete playerNetState[id]);
     trackedLapCount = 0;
     trackedLapStartRaceMs = 0;
@@ -1003,7 +1164,15 @@ function connect() {
       populateTracks(message.map?.id || null);
       carModels = message.cars || [];
       populateCars();
-      sendGarage(false);
+      if (!message.spectator) {
+        sendGarage(false);
+        if (ghostEnabled()) send('ghost', { enabled: true });
+      }
+    }
+
+    if (message.type === 'tracks') {
+      availableTracks = message.tracks || availableTracks;
+      populateTracks(mapData?.id || null);
     }
 
     if (message.type === 'map') {
@@ -1023,6 +1192,10 @@ function connect() {
       }
     }
 
+    if (message.type === 'ghost') {
+      trackGhost = message.ghost ? decodeGhost(message.ghost) : null;
+    }
+
     if (message.type === 'error') {
       setStatus(message.message || 'Server error', true);
     }
@@ -1030,7 +1203,11 @@ function connect() {
     if (message.type === 'state') {
       const previousPhase = roomState.phase || 'lobby';
       updateServerClockOffset(message.serverTime);
-      ingestPlayerState(message.players || [], message.serverTime);
+      updateSnapshotRate(message.snapshotHz);
+      ingestPlayerState(message.players || [], message.serverTime, message.roster, message.summary);
+      if (message.room?.replayId) lastReplayId = message.room.replayId;
+      refreshReplayControls(message.replay);
+      raceClockSyncedAt = performance.now();
       roomState = {
         ...roomState,
         ...(message.room || {}),
@@ -1272,7 +1449,22 @@ if (globalLeaderboardMoreBtn) {
   });
 }
 
-connectBtn.addEventListener('click', connect);
+connectBtn.addEventListener('click', () => connect(false));
+if (spectateBtn) {
+  spectateBtn.addEventListener('click', () => connect(true));
+}
+replayBtn?.addEventListener('click', () => {
+  if (lastReplayId) connect(true, lastReplayId);
+});
+replaySpeedSelect?.addEventListener('change', () => sendReplayControl({ speed: Number(replaySpeedSelect.value || 1) }));
+replayPauseBtn?.addEventListener('click', () => sendReplayControl({ paused: !replayPaused }));
+replaySeek?.addEventListener('input', () => {
+  replaySeeking = true;
+});
+replaySeek?.addEventListener('change', () => {
+  replaySeeking = false;
+  sendReplayControl({ seekMs: Number(replaySeek.value || 0) });
+});
 readyBtn.addEventListener('click', () => {
   const me = findMe();
   sendGarage(!(me?.ready || false));
@@ -1300,6 +1492,8 @@ openDesignerBtn.addEventListener('click', () => {
 });
 closeDesignerBtn.addEventListener('click', () => setDesignerOpen(false));
 lapsSelect.addEventListener('change', () => sendGarage());
+botsSelect?.addEventListener('change', () => send('set_bots', { count: Number(botsSelect.value || 0) }));
+ghostSelect?.addEventListener('change', () => send('ghost', { enabled: ghostEnabled() }));
 fullscreenBtn.addEventListener('click', () => toggleFullscreen());
 document.addEventListener('fullscreenchange', handleFullscreenChange);
 
@@ -1349,7 +1543,7 @@ setInterval(() => {
 
 setInterval(() => {
   if (!socket || socket.readyState !== WebSocket.OPEN) return;
-  send('ping', { clientTime: performance.now() });
+  send('ping', { clientTime: performance.now(), rttMs: rttMsSmoothed });
 }, 1000);
 
 function readTrigger(axisValue) {
@@ -1642,6 +1836,33 @@ function drawPlayer(p) {
   ctx.fillText(label, p.x - 22, p.y - 14);
 }
 
+function drawTrackGhost() {
+  // Runs entirely on the client from the one ghost message: the lap clock
+  // is the HUD's, pushed back by the same delay as the interpolated cars.
+  const me = findMe();
+  if (!trackGhost || !ghostEnabled() || roomState.phase !== 'racing' || !me || me.finished) return;
+  const raceMs = Number(roomState.raceElapsedMs || 0) + (performance.now() - raceClockSyncedAt);
+  const pose = ghostPose(trackGhost, raceMs - trackedLapStartRaceMs - interpolationBackTimeMs);
+  if (!pose) return;
+
+  ctx.save();
+  ctx.globalAlpha = 0.35;
+  ctx.translate(pose.x, pose.y);
+  ctx.rotate((Math.PI / 180) * pose.rotationDeg + Math.PI);
+  ctx.fillStyle = '#e2e8f0';
+  ctx.beginPath();
+  ctx.roundRect(-17, -7, 34, 14, 3);
+  ctx.fill();
+  ctx.restore();
+
+  ctx.save();
+  ctx.globalAlpha = 0.6;
+  ctx.fillStyle = '#e2e8f0';
+  ctx.font = '11px Arial';
+  ctx.fillText(`${trackGhost.name} ${formatMs(trackGhost.lapMs)}`, pose.x - 22, pose.y - 14);
+  ctx.restore();
+}
+
 function drawRaceResultsPopup() {
   if ((roomState.phase || 'lobby') !== 'finished') return;
 
@@ -1703,6 +1924,7 @@ function render(ts = 0) {
   drawMap();
   updateAndDrawTireMarks(dt);
   updateAndDrawParticles(dt);
+  drawTrackGhost();
   const renderedPlayers = getRenderedPlayers(ts);
   for (const p of renderedPlayers) {
     drawPlayer(p);
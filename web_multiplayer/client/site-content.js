@@ -16,6 +16,7 @@ export const SITE_CONTENT = {
   },
   buttons: {
     connect: 'Connect',
+    spectate: 'Watch',
     fullscreen: 'Fullscreen',
     applyTrack: 'Use Track',
     openDesigner: 'Map Designer',
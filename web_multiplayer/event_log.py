@@ -0,0 +1,263 @@
+# Append-only race event log. The server emits race starts, laps,
+# finishes, respawns, disconnects, DNFs and race ends as one JSON object a
+# line; a background thread batches them into events/events.jsonl and
+# rotates the file by size, keeping the newest EVENT_LOG_KEEP files.
+#
+#     python -m web_multiplayer.event_log stats [--track ID] [--days N] [--bots] [--json]
+#
+# Every line has 't' (unix seconds) and 'e' (event type); race events also
+# carry 'room', 'race' and 'track', and per-car ones 'player', 'name',
+# 'car', 'carName' and 'bot'. The stats command streams the files line by
+# line, so its memory use does not grow with the log.
+
+import argparse
+import json
+import logging
+import sys
+import threading
+import time
+from pathlib import Path
+
+
+logger = logging.getLogger('web_multiplayer.event_log')
+
+EVENT_LOG_DIR = Path(__file__).parent / 'events'
+EVENT_LOG_NAME = 'events.jsonl'
+EVENT_LOG_MAX_BYTES = 16 * 1024 * 1024
+EVENT_LOG_KEEP = 30
+EVENT_LOG_FLUSH_SECONDS = 1.0
+EVENT_LOG_BATCH = 512  # wake the writer early once this many events are waiting
+EVENT_LOG_MAX_PENDING = 100_000  # beyond this (a stalled disk) the oldest are dropped
+JSON_SEPARATORS = (',', ':')
+
+
+class EventLog:
+    # emit() only appends to a list under a lock, so it is safe to call from
+    # the tick; encoding and file I/O happen on the writer thread, which is
+    # started by the first event.
+    def __init__(self, directory: Path = EVENT_LOG_DIR, max_bytes: int = EVENT_LOG_MAX_BYTES, keep: int = EVENT_LOG_KEEP):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.keep = keep
+        self.pending = []
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+        self.closing = False
+        self.file = None
+        self.dropped = 0
+        self.written = 0
+
+    def emit(self, event_type: str, **fields):
+        event = {'t': round(time.time(), 3), 'e': event_type}
+        event.update(fields)
+        with self.lock:
+            self.pending.append(event)
+            waiting = len(self.pending)
+            if waiting > EVENT_LOG_MAX_PENDING:
+                del self.pending[:waiting - EVENT_LOG_MAX_PENDING]
+                self.dropped += waiting - EVENT_LOG_MAX_PENDING
+            if self.thread is None and not self.closing:
+                self.thread = threading.Thread(target=self.run, name='event-log', daemon=True)
+                self.thread.start()
+        if waiting >= EVENT_LOG_BATCH:
+            self.wake.set()
+
+    def run(self):
+        while not self.closing:
+            self.wake.wait(EVENT_LOG_FLUSH_SECONDS)
+            self.wake.clear()
+            self.flush()
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def flush(self):
+        with self.lock:
+            batch, self.pending = self.pending, []
+        if not batch:
+            return
+        data = ''.join(json.dumps(event, separators=JSON_SEPARATORS) + '\n' for event in batch).encode('utf-8')
+        try:
+            if self.file is None:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                self.file = open(self.directory / EVENT_LOG_NAME, 'ab')
+            self.file.write(data)
+            self.file.flush()
+            self.written += len(batch)
+            if self.file.tell() >= self.max_bytes:
+                self.rotate()
+        except OSError:
+            logger.exception('Could not write %d race events', len(batch))
+            self.dropped += len(batch)
+
+    def rotate(self):
+        self.file.close()
+        self.file = None
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        index = 1
+        while (self.directory / f'events-{stamp}-{index:02d}.jsonl').exists():
+            index += 1
+        target = self.directory / f'events-{stamp}-{index:02d}.jsonl'
+        (self.directory / EVENT_LOG_NAME).rename(target)
+        for path in rotated_files(self.directory)[:-self.keep or None]:
+            path.unlink()
+
+    def close(self, timeout: float = 2.0):
+        # Writes what is still buffered; later events are dropped.
+        self.closing = True
+        self.wake.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+
+def rotated_files(directory: Path) -> list:
+    # Oldest first: the names sort by rotation time.
+    return sorted(Path(directory).glob('events-*.jsonl'))
+
+
+def log_files(directory: Path) -> list:
+    current = Path(directory) / EVENT_LOG_NAME
+    return rotated_files(directory) + ([current] if current.exists() else [])
+
+
+def read_events(directory: Path, since: float = 0.0):
+    for path in log_files(directory):
+        try:
+            file = open(path, 'r', encoding='utf-8')
+        except OSError:
+            continue  # rotated away while we were reading
+        with file:
+            for line in file:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue  # a line cut short by a crash
+                if isinstance(event, dict) and event.get('t', 0) >= since:
+                    yield event
+
+
+class LapStats:
+    __slots__ = ('count', 'total_ms', 'best_ms')
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.best_ms = None
+
+    def add(self, ms: float):
+        self.count += 1
+        self.total_ms += ms
+        if self.best_ms is None or ms < self.best_ms:
+            self.best_ms = ms
+
+    def payload(self) -> dict:
+        return {
+            'count': self.count,
+            'meanMs': round(self.total_ms / self.count) if self.count else None,
+            'bestMs': round(self.best_ms) if self.best_ms is not None else None,
+        }
+
+
+def new_track_stats() -> dict:
+    return {'races': 0, 'entries': 0, 'completed': 0, 'finishes': 0, 'dnfs': 0, 'respawns': 0, 'disconnects': 0, 'laps': LapStats()}
+
+
+def new_car_stats() -> dict:
+    return {'name': '', 'entries': 0, 'finishes': 0, 'wins': 0, 'dnfs': 0, 'respawns': 0, 'laps': LapStats()}
+
+
+def aggregate(events, track_id: str | None = None, include_bots: bool = False) -> dict:
+    # One pass, constant memory per track and car.
+    tracks = {}
+    cars = {}
+    for event in events:
+        track = event.get('track')
+        if track_id is not None and track != track_id:
+            continue
+        kind = event.get('e')
+        if kind == 'race_start':
+            stats = tracks.setdefault(track, new_track_stats())
+            stats['races'] += 1
+            stats['entries'] += event.get('humans', 0) + (event.get('bots', 0) if include_bots else 0)
+            continue
+        if kind == 'race_end':
+            if event.get('reason') == 'finished':
+                tracks.setdefault(track, new_track_stats())['completed'] += 1
+            continue
+        if event.get('bot') and not include_bots:
+            continue
+        stats = tracks.setdefault(track, new_track_stats())
+        car = cars.setdefault(event.get('car'), new_car_stats())
+        car['name'] = event.get('carName') or car['name']
+        if kind == 'lap':
+            lap_ms = event.get('lapMs')
+            if isinstance(lap_ms, (int, float)):
+                stats['laps'].add(lap_ms)
+                car['laps'].add(lap_ms)
+        elif kind == 'finish':
+            stats['finishes'] += 1
+            car['finishes'] += 1
+            car['entries'] += 1
+            car['wins'] += event.get('place') == 1
+        elif kind == 'dnf' or (kind == 'disconnect' and event.get('racing')):
+            # Leaving mid-race counts as not finishing.
+            stats['dnfs'] += 1
+            stats['disconnects'] += kind == 'disconnect'
+            car['dnfs'] += 1
+            car['entries'] += 1
+        elif kind == 'disconnect':
+            stats['disconnects'] += 1
+        elif kind == 'respawn':
+            stats['respawns'] += 1
+            car['respawns'] += 1
+    return {
+        'tracks': {key: dict(value, laps=value['laps'].payload()) for key, value in tracks.items()},
+        'cars': {key: dict(value, laps=value['laps'].payload()) for key, value in cars.items()},
+    }
+
+
+def format_ms(ms) -> str:
+    return '-' if ms is None else f'{ms / 1000:.3f}s'
+
+
+def command_stats(args):
+    since = time.time() - args.days * 86400 if args.days else 0.0
+    result = aggregate(read_events(args.dir, since), args.track, args.bots)
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    print(f'{"track":<24} {"races":>6} {"done":>6} {"entries":>8} {"finish":>7} {"dnf":>5} {"resp":>6} {"laps":>7} {"mean lap":>10} {"best lap":>10}')
+    for track, stats in sorted(result['tracks'].items(), key=lambda item: -item[1]['races']):
+        laps = stats['laps']
+        print(f'{str(track):<24} {stats["races"]:>6} {stats["completed"]:>6} {stats["entries"]:>8} {stats["finishes"]:>7} {stats["dnfs"]:>5} {stats["respawns"]:>6} {laps["count"]:>7} {format_ms(laps["meanMs"]):>10} {format_ms(laps["bestMs"]):>10}')
+    print()
+    print(f'{"car":<24} {"starts":>6} {"finish":>7} {"wins":>5} {"dnf":>5} {"resp":>6} {"laps":>7} {"mean lap":>10} {"best lap":>10}')
+    for car_id, stats in sorted(result['cars'].items(), key=lambda item: -item[1]['entries']):
+        laps = stats['laps']
+        label = f'{car_id} {stats["name"]}'.strip()
+        print(f'{label:<24} {stats["entries"]:>6} {stats["finishes"]:>7} {stats["wins"]:>5} {stats["dnfs"]:>5} {stats["respawns"]:>6} {laps["count"]:>7} {format_ms(laps["meanMs"]):>10} {format_ms(laps["bestMs"]):>10}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Aggregate the ChunkyDrift race event log.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    stats_parser = subparsers.add_parser('stats', help='per-track and per-car statistics')
+    stats_parser.add_argument('--dir', type=Path, default=EVENT_LOG_DIR)
+    stats_parser.add_argument('--track', help='only this track id')
+    stats_parser.add_argument('--days', type=float, help='only the last N days')
+    stats_parser.add_argument('--bots', action='store_true', help='count bots too')
+    stats_parser.add_argument('--json', action='store_true')
+    stats_parser.set_defaults(handler=command_stats)
+
+    args = parser.parse_args()
+    try:
+        args.handler(args)
+    except OSError as exc:
+        sys.exit(f'Error: {exc}')
+
+
+if __name__ == '__main__':
+    main()
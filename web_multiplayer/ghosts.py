@@ -0,0 +1,129 @@
+import base64
+import json
+import re
+import threading
+import time
+from pathlib import Path
+
+from web_multiplayer.track_store import atomic_write_json
+
+
+GHOST_VERSION = 1
+GHOST_SAMPLE_TICKS = 6  # 10 Hz at the server's 60 Hz; clients interpolate between samples
+GHOST_POSITION_SCALE = 4  # quarter pixels
+GHOST_ROTATION_SCALE = 2  # half degrees
+
+
+def zigzag_varints(values) -> bytes:
+    out = bytearray()
+    for value in values:
+        value = (value << 1) ^ (value >> 63)
+        while value >= 0x80:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+        out.append(value)
+    return bytes(out)
+
+
+def read_zigzag_varints(data: bytes) -> list:
+    values = []
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        values.append((value >> 1) ^ -(value & 1))
+        value = shift = 0
+    return values
+
+
+def encode_trace(samples) -> str:
+    # samples: flat [x, y, rotation_deg, ...]. Each channel is quantized and
+    # stored as the change from the previous sample; rotation deltas take the
+    # short way round so a lap through 0/360 stays one byte a sample.
+    full_turn = 360 * GHOST_ROTATION_SCALE
+    deltas = []
+    last_x = last_y = last_rotation = 0
+    for index in range(0, len(samples) - 2, 3):
+        x = round(samples[index] * GHOST_POSITION_SCALE)
+        y = round(samples[index + 1] * GHOST_POSITION_SCALE)
+        rotation = round(samples[index + 2] * GHOST_ROTATION_SCALE) % full_turn
+        turn = (rotation - last_rotation + full_turn // 2) % full_turn - full_turn // 2
+        deltas += (x - last_x, y - last_y, turn)
+        last_x, last_y, last_rotation = x, y, rotation
+    return base64.b64encode(zigzag_varints(deltas)).decode('ascii')
+
+
+def decode_trace(data: str) -> list:
+    # Inverse of encode_trace (rotation comes back unwrapped); app.js has
+    # the same decoder.
+    values = read_zigzag_varints(base64.b64decode(data))
+    samples = []
+    x = y = rotation = 0
+    for index in range(0, len(values) - 2, 3):
+        x += values[index]
+        y += values[index + 1]
+        rotation += values[index + 2]
+        samples += (x / GHOST_POSITION_SCALE, y / GHOST_POSITION_SCALE, rotation / GHOST_ROTATION_SCALE)
+    return samples
+
+
+def safe_name(value: str) -> str:
+    return re.sub(r'[^A-Za-z0-9_-]', '_', value)[:64] or '_'
+
+
+class GhostStore:
+    # One JSON file per track and leaderboard category, holding the fastest
+    # lap's trace. Ghosts carry the hash of the rows they were driven on, so
+    # a custom track saved again under the same id drops its old ghost.
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.cache = {}
+        self.lock = threading.RLock()
+
+    def path(self, track_id: str, category: str) -> Path:
+        return self.root / safe_name(track_id) / f'{safe_name(category)}.json'
+
+    def get(self, track_id: str, category: str, rows_hash: str):
+        key = (track_id, category)
+        with self.lock:
+            if key not in self.cache:
+                try:
+                    with open(self.path(track_id, category), 'r', encoding='utf-8') as file:
+                        ghost = json.load(file)
+                except (OSError, ValueError):
+                    ghost = None
+                if not isinstance(ghost, dict) or ghost.get('version') != GHOST_VERSION:
+                    ghost = None
+                self.cache[key] = ghost
+            ghost = self.cache[key]
+        if ghost is None or ghost.get('trackHash') != rows_hash:
+            return None
+        return ghost
+
+    def offer(self, track_id: str, category: str, rows_hash: str, name: str, lap_ms: float, sample_ms: float, offset_ms: float, samples) -> bool:
+        # Keeps the lap if it beats the stored one; returns whether it did.
+        # Runs off the event loop, so the compare and the write share the lock.
+        with self.lock:
+            current = self.get(track_id, category, rows_hash)
+            if current is not None and current['lapMs'] <= lap_ms:
+                return False
+            ghost = {
+                'version': GHOST_VERSION,
+                'trackId': track_id,
+                'trackHash': rows_hash,
+                'category': category,
+                'name': name,
+                'lapMs': int(lap_ms),
+                'sampleMs': sample_ms,
+                'offsetMs': round(offset_ms, 3),
+                'positionScale': GHOST_POSITION_SCALE,
+                'rotationScale': GHOST_ROTATION_SCALE,
+                'count': len(samples) // 3,
+                'recordedAt': round(time.time(), 3),
+                'data': encode_trace(samples),
+            }
+            atomic_write_json(self.path(track_id, category), ghost)
+            self.cache[(track_id, category)] = ghost
+            return True
@@ -0,0 +1,211 @@
+# Per-track heatmaps of where human drivers hit walls, where they respawn
+# from and how fast they go, one cell per tile. Stdlib only, so the track
+# editor can load them without the server's dependencies.
+#
+# The server only keeps the counts gathered since the last flush: recording
+# is an index and an add, and each flush swaps the grids for empty ones and
+# adds the old ones to the track's file on a worker thread. A track's
+# memory is a fixed few arrays of its tile count, and tracks with nothing
+# new are dropped until they are raced again.
+#
+# Layout of heatmaps/<track>.heat, all little-endian:
+#   header   magic 'CDHM', version, width, height, the SHA-256 of the rows
+#            the counts belong to (hex)
+#   grids    uint32 wall hits, uint32 respawns, float64 speed sum (px/s),
+#            uint32 speed samples, each width * height in row-major order
+
+import os
+import re
+import struct
+import sys
+import tempfile
+import threading
+from array import array
+from pathlib import Path
+
+
+HEATMAP_MAGIC = b'CDHM'
+HEATMAP_VERSION = 1
+HEATMAP_SUFFIX = '.heat'
+HEATMAP_DIR = Path(__file__).parent / 'heatmaps'
+HEATMAP_LAYERS = (('wallHits', 'I'), ('respawns', 'I'), ('speedSum', 'd'), ('speedSamples', 'I'))
+
+HEADER = struct.Struct('<4sHHH64s')
+
+
+def heatmap_path(directory: Path, track_id: str) -> Path:
+    return Path(directory) / f'{re.sub(r"[^A-Za-z0-9_-]", "_", track_id)[:64] or "_"}{HEATMAP_SUFFIX}'
+
+
+def empty_layers(cells: int) -> dict:
+    return {name: array(code, bytes(cells * array(code).itemsize)) for name, code in HEATMAP_LAYERS}
+
+
+class TrackHeatmap:
+    def __init__(self, track_id: str, rows_hash: str, width: int, height: int, tile_size: int, layers: dict | None = None):
+        self.track_id = track_id
+        self.rows_hash = rows_hash
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+        layers = layers or empty_layers(width * height)
+        self.wall_hits = layers['wallHits']
+        self.respawns = layers['respawns']
+        self.speed_sum = layers['speedSum']
+        self.speed_samples = layers['speedSamples']
+        self.events = 0
+
+    def cell(self, x: float, y: float) -> int:
+        col = int(x // self.tile_size)
+        row = int(y // self.tile_size)
+        col = 0 if col < 0 else self.width - 1 if col >= self.width else col
+        row = 0 if row < 0 else self.height - 1 if row >= self.height else row
+        return row * self.width + col
+
+    def add_wall_hit(self, x: float, y: float):
+        self.wall_hits[self.cell(x, y)] += 1
+        self.events += 1
+
+    def add_respawn(self, x: float, y: float):
+        self.respawns[self.cell(x, y)] += 1
+        self.events += 1
+
+    def add_speed(self, x: float, y: float, speed: float):
+        index = self.cell(x, y)
+        self.speed_sum[index] += speed
+        self.speed_samples[index] += 1
+        self.events += 1
+
+    def layers(self) -> dict:
+        return {'wallHits': self.wall_hits, 'respawns': self.respawns, 'speedSum': self.speed_sum, 'speedSamples': self.speed_samples}
+
+    def copy(self) -> 'TrackHeatmap':
+        return TrackHeatmap(self.track_id, self.rows_hash, self.width, self.height, self.tile_size, {name: layer[:] for name, layer in self.layers().items()})
+
+    def take(self) -> 'TrackHeatmap':
+        # Hands the counts so far to a flush and starts again from zero.
+        taken = TrackHeatmap(self.track_id, self.rows_hash, self.width, self.height, self.tile_size, self.layers())
+        taken.events = self.events
+        fresh = empty_layers(self.width * self.height)
+        self.wall_hits, self.respawns = fresh['wallHits'], fresh['respawns']
+        self.speed_sum, self.speed_samples = fresh['speedSum'], fresh['speedSamples']
+        self.events = 0
+        return taken
+
+    def merge(self, other: 'TrackHeatmap'):
+        for name, layer in self.layers().items():
+            for index, value in enumerate(other.layers()[name]):
+                if value:
+                    layer[index] += value
+
+    def encode(self) -> bytes:
+        header = HEADER.pack(HEATMAP_MAGIC, HEATMAP_VERSION, self.width, self.height, self.rows_hash.encode('ascii'))
+        return header + b''.join(layer.tobytes() for layer in self.layers().values())
+
+    def payload(self) -> dict:
+        return {
+            'trackId': self.track_id,
+            'trackHash': self.rows_hash,
+            'width': self.width,
+            'height': self.height,
+            'tileSize': self.tile_size,
+            'wallHits': self.wall_hits.tolist(),
+            'respawns': self.respawns.tolist(),
+            'meanSpeed': [round(total / count, 1) if count else 0 for total, count in zip(self.speed_sum, self.speed_samples)],
+            'speedSamples': self.speed_samples.tolist(),
+        }
+
+
+def decode_heatmap(data: bytes, track_id: str, tile_size: int) -> TrackHeatmap | None:
+    if len(data) < HEADER.size:
+        return None
+    magic, version, width, height, rows_hash = HEADER.unpack_from(data)
+    if magic != HEATMAP_MAGIC or version != HEATMAP_VERSION:
+        return None
+    layers = {}
+    offset = HEADER.size
+    for name, code in HEATMAP_LAYERS:
+        layer = array(code)
+        size = width * height * layer.itemsize
+        if offset + size > len(data):
+            return None
+        layer.frombytes(data[offset:offset + size])
+        if sys.byteorder != 'little':
+            layer.byteswap()
+        layers[name] = layer
+        offset += size
+    return TrackHeatmap(track_id, rows_hash.decode('ascii'), width, height, tile_size, layers)
+
+
+def load_heatmap(directory: Path, track_id: str, tile_size: int) -> TrackHeatmap | None:
+    try:
+        with open(heatmap_path(directory, track_id), 'rb') as file:
+            return decode_heatmap(file.read(), track_id, tile_size)
+    except OSError:
+        return None
+
+
+def write_heatmap(directory: Path, heatmap: TrackHeatmap):
+    path = heatmap_path(directory, heatmap.track_id)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=f'.{path.name}.', suffix='.tmp', dir=path.parent)
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(heatmap.encode())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class HeatmapStore:
+    # active: the unflushed counts per track, touched only on the event loop.
+    # The lock serialises the read-add-write of each track's file between
+    # flushes and API reads running on worker threads.
+    def __init__(self, directory: Path = HEATMAP_DIR):
+        self.directory = Path(directory)
+        self.active = {}
+        self.lock = threading.Lock()
+
+    def track(self, track_id: str, rows_hash: str, width: int, height: int, tile_size: int) -> TrackHeatmap:
+        heatmap = self.active.get(track_id)
+        if heatmap is None or heatmap.rows_hash != rows_hash:
+            # A changed layout starts afresh; its old counts are replaced on disk
+            # at the next flush.
+            heatmap = self.active[track_id] = TrackHeatmap(track_id, rows_hash, width, height, tile_size)
+        return heatmap
+
+    def take_pending(self) -> list:
+        # On the loop. Tracks with nothing new since the last flush are let go.
+        pending = []
+        for track_id, heatmap in list(self.active.items()):
+            if heatmap.events:
+                pending.append(heatmap.take())
+            else:
+                del self.active[track_id]
+        return pending
+
+    def write_pending(self, pending: list):
+        # On a worker thread.
+        with self.lock:
+            for delta in pending:
+                stored = load_heatmap(self.directory, delta.track_id, delta.tile_size)
+                if stored is None or stored.rows_hash != delta.rows_hash or (stored.width, stored.height) != (delta.width, delta.height):
+                    stored = delta
+                else:
+                    stored.merge(delta)
+                write_heatmap(self.directory, stored)
+
+    def read(self, track_id: str, tile_size: int, unflushed: TrackHeatmap | None = None) -> TrackHeatmap | None:
+        # On a worker thread: the stored counts plus a copy of the unflushed ones.
+        with self.lock:
+            stored = load_heatmap(self.directory, track_id, tile_size)
+        if unflushed is None:
+            return stored
+        if stored is None or stored.rows_hash != unflushed.rows_hash:
+            return unflushed
+        stored.merge(unflushed)
+        return stored
@@ -0,0 +1,368 @@
+# Headless load generator for the multiplayer server. Starts a local uvicorn
+# per load level, connects ROOMS x PLAYERS bot clients that send input and
+# pings like app.js, and reports server CPU, tick lateness and snapshot jitter.
+#
+#     python -m web_multiplayer.load_test --levels 1x4,4x4,8x8 --duration 20
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+import urllib.parse
+import urllib.request
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import websockets
+
+from web_multiplayer.netem_proxy import NetemProxy, add_impairment_arguments, impairment_from_args
+
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+INPUT_INTERVAL_SECONDS = 1.0 / 20  # app.js forces an input every 50 ms
+INPUT_CHANGE_MIN_SECONDS = 0.06  # and sends changes at most every 60 ms
+PING_INTERVAL_SECONDS = 1.0
+START_RETRY_SECONDS = 1.0
+SERVER_START_TIMEOUT_SECONDS = 15.0
+
+
+@dataclass
+class BotStats:
+    gaps: list = field(default_factory=list)
+    bytes_received: int = 0
+    snapshots: int = 0
+    rtts_ms: list = field(default_factory=list)
+    errors: int = 0
+
+
+@dataclass
+class LevelResult:
+    rooms: int
+    players: int
+    seconds: float
+    cpu_percent: float
+    tick_lateness_p50_ms: float
+    tick_lateness_p99_ms: float
+    tick_total_p99_ms: float
+    gap_p50_ms: float
+    gap_p99_ms: float
+    jitter_ms: float
+    snapshots_per_client_s: float
+    kbytes_per_client_s: float
+    rtt_p50_ms: float
+    bot_errors: int
+
+
+def parse_levels(text: str):
+    levels = []
+    for part in text.split(','):
+        rooms, _, players = part.strip().lower().partition('x')
+        levels.append((int(rooms), int(players)))
+    return levels
+
+
+def percentile(values, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(math.ceil(fraction * len(ordered))) - 1))
+    return ordered[index]
+
+
+def parse_histogram(metrics_text: str, name: str, labels: str = ''):
+    # Returns {upper_bound: cumulative_count} for one histogram series.
+    buckets = {}
+    prefix = f'{name}_bucket{{'
+    for line in metrics_text.splitlines():
+        if not line.startswith(prefix):
+            continue
+        label_text, _, value = line[len(prefix):].rpartition('} ')
+        if labels and not label_text.startswith(labels):
+            continue
+        bound = label_text.rsplit('le="', 1)[1].rstrip('"')
+        buckets[math.inf if bound == '+Inf' else float(bound)] = float(value)
+    return buckets
+
+
+def histogram_quantile(before: dict, after: dict, fraction: float) -> float:
+    # Same interpolation as Prometheus' histogram_quantile, over the window
+    # between two scrapes.
+    bounds = sorted(after)
+    counts = [after[b] - before.get(b, 0.0) for b in bounds]
+    if not counts or counts[-1] <= 0:
+        return 0.0
+    rank = fraction * counts[-1]
+    lower_bound = 0.0
+    lower_count = 0.0
+    for bound, count in zip(bounds, counts):
+        if count >= rank:
+            if bound == math.inf:
+                return lower_bound
+            if count == lower_count:
+                return bound
+            return lower_bound + (bound - lower_bound) * (rank - lower_count) / (count - lower_count)
+        lower_bound, lower_count = bound, count
+    return lower_bound
+
+
+def fetch_text(url: str) -> str:
+    with urllib.request.urlopen(url, timeout=5) as response:
+        return response.read().decode('utf-8')
+
+
+def process_cpu_seconds(pid: int) -> float:
+    with open(f'/proc/{pid}/stat', encoding='ascii') as file:
+        fields = file.read().rsplit(')', 1)[1].split()
+    # utime and stime are fields 14 and 15; the split drops the first two.
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def start_server(host: str, port: int) -> subprocess.Popen:
+    process = subprocess.Popen(
+        [
+            sys.executable, '-m', 'uvicorn', 'web_multiplayer.server:app',
+            '--host', host, '--port', str(port), '--log-level', 'warning',
+        ],
+        cwd=REPO_ROOT,
+    )
+    deadline = time.monotonic() + SERVER_START_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'Server exited with code {process.returncode}')
+        try:
+            fetch_text(f'http://{host}:{port}/api/status')
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError('Server did not start in time')
+
+
+def stop_server(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+class Bot:
+    def __init__(self, ws_base: str, room_id: str, name: str, leader: bool, seed: int):
+        self.url = f'{ws_base}/ws/{room_id}/{name}'
+        self.leader = leader
+        self.rng = random.Random(seed)
+        self.stats = BotStats()
+        self.recording = False
+        self.phase = 'lobby'
+        self.rtt_ms = 0.0
+        self.input = {'up': True, 'down': False, 'left': False, 'right': False,
+                      'handbrake': False, 'throttle': 1.0, 'brake': 0.0, 'steer': 0.0}
+
+    def next_input(self):
+        steer = self.rng.choice((-1.0, 0.0, 0.0, 1.0))
+        handbrake = self.rng.random() < 0.1
+        self.input.update(
+            left=steer < 0, right=steer > 0, steer=steer, handbrake=handbrake,
+        )
+
+    async def run(self, stop: asyncio.Event):
+        try:
+            async with websockets.connect(self.url, max_size=None, compression=None) as socket:
+                await socket.recv()  # welcome
+                await socket.send(json.dumps({'type': 'garage', 'carId': 0, 'lapsToWin': 5, 'ready': True}))
+                tasks = [
+                    asyncio.create_task(self.receive(socket)),
+                    asyncio.create_task(self.drive(socket, stop)),
+                ]
+                await stop.wait()
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except (OSError, websockets.WebSocketException):
+            self.stats.errors += 1
+
+    async def drive(self, socket, stop: asyncio.Event):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        next_input = now
+        next_change = now + self.rng.uniform(0.3, 1.5)
+        next_ping = now + self.rng.uniform(0.0, PING_INTERVAL_SECONDS)
+        next_start = now + START_RETRY_SECONDS
+        while not stop.is_set():
+            now = loop.time()
+            if now >= next_change:
+                self.next_input()
+                next_change = now + self.rng.uniform(0.3, 1.5)
+                next_input = min(next_input, now + INPUT_CHANGE_MIN_SECONDS)
+            if now >= next_input:
+                await socket.send(json.dumps({'type': 'input', 'input': self.input}))
+                next_input = now + INPUT_INTERVAL_SECONDS
+            if now >= next_ping:
+                await socket.send(json.dumps({'type': 'ping', 'clientTime': time.perf_counter() * 1000.0, 'rttMs': self.rtt_ms}))
+                next_ping = now + PING_INTERVAL_SECONDS
+            if self.leader and self.phase in ('lobby', 'finished') and now >= next_start:
+                if self.phase == 'finished':
+                    await socket.send(json.dumps({'type': 'reset_lobby'}))
+                await socket.send(json.dumps({'type': 'start_race'}))
+                next_start = now + START_RETRY_SECONDS
+            await asyncio.sleep(max(0.0, min(next_input, next_change, next_ping) - loop.time()))
+
+    async def receive(self, socket):
+        last_arrival = None
+        async for raw in socket:
+            arrival = time.perf_counter()
+            message = json.loads(raw)
+            msg_type = message.get('type')
+            if msg_type == 'state':
+                self.phase = message['room']['phase']
+                if self.recording:
+                    self.stats.snapshots += 1
+                    self.stats.bytes_received += len(raw)
+                    if last_arrival is not None:
+                        self.stats.gaps.append(arrival - last_arrival)
+                last_arrival = arrival
+            elif msg_type == 'pong':
+                rtt = arrival * 1000.0 - float(message.get('clientTime', 0.0))
+                self.rtt_ms = rtt if self.rtt_ms == 0 else self.rtt_ms + (rtt - self.rtt_ms) * 0.2
+                if self.recording:
+                    self.stats.rtts_ms.append(rtt)
+
+
+async def run_bots(ws_base: str, rooms: int, players: int, warmup: float, duration: float, on_record_start, seed: int, impairment=None):
+    proxy = None
+    if impairment is not None and impairment.active():
+        upstream = urllib.parse.urlsplit(ws_base)
+        proxy = await NetemProxy('127.0.0.1', 0, upstream.hostname, upstream.port or 80, impairment).start()
+        ws_base = f'ws://127.0.0.1:{proxy.listen_port}'
+
+    stop = asyncio.Event()
+    bots = [
+        Bot(ws_base, f'load{room}', f'bot{room}_{index}', index == 0, seed + room * 1000 + index)
+        for room in range(rooms)
+        for index in range(players)
+    ]
+    tasks = []
+    for bot in bots:
+        tasks.append(asyncio.create_task(bot.run(stop)))
+        await asyncio.sleep(0.005)  # stagger the upgrade burst
+
+    await asyncio.sleep(warmup)
+    on_record_start()
+    for bot in bots:
+        bot.recording = True
+    await asyncio.sleep(duration)
+    stop.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    if proxy is not None:
+        await proxy.close()
+    return bots
+
+
+def run_level(args, rooms: int, players: int) -> LevelResult:
+    server = None
+    base = args.url.rstrip('/') if args.url else f'http://{args.host}:{args.port}'
+    ws_base = args.ws_url.rstrip('/') if args.ws_url else 'ws' + base[len('http'):]
+    if not args.url:
+        server = start_server(args.host, args.port)
+    marks = {}
+
+    def record_start():
+        marks['metrics'] = fetch_text(f'{base}/metrics')
+        marks['wall'] = time.perf_counter()
+        if server is not None:
+            marks['cpu'] = process_cpu_seconds(server.pid)
+
+    try:
+        bots = asyncio.run(
+            run_bots(ws_base, rooms, players, args.warmup, args.duration, record_start, args.seed, impairment_from_args(args))
+        )
+        metrics_after = fetch_text(f'{base}/metrics')
+        wall = time.perf_counter() - marks['wall']
+        cpu = (process_cpu_seconds(server.pid) - marks['cpu']) / wall * 100.0 if server is not None else 0.0
+    finally:
+        if server is not None:
+            stop_server(server)
+
+    lateness_name = 'chunkydrift_tick_lateness_seconds'
+    phase_name = 'chunkydrift_tick_phase_seconds'
+    lateness_before = parse_histogram(marks['metrics'], lateness_name)
+    lateness_after = parse_histogram(metrics_after, lateness_name)
+    total_before = parse_histogram(marks['metrics'], phase_name, 'phase="total"')
+    total_after = parse_histogram(metrics_after, phase_name, 'phase="total"')
+
+    gaps = [gap for bot in bots for gap in bot.stats.gaps]
+    client_count = max(1, len(bots))
+    return LevelResult(
+        rooms=rooms,
+        players=players,
+        seconds=round(wall, 2),
+        cpu_percent=round(cpu, 1),
+        tick_lateness_p50_ms=round(histogram_quantile(lateness_before, lateness_after, 0.5) * 1000.0, 3),
+        tick_lateness_p99_ms=round(histogram_quantile(lateness_before, lateness_after, 0.99) * 1000.0, 3),
+        tick_total_p99_ms=round(histogram_quantile(total_before, total_after, 0.99) * 1000.0, 3),
+        gap_p50_ms=round(percentile(gaps, 0.5) * 1000.0, 2),
+        gap_p99_ms=round(percentile(gaps, 0.99) * 1000.0, 2),
+        jitter_ms=round(statistics.pstdev(gaps) * 1000.0, 2) if len(gaps) > 1 else 0.0,
+        snapshots_per_client_s=round(sum(bot.stats.snapshots for bot in bots) / client_count / wall, 1),
+        kbytes_per_client_s=round(sum(bot.stats.bytes_received for bot in bots) / client_count / wall / 1024.0, 1),
+        rtt_p50_ms=round(percentile([rtt for bot in bots for rtt in bot.stats.rtts_ms], 0.5), 2),
+        bot_errors=sum(bot.stats.errors for bot in bots),
+    )
+
+
+def print_report(results):
+    columns = (
+        ('level', lambda r: f'{r.rooms}x{r.players}'),
+        ('cpu%', lambda r: f'{r.cpu_percent:.1f}'),
+        ('late p50', lambda r: f'{r.tick_lateness_p50_ms:.2f}'),
+        ('late p99', lambda r: f'{r.tick_lateness_p99_ms:.2f}'),
+        ('tick p99', lambda r: f'{r.tick_total_p99_ms:.2f}'),
+        ('gap p50', lambda r: f'{r.gap_p50_ms:.1f}'),
+        ('gap p99', lambda r: f'{r.gap_p99_ms:.1f}'),
+        ('jitter', lambda r: f'{r.jitter_ms:.1f}'),
+        ('snap/s', lambda r: f'{r.snapshots_per_client_s:.1f}'),
+        ('KiB/s', lambda r: f'{r.kbytes_per_client_s:.1f}'),
+        ('rtt', lambda r: f'{r.rtt_p50_ms:.1f}'),
+        ('errors', lambda r: str(r.bot_errors)),
+    )
+    rows = [[title for title, _ in columns]] + [[fmt(r) for _, fmt in columns] for r in results]
+    widths = [max(len(row[i]) for row in rows) for i in range(len(columns))]
+    for row in rows:
+        print('  '.join(cell.rjust(width) for cell, width in zip(row, widths)))
+    print('(times in ms; gap/jitter/snap/s/KiB/s are per client; cpu is % of one core)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the ChunkyDrift multiplayer server.')
+    parser.add_argument('--levels', default='1x4,4x4,8x8', help='comma separated ROOMSxPLAYERS load levels')
+    parser.add_argument('--duration', type=float, default=20.0, help='measured seconds per level')
+    parser.add_argument('--warmup', type=float, default=5.0, help='seconds to let races start before measuring')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--url', help='use an already running server at this http URL instead of starting one')
+    parser.add_argument('--ws-url', help='connect bots through this ws:// base URL (e.g. a separately run netem_proxy)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', dest='json_path', help='also write the results to this file')
+    add_impairment_arguments(parser)
+    args = parser.parse_args()
+
+    results = []
+    for rooms, players in parse_levels(args.levels):
+        print(f'Running {rooms} rooms x {players} players ...', flush=True)
+        results.append(run_level(args, rooms, players))
+    print_report(results)
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as file:
+            json.dump([result.__dict__ for result in results], file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
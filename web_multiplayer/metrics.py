@@ -0,0 +1,118 @@
+import bisect
+import math
+
+
+TICK_SECONDS_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.0075, 0.01, 0.0167, 0.025, 0.05, 0.1, 0.25,
+)
+
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def format_labels(label_names, key) -> str:
+    if not label_names:
+        return ''
+    pairs = []
+    for name, value in zip(label_names, key):
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{escaped}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name: str, help_text: str, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.values = {}
+
+    def inc(self, key=(), amount: float = 1.0):
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield self.name, format_labels(self.label_names, key), value
+
+
+class Gauge:
+    kind = 'gauge'
+
+    def __init__(self, name: str, help_text: str, label_names=(), collect=None):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.values = {}
+        self.collect = collect
+
+    def set(self, value: float, key=()):
+        self.values[key] = float(value)
+
+    def samples(self):
+        values = self.collect() if self.collect is not None else self.values
+        for key, value in values.items():
+            yield self.name, format_labels(self.label_names, key), value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, label_names=(), buckets=TICK_SECONDS_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self.series = {}
+
+    def observe(self, value: float, key=()):
+        series = self.series.get(key)
+        if series is None:
+            # bucket counts (non-cumulative, last slot is +Inf), then sum
+            series = self.series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def samples(self):
+        for key, series in self.series.items():
+            cumulative = 0
+            for index, upper in enumerate(self.buckets + (math.inf,)):
+                cumulative += series[index]
+                labels = format_labels(self.label_names + ('le',), key + (format_value(upper),))
+                yield f'{self.name}_bucket', labels, cumulative
+            labels = format_labels(self.label_names, key)
+            yield f'{self.name}_sum', labels, series[-1]
+            yield f'{self.name}_count', labels, cumulative
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help_text: str, label_names=()):
+        return self.register(Counter(name, help_text, label_names))
+
+    def gauge(self, name: str, help_text: str, label_names=(), collect=None):
+        return self.register(Gauge(name, help_text, label_names, collect))
+
+    def histogram(self, name: str, help_text: str, label_names=(), buckets=TICK_SECONDS_BUCKETS):
+        return self.register(Histogram(name, help_text, label_names, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.help_text}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for sample_name, labels, value in metric.samples():
+                lines.append(f'{sample_name}{labels} {format_value(value)}')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,279 @@
+# Local TCP impairment proxy for testing the game over a bad network.
+# Sits between a browser (or load_test bots) and the server, adds latency,
+# jitter, bandwidth caps, stalls and loss-style retransmit delays, and records
+# the gaps between websocket frames as the client would see them.
+#
+#     python -m web_multiplayer.netem_proxy --listen 8081 --upstream 127.0.0.1:8000 \
+#         --latency-ms 60 --jitter-ms 15 --bandwidth-kbps 1024 --stall-every 10 --stall-ms 400
+#
+# Then open http://127.0.0.1:8081/ or pass --ws-url ws://127.0.0.1:8081 to load_test.
+
+import argparse
+import asyncio
+import random
+import time
+from dataclasses import dataclass, field
+
+
+CHUNK_SIZE = 16384
+LOSS_RETRANSMIT_MS = 200.0  # roughly a minimum TCP retransmission timeout
+REPORT_INTERVAL_SECONDS = 5.0
+
+
+@dataclass
+class Impairment:
+    latency_ms: float = 0.0  # one-way, applied in both directions
+    jitter_ms: float = 0.0
+    bandwidth_kbps: float = 0.0  # per direction, 0 = unlimited
+    stall_every_s: float = 0.0
+    stall_ms: float = 0.0
+    loss: float = 0.0  # chance a chunk waits for a retransmit
+    seed: int = 1
+
+    def active(self) -> bool:
+        return any((self.latency_ms, self.jitter_ms, self.bandwidth_kbps, self.stall_ms, self.loss))
+
+
+@dataclass
+class FrameStats:
+    gaps: list = field(default_factory=list)
+    frames: int = 0
+    bytes: int = 0
+    last_frame_at: float = 0.0
+
+
+def percentile(values, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class WebSocketFrameTracker:
+    # Follows server->client bytes after the HTTP upgrade and timestamps the
+    # end of each data message. Server frames are never masked, and
+    # compressed payloads are fine because only headers are read.
+    def __init__(self, stats: FrameStats):
+        self.stats = stats
+        self.buffer = bytearray()
+        self.upgraded = False
+        self.checked_upgrade = False
+
+    def feed(self, data: bytes, now: float):
+        self.buffer += data
+        if not self.upgraded:
+            end = self.buffer.find(b'\r\n\r\n')
+            if end < 0:
+                return
+            if not self.buffer.startswith(b'HTTP/1.1 101'):
+                self.checked_upgrade = True
+                self.buffer.clear()
+                return
+            del self.buffer[:end + 4]
+            self.upgraded = True
+
+        while True:
+            if len(self.buffer) < 2:
+                return
+            fin = self.buffer[0] & 0x80
+            opcode = self.buffer[0] & 0x0F
+            length = self.buffer[1] & 0x7F
+            offset = 2
+            if length == 126:
+                if len(self.buffer) < 4:
+                    return
+                length = int.from_bytes(self.buffer[2:4], 'big')
+                offset = 4
+            elif length == 127:
+                if len(self.buffer) < 10:
+                    return
+                length = int.from_bytes(self.buffer[2:10], 'big')
+                offset = 10
+            if self.buffer[1] & 0x80:
+                offset += 4
+            if len(self.buffer) < offset + length:
+                return
+            del self.buffer[:offset + length]
+            self.stats.bytes += length
+            if fin and opcode in (0x0, 0x1, 0x2):
+                if self.stats.last_frame_at:
+                    self.stats.gaps.append(now - self.stats.last_frame_at)
+                self.stats.last_frame_at = now
+                self.stats.frames += 1
+
+    @property
+    def active(self) -> bool:
+        return not self.checked_upgrade
+
+
+class ImpairedPipe:
+    def __init__(self, proxy: 'NetemProxy', reader, writer, tracker: WebSocketFrameTracker | None = None):
+        self.proxy = proxy
+        self.reader = reader
+        self.writer = writer
+        self.tracker = tracker
+        self.queue = asyncio.Queue()
+        self.last_due = 0.0
+        self.link_free_at = 0.0
+
+    def due_time(self, size: int, now: float) -> float:
+        impairment = self.proxy.impairment
+        rng = self.proxy.rng
+        delay = impairment.latency_ms
+        if impairment.jitter_ms:
+            delay += rng.uniform(-impairment.jitter_ms, impairment.jitter_ms)
+        if impairment.loss and rng.random() < impairment.loss:
+            delay += LOSS_RETRANSMIT_MS
+        # TCP delivers in order, so jitter can delay but never reorder bytes.
+        due = max(now + max(0.0, delay) / 1000.0, self.last_due)
+        if impairment.bandwidth_kbps:
+            due = max(due, self.link_free_at)
+            self.link_free_at = due + size * 8 / (impairment.bandwidth_kbps * 1000.0)
+            due = self.link_free_at
+        if impairment.stall_every_s and impairment.stall_ms:
+            phase = (due - self.proxy.started_at) % impairment.stall_every_s
+            stall = impairment.stall_ms / 1000.0
+            if phase < stall:
+                due += stall - phase
+        self.last_due = due
+        return due
+
+    async def read_loop(self):
+        try:
+            while True:
+                data = await self.reader.read(CHUNK_SIZE)
+                if not data:
+                    break
+                now = time.perf_counter()
+                self.queue.put_nowait((self.due_time(len(data), now), data))
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.queue.put_nowait((0.0, b''))
+
+    async def write_loop(self):
+        try:
+            while True:
+                due, data = await self.queue.get()
+                if not data:
+                    break
+                wait = due - time.perf_counter()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                self.writer.write(data)
+                await self.writer.drain()
+                if self.tracker is not None and self.tracker.active:
+                    self.tracker.feed(data, time.perf_counter())
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.writer.close()
+
+    async def run(self):
+        await asyncio.gather(self.read_loop(), self.write_loop())
+
+
+class NetemProxy:
+    def __init__(self, listen_host: str, listen_port: int, upstream_host: str, upstream_port: int, impairment: Impairment):
+        self.listen_host = listen_host
+        self.listen_port = listen_port
+        self.upstream_host = upstream_host
+        self.upstream_port = upstream_port
+        self.impairment = impairment
+        self.rng = random.Random(impairment.seed)
+        self.started_at = time.perf_counter()
+        self.connections = []  # FrameStats per client connection
+        self.server = None
+
+    async def start(self):
+        self.started_at = time.perf_counter()
+        self.server = await asyncio.start_server(self.handle, self.listen_host, self.listen_port)
+        if self.listen_port == 0:
+            self.listen_port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def handle(self, client_reader, client_writer):
+        try:
+            upstream_reader, upstream_writer = await asyncio.open_connection(self.upstream_host, self.upstream_port)
+        except OSError:
+            client_writer.close()
+            return
+        stats = FrameStats()
+        tracker = WebSocketFrameTracker(stats)
+        self.connections.append((tracker, stats))
+        await asyncio.gather(
+            ImpairedPipe(self, client_reader, upstream_writer).run(),
+            ImpairedPipe(self, upstream_reader, client_writer, tracker).run(),
+        )
+
+    def websocket_stats(self):
+        return [stats for tracker, stats in self.connections if tracker.upgraded]
+
+    def report(self) -> dict:
+        streams = self.websocket_stats()
+        gaps = [gap for stats in streams for gap in stats.gaps]
+        return {
+            'websockets': len(streams),
+            'frames': sum(stats.frames for stats in streams),
+            'bytes': sum(stats.bytes for stats in streams),
+            'gapP50Ms': round(percentile(gaps, 0.5) * 1000.0, 2),
+            'gapP99Ms': round(percentile(gaps, 0.99) * 1000.0, 2),
+            'gapMaxMs': round(max(gaps) * 1000.0, 2) if gaps else 0.0,
+        }
+
+
+def add_impairment_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='one-way delay added in each direction')
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help='uniform +/- jitter on the delay')
+    parser.add_argument('--bandwidth-kbps', type=float, default=0.0, help='per-direction bandwidth cap, 0 = unlimited')
+    parser.add_argument('--stall-every', type=float, default=0.0, help='seconds between link stalls')
+    parser.add_argument('--stall-ms', type=float, default=0.0, help='length of each stall')
+    parser.add_argument('--loss', type=float, default=0.0, help='fraction of chunks delayed as if retransmitted')
+    parser.add_argument('--netem-seed', type=int, default=1)
+
+
+def impairment_from_args(args) -> Impairment:
+    return Impairment(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        bandwidth_kbps=args.bandwidth_kbps,
+        stall_every_s=args.stall_every,
+        stall_ms=args.stall_ms,
+        loss=max(0.0, min(1.0, args.loss)),
+        seed=args.netem_seed,
+    )
+
+
+async def serve(args):
+    upstream_host, _, upstream_port = args.upstream.rpartition(':')
+    proxy = await NetemProxy(args.host, args.listen, upstream_host or '127.0.0.1', int(upstream_port), impairment_from_args(args)).start()
+    print(f'Proxying {args.host}:{proxy.listen_port} -> {args.upstream} with {proxy.impairment}', flush=True)
+    try:
+        while True:
+            await asyncio.sleep(REPORT_INTERVAL_SECONDS)
+            report = proxy.report()
+            if report['websockets']:
+                print(report, flush=True)
+    finally:
+        await proxy.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='TCP/websocket network impairment proxy.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--listen', type=int, default=8081)
+    parser.add_argument('--upstream', default='127.0.0.1:8000')
+    add_impairment_arguments(parser)
+    try:
+        asyncio.run(serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+
+MAX_PROFILE_SECONDS = 30.0
+MIN_SAMPLE_INTERVAL_SECONDS = 0.001
+
+
+def frame_label(code) -> str:
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+class SamplingProfiler:
+    # Samples one thread's Python stack from a helper thread. Nothing is
+    # installed in the target thread, so the only cost to it is the GIL time
+    # the sampler takes per sample.
+    def __init__(self, thread_id: int, seconds: float, interval: float):
+        self.thread_id = thread_id
+        self.seconds = max(0.0, min(MAX_PROFILE_SECONDS, seconds))
+        self.interval = max(MIN_SAMPLE_INTERVAL_SECONDS, interval)
+        self.stacks = Counter()
+        self.sample_count = 0
+        self.elapsed = 0.0
+        self.thread = threading.Thread(target=self.run, name='chunkydrift-profiler', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def run(self):
+        started = time.perf_counter()
+        deadline = started + self.seconds
+        while time.perf_counter() < deadline:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                break
+            stack = []
+            while frame is not None:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            del frame
+            stack.reverse()
+            self.stacks[tuple(stack)] += 1
+            self.sample_count += 1
+            time.sleep(self.interval)
+        self.elapsed = time.perf_counter() - started
+
+    def collapsed(self) -> str:
+        lines = []
+        for stack, count in self.stacks.most_common():
+            lines.append(';'.join(frame_label(code) for code in stack) + f' {count}')
+        return '\n'.join(lines) + '\n'
+
+    def speedscope(self, name: str = 'chunkydrift server') -> dict:
+        frame_index = {}
+        frames = []
+        samples = []
+        weights = []
+        for stack, count in self.stacks.most_common():
+            indexes = []
+            for code in stack:
+                index = frame_index.get(code)
+                if index is None:
+                    index = frame_index[code] = len(frames)
+                    frames.append({'name': code.co_name, 'file': code.co_filename, 'line': code.co_firstlineno})
+                indexes.append(index)
+            samples.append(indexes)
+            weights.append(count * self.interval)
+        total = sum(weights)
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'name': name,
+            'exporter': 'chunkydrift',
+            'shared': {'frames': frames},
+            'profiles': [
+                {
+                    'type': 'sampled',
+                    'name': name,
+                    'unit': 'seconds',
+                    'startValue': 0,
+                    'endValue': total,
+                    'samples': samples,
+                    'weights': weights,
+                }
+            ],
+        }
@@ -0,0 +1,269 @@
+# Headless racing environment over the server physics, for training and
+# tuning bots and car balance offline. No sockets and no asyncio: each env
+# is a RoomState stepped directly through step_player_physics,
+# solve_car_collisions and the per-car lap check, update_player_laps.
+#
+#     python -m web_multiplayer.racing_env --envs 64 --steps 2000
+#     python -m web_multiplayer.racing_env --track rally_loop --cars 4 --policy bot
+#
+# The API follows Gymnasium (reset -> (obs, info), step -> (obs, reward,
+# terminated, truncated, info)) without depending on it. Every env holds
+# `cars` agents, so actions and results are per car.
+
+import argparse
+import math
+import random
+import sys
+import time
+
+from track_data import TILESIZE
+from track_geometry import wall_rays_for
+from web_multiplayer import server
+
+
+RAY_ANGLES_DEG = (-90.0, -45.0, -20.0, 0.0, 20.0, 45.0, 90.0)  # relative to the car's heading
+RAY_DIRECTIONS = 32
+DEFAULT_MAX_STEPS = 120 * server.TICK_HZ
+OBSERVATION_SIZE = 7 + len(RAY_ANGLES_DEG)
+DEG_TO_RAD = math.pi / 180.0
+HEADING_TO_DIRECTION = RAY_DIRECTIONS / 360.0
+
+
+class RacingEnv:
+    # Observation per car: x and y in tiles, cos and sin of the heading, the
+    # velocity along and across the heading (px/s), lap progress, then wall
+    # distances in tiles along RAY_ANGLES_DEG. Rays read a per-track table
+    # built from tile centres in RAY_DIRECTIONS headings.
+    #
+    # Action per car: (throttle, brake, steer, handbrake) with throttle and
+    # brake in 0..1, steer in -1..1 and handbrake on when > 0.5.
+    #
+    # Reward per car: laps gained this step, fractional, from the progress
+    # field (a full lap adds 1.0; going backwards is negative).
+    def __init__(self, track_id: str = 'brands_hatch', cars: int = 1, laps: int = 1, max_steps: int = DEFAULT_MAX_STEPS, car_ids=None):
+        track = server.resolve_track(track_id)
+        if track is None:
+            raise ValueError(f'Unknown track {track_id!r}')
+        self.room = server.RoomState(room_id=f'env-{track_id}', headless=True)
+        server.set_room_track(
+            self.room,
+            track['id'],
+            track['rows'],
+            track['name'],
+            server.normalize_spawn_rotation(track.get('spawnRotationDeg', server.DEFAULT_SPAWN_ROTATION_DEG)),
+        )
+        self.room.laps_to_win = max(1, laps)
+        self.max_steps = max_steps
+        self.dt = 1.0 / server.TICK_HZ
+        self.steps = 0
+
+        for index in range(max(1, cars)):
+            player = server.PlayerState(
+                player_id=f'car{index}',
+                name=f'Car {index}',
+                x=self.room.spawn_x,
+                y=self.room.spawn_y,
+                rotation_deg=self.room.spawn_rotation_deg,
+                websocket=None,
+            )
+            car_id = car_ids[index % len(car_ids)] if car_ids else index % len(server.WEB_CAR_MODELS)
+            server.set_player_car(player, car_id)
+            self.room.players[player.player_id] = player
+        self.players = list(self.room.players.values())
+        self.last_progress = [0.0] * len(self.players)
+        self.bot_states = {}  # bot_actions controller state per car
+
+        rays = wall_rays_for(tuple(self.room.track_rows), RAY_DIRECTIONS)
+        self.ray_table = rays.distances
+        # Table directions of every ray for each of the RAY_DIRECTIONS headings.
+        offsets = [round(angle / 360.0 * RAY_DIRECTIONS) for angle in RAY_ANGLES_DEG]
+        self.ray_sets = [
+            tuple((heading + offset) % RAY_DIRECTIONS for offset in offsets)
+            for heading in range(RAY_DIRECTIONS)
+        ]
+
+    @property
+    def cars(self) -> int:
+        return len(self.players)
+
+    def reset(self, seed=None):
+        room = self.room
+        server.start_countdown(room)
+        if room.progress_field is None:
+            raise ValueError(f'Track {room.track_id!r} has no usable checkpoints and finish line')
+        room.phase = 'racing'
+        room.race_clock = 0.0
+        self.steps = 0
+        self.bot_states.clear()
+        if seed is not None:
+            # Small pose jitter so seeded runs start from different states.
+            rng = random.Random(seed)
+            for player in self.players:
+                player.x += rng.uniform(-2.0, 2.0)
+                player.y += rng.uniform(-2.0, 2.0)
+                player.rotation_deg = (player.rotation_deg + rng.uniform(-5.0, 5.0)) % 360
+        for player in self.players:
+            player.lap_progress = room.progress_field.progress(player.x, player.y, player.next_sector, TILESIZE)
+        self.last_progress = [player.laps + player.lap_progress for player in self.players]
+        return self.observations(), {'track': room.track_id}
+
+    def step(self, actions):
+        # update_laps_and_finish would also rebuild standings and check for
+        # the end of the race every step; a headless env only needs each
+        # car's lap check, so this drives update_player_laps directly.
+        room = self.room
+        players = self.players
+        dt = self.dt
+        for player, action in zip(players, actions):
+            state = player.input_state
+            throttle, brake, steer, handbrake = action
+            state.throttle = 1.0 if throttle > 1.0 else 0.0 if throttle < 0.0 else throttle
+            state.brake = 1.0 if brake > 1.0 else 0.0 if brake < 0.0 else brake
+            state.steer = 1.0 if steer > 1.0 else -1.0 if steer < -1.0 else steer
+            state.handbrake = handbrake > 0.5
+            # step_player_physics only keeps creeping speed alive with a key
+            # down, so mirror the analog inputs onto the digital ones.
+            state.up = state.throttle > 0.0
+            state.down = state.brake > 0.0
+            server.step_player_physics(room, player, dt)
+        if len(players) > 1:
+            server.solve_car_collisions(players)
+
+        tick_start = room.race_clock
+        room.race_clock += dt
+        self.steps += 1
+        tables = room.progress_field.tables
+        width = room.track_width_tiles
+        last_col, last_row = width - 1, room.track_height_tiles - 1
+        observations = []
+        rewards = []
+        terminated = []
+        last_progress = self.last_progress
+        for index, player in enumerate(players):
+            col = int(player.x // TILESIZE)
+            row = int(player.y // TILESIZE)
+            col = last_col if col > last_col else 0 if col < 0 else col
+            row = last_row if row > last_row else 0 if row < 0 else row
+            if not player.finished:
+                server.update_player_laps(room, player, tick_start, dt)
+                player.lap_progress = 0.0 if player.finished else tables[player.next_sector][row * width + col]
+            progress = player.laps + player.lap_progress
+            rewards.append(progress - last_progress[index])
+            last_progress[index] = progress
+            terminated.append(player.finished)
+            observations.append(self.observe(player, (row * width + col) * RAY_DIRECTIONS))
+        truncated = self.steps >= self.max_steps
+        info = {'raceClock': room.race_clock}
+        return observations, rewards, terminated, [truncated] * len(players), info
+
+    def observe(self, player, ray_base: int):
+        # ray_base is the car's tile index times RAY_DIRECTIONS.
+        table = self.ray_table
+        # Cars drive along -(cos, sin) of their rotation.
+        heading_deg = player.rotation_deg + 180.0
+        radians = heading_deg * DEG_TO_RAD
+        cos_h = math.cos(radians)
+        sin_h = math.sin(radians)
+        vx, vy = player.vx, player.vy
+        obs = [player.x / TILESIZE, player.y / TILESIZE, cos_h, sin_h, vx * cos_h + vy * sin_h, vy * cos_h - vx * sin_h, player.lap_progress]
+        obs += [table[ray_base + direction] for direction in self.ray_sets[int(heading_deg * HEADING_TO_DIRECTION + 0.5) % RAY_DIRECTIONS]]
+        return obs
+
+    def observations(self):
+        width = self.room.track_width_tiles
+        last_col, last_row = width - 1, self.room.track_height_tiles - 1
+        result = []
+        for player in self.players:
+            col = min(last_col, max(0, int(player.x // TILESIZE)))
+            row = min(last_row, max(0, int(player.y // TILESIZE)))
+            result.append(self.observe(player, (row * width + col) * RAY_DIRECTIONS))
+        return result
+
+
+class VectorRacingEnv:
+    # N independent RacingEnvs stepped together. Finished envs reset
+    # themselves in step (the returned observation is the new episode's
+    # first one, as in Gymnasium's vector envs), so a training loop never
+    # has to look for them.
+    def __init__(self, count: int, **kwargs):
+        self.envs = [RacingEnv(**kwargs) for _ in range(max(1, count))]
+
+    @property
+    def cars(self) -> int:
+        return sum(env.cars for env in self.envs)
+
+    def reset(self, seed=None):
+        observations = []
+        for index, env in enumerate(self.envs):
+            obs, _ = env.reset(None if seed is None else seed + index)
+            observations.append(obs)
+        return observations, {}
+
+    def step(self, actions):
+        results = ([], [], [], [], [])
+        for env, env_actions in zip(self.envs, actions):
+            obs, rewards, terminated, truncated, info = env.step(env_actions)
+            if all(terminated) or truncated[0]:
+                info['finalObservation'] = obs
+                obs, _ = env.reset()
+            for values, value in zip(results, (obs, rewards, terminated, truncated, info)):
+                values.append(value)
+        return results
+
+
+def bot_actions(env: RacingEnv):
+    # The server's bot controller as a policy, for baselines and checks.
+    room = env.room
+    if room.flow_field is None:
+        return [(1.0, 0.0, 0.0, 0.0)] * env.cars
+    for player in env.players:
+        player.bot = env.bot_states.setdefault(player.player_id, server.BotState())
+    server.drive_bots(room, env.players)
+    actions = []
+    for player in env.players:
+        state = player.input_state
+        actions.append((state.throttle, state.brake, state.steer, 1.0 if state.handbrake else 0.0))
+        player.bot = None  # keep update_laps_and_finish treating them as plain cars
+    return actions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Step headless ChunkyDrift environments and report throughput.')
+    parser.add_argument('--track', default='brands_hatch', help=f'one of: {", ".join(server.TRACK_LIBRARY)}')
+    parser.add_argument('--envs', type=int, default=32)
+    parser.add_argument('--cars', type=int, default=1, help='cars per env')
+    parser.add_argument('--laps', type=int, default=1)
+    parser.add_argument('--steps', type=int, default=2000)
+    parser.add_argument('--policy', choices=('random', 'bot'), default='random')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    try:
+        vector = VectorRacingEnv(args.envs, track_id=args.track, cars=args.cars, laps=args.laps)
+    except ValueError as exc:
+        sys.exit(f'Error: {exc}')
+    rng = random.Random(args.seed)
+    vector.reset(args.seed)
+    total_reward = 0.0
+    laps = 0
+    started = time.perf_counter()
+    for _ in range(args.steps):
+        if args.policy == 'bot':
+            actions = [bot_actions(env) for env in vector.envs]
+        else:
+            actions = [
+                [(1.0, 0.0, rng.uniform(-1.0, 1.0), 0.0) for _ in range(env.cars)]
+                for env in vector.envs
+            ]
+        _, rewards, _, _, infos = vector.step(actions)
+        total_reward += sum(sum(env_rewards) for env_rewards in rewards)
+        laps += sum(1 for info in infos if 'finalObservation' in info)
+    elapsed = time.perf_counter() - started
+
+    car_steps = vector.cars * args.steps
+    print(f'{car_steps} car-steps in {elapsed:.2f}s: {car_steps / elapsed:,.0f} car-steps/s')
+    print(f'mean reward per car-step {total_reward / car_steps:.6f}, {laps} episodes ended')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,1001 @@
+# Race replays. Each race is recorded as per-tick input changes plus
+# periodic keyframes of every car, in a compact binary file written while
+# the race runs. Playback re-simulates the race on a headless room with the
+# server's own physics and seeks through the keyframes.
+#
+#     python -m web_multiplayer.replay list [room] [--limit N]
+#     python -m web_multiplayer.replay show <race id or .cdr path>
+#     python -m web_multiplayer.replay verify <race id or .cdr path>
+#
+# Layout, all little-endian:
+#   header   magic 'CDRP', version, header size, tick rate, keyframe interval,
+#            laps to win, spawn rotation, start time, then race id, room id,
+#            track id and track name (uint16 length + UTF-8) and the zlib'd
+#            track rows (uint32 length)
+#   records  a tag byte, then
+#            'T' n                   n ticks run on the inputs so far
+#            'I' slot flags 3 axes   a car's input from the next tick on
+#            'R' slot                a car was respawned before the next tick
+#            'C' slot car            a car changed model
+#            'J' length payload      a car joined: slot, bot, car, id, name
+#            'L' slot                a car left
+#            'K' length payload      keyframe: every car at the start of a tick
+#            'E' ticks               end of the race
+#
+# Humans' inputs are recorded; bots are re-driven by drive_bots, which only
+# depends on the simulated state. Keyframes are snapped to during playback,
+# so anything that is not recorded (a car joining mid-race and pushing
+# another) stays a local error between two keyframes.
+#
+# replays/index.jsonl holds one summary line per finished replay, so listing
+# and pruning never open the replays themselves.
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import time
+import uuid
+import zlib
+from pathlib import Path
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from web_multiplayer import server
+
+
+REPLAY_MAGIC = b'CDRP'
+REPLAY_VERSION = 1
+REPLAY_SUFFIX = '.cdr'
+REPLAY_DIR = Path(__file__).parent / 'replays'
+REPLAY_KEYFRAME_SECONDS = 2
+REPLAY_RING_BYTES = 64 * 1024
+REPLAY_FLUSH_BYTES = 16 * 1024
+REPLAY_KEEP_PER_ROOM = 20
+REPLAY_KEEP_TOTAL = 2000  # across all rooms; room ids are free-form
+REPLAY_MAX_AGE_DAYS = 30
+REPLAY_INDEX_NAME = 'index.jsonl'
+REPLAY_LIST_LIMIT = 50
+REPLAY_LIST_MAX = 200
+REPLAY_FRAME_HZ = 20
+REPLAY_MAX_SPEED = 8
+MAX_SLOTS = 255
+RACE_ID_PATTERN = re.compile(r'^[0-9a-f]{12}$')
+
+HEADER = struct.Struct('<4sHHHHBdd')
+TEXT_LENGTH = struct.Struct('<H')
+BLOB_LENGTH = struct.Struct('<I')
+TICKS = struct.Struct('<H')
+INPUT = struct.Struct('<BBhhh')
+SLOT = struct.Struct('<B')
+CAR = struct.Struct('<BB')
+JOIN = struct.Struct('<BBB')
+END = struct.Struct('<I')
+KEY_HEADER = struct.Struct('<IdhH')
+# flags, car, laps, next sector, progress bucket, x, y, vx, vy, rotation,
+# grip, lap start, last finish cross, best lap, race total, lap progress,
+# lap check x/y, input flags and axes, bot counters, split counts.
+KEY_CAR = struct.Struct('<BBHHi6d5d2dBhhh4iBB')
+
+CAR_PRESENT, CAR_ASLEEP, CAR_FINISHED, CAR_CHECKED = 1, 2, 4, 8
+INPUT_UP, INPUT_DOWN, INPUT_LEFT, INPUT_RIGHT, INPUT_HANDBRAKE = 1, 2, 4, 8, 16
+
+logger = logging.getLogger('web_multiplayer.replay')
+
+
+class ReplayError(ValueError):
+    pass
+
+
+def room_directory(room_id: str) -> str:
+    return re.sub(r'[^A-Za-z0-9_-]', '_', room_id)[:48] or '_'
+
+
+def encode_text(text: str) -> bytes:
+    data = text.encode('utf-8')[:0xFFFF]
+    return TEXT_LENGTH.pack(len(data)) + data
+
+
+def encode_input(state) -> tuple:
+    flags = (
+        (INPUT_UP if state.up else 0)
+        | (INPUT_DOWN if state.down else 0)
+        | (INPUT_LEFT if state.left else 0)
+        | (INPUT_RIGHT if state.right else 0)
+        | (INPUT_HANDBRAKE if state.handbrake else 0)
+    )
+    steps = server.INPUT_AXIS_STEPS
+    return (flags, round(state.throttle * steps), round(state.brake * steps), round(state.steer * steps))
+
+
+def decode_input(flags: int, throttle: int, brake: int, steer: int):
+    # Same arithmetic as server.quantize_axis, so the floats match the live ones.
+    steps = server.INPUT_AXIS_STEPS
+    return server.InputState(
+        up=bool(flags & INPUT_UP),
+        down=bool(flags & INPUT_DOWN),
+        left=bool(flags & INPUT_LEFT),
+        right=bool(flags & INPUT_RIGHT),
+        handbrake=bool(flags & INPUT_HANDBRAKE),
+        throttle=throttle / steps,
+        brake=brake / steps,
+        steer=steer / steps,
+    )
+
+
+NEUTRAL_INPUT = (0, 0, 0, 0)
+
+
+def encode_keyframe(tick: int, room, slots: list) -> bytes:
+    # slots: PlayerState per slot, None once a car has left.
+    winner = -1
+    parts = []
+    for slot, player in enumerate(slots):
+        present = player is not None and room.players.get(player.player_id) is player
+        if player is not None and player.player_id == room.winner_id:
+            winner = slot
+        if not present:
+            parts.append(KEY_CAR.pack(*([0] * 5 + [0.0] * 13 + [0] * 10)))
+            continue
+        bot = player.bot
+        check_x, check_y = player.lap_check_position or (0.0, 0.0)
+        flags = (
+            CAR_PRESENT
+            | (CAR_ASLEEP if player.asleep else 0)
+            | (CAR_FINISHED if player.finished else 0)
+            | (CAR_CHECKED if player.lap_check_position is not None else 0)
+        )
+        parts.append(KEY_CAR.pack(
+            flags, player.car_id, player.laps, player.next_sector, player.progress_bucket,
+            player.x, player.y, player.vx, player.vy, player.rotation_deg, player.grip_state,
+            player.lap_start_time, player.last_finish_cross_time, player.best_lap_time,
+            player.race_total_time, player.lap_progress, check_x, check_y,
+            *encode_input(player.input_state),
+            *((bot.slow_ticks, bot.reverse_ticks, bot.idle_ticks, bot.best_bucket) if bot else (0, 0, 0, -1)),
+            len(player.lap_splits), len(player.best_lap_splits),
+        ))
+        splits = player.lap_splits + player.best_lap_splits
+        parts.append(struct.pack(f'<{len(splits)}i', *splits))
+    return KEY_HEADER.pack(tick, room.race_clock, winner, len(slots)) + b''.join(parts)
+
+
+def apply_keyframe(room, payload, cars: list, joined_only: bool = False) -> int:
+    # cars: a PlayerState per slot. Rebuilds room.players in slot order (the
+    # order the live room had them in) and returns the keyframe's tick. With
+    # joined_only, only cars missing from the room are restored; new cars
+    # have the highest slots, so appending them keeps the order.
+    tick, race_clock, winner, count = KEY_HEADER.unpack_from(payload)
+    offset = KEY_HEADER.size
+    if not joined_only:
+        room.race_clock = race_clock
+        room.players = {}
+        room.winner_id = cars[winner].player_id if 0 <= winner < len(cars) else None
+        room.phase = 'racing'
+    for slot in range(min(count, len(cars))):
+        (flags, car_id, laps, next_sector, progress_bucket, x, y, vx, vy, rotation_deg, grip,
+         lap_start, last_finish, best_lap, race_total, lap_progress, check_x, check_y,
+         input_flags, throttle, brake, steer,
+         slow_ticks, reverse_ticks, idle_ticks, best_bucket, splits, best_splits) = KEY_CAR.unpack_from(payload, offset)
+        offset += KEY_CAR.size
+        if not flags & CAR_PRESENT:
+            continue
+        split_values = struct.unpack_from(f'<{splits + best_splits}i', payload, offset)
+        offset += 4 * (splits + best_splits)
+        player = cars[slot]
+        if joined_only and player.player_id in room.players:
+            continue
+        server.set_player_car(player, car_id)
+        player.grip_state = grip
+        player.laps, player.next_sector, player.progress_bucket = laps, next_sector, progress_bucket
+        player.x, player.y, player.vx, player.vy, player.rotation_deg = x, y, vx, vy, rotation_deg
+        player.lap_start_time, player.last_finish_cross_time = lap_start, last_finish
+        player.best_lap_time, player.race_total_time, player.lap_progress = best_lap, race_total, lap_progress
+        player.lap_check_position = (check_x, check_y) if flags & CAR_CHECKED else None
+        player.finished = bool(flags & CAR_FINISHED)
+        player.asleep = bool(flags & CAR_ASLEEP)
+        player.cached_entry = None
+        player.input_state = decode_input(input_flags, throttle, brake, steer)
+        if player.bot is not None:
+            player.bot = server.BotState(slow_ticks, reverse_ticks, idle_ticks, best_bucket)
+        player.lap_splits = list(split_values[:splits])
+        player.best_lap_splits = list(split_values[splits:])
+        room.players[player.player_id] = player
+    return tick
+
+
+class ReplayRing:
+    # Fixed-size byte ring between the tick loop and the replay file. Records
+    # are copied in as they happen and drained to the file in chunks, so a
+    # long race never sits in memory.
+    def __init__(self, capacity: int = REPLAY_RING_BYTES):
+        self.buffer = bytearray(capacity)
+        self.capacity = capacity
+        self.written = 0  # bytes ever appended
+        self.drained = 0  # bytes ever handed to the file
+
+    @property
+    def pending(self) -> int:
+        return self.written - self.drained
+
+    def append(self, data: bytes, file):
+        size = len(data)
+        if self.pending + size > self.capacity:
+            self.drain(file)
+        if size > self.capacity:
+            file.write(data)
+            self.written += size
+            self.drained += size
+            return
+        start = self.written % self.capacity
+        first = min(size, self.capacity - start)
+        self.buffer[start:start + first] = data[:first]
+        if first < size:
+            self.buffer[:size - first] = data[first:]
+        self.written += size
+
+    def drain(self, file):
+        pending = self.pending
+        if not pending:
+            return
+        view = memoryview(self.buffer)
+        start = self.drained % self.capacity
+        first = min(pending, self.capacity - start)
+        file.write(view[start:start + first])
+        if first < pending:
+            file.write(view[:pending - first])
+        self.drained = self.written
+
+
+class ReplayRecorder:
+    # Created when a race goes green; record_tick runs at the top of every
+    # racing tick, before bots and physics. The file is written as
+    # <race id>.cdr.part and renamed when the race ends.
+    def __init__(self, room, directory: Path | None = None):
+        self.race_id = uuid.uuid4().hex[:12]
+        self.root = Path(directory or REPLAY_DIR)
+        self.directory = self.root / room_directory(room.room_id)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.path = self.directory / f'{self.race_id}{REPLAY_SUFFIX}'
+        self.part_path = self.path.with_name(self.path.name + '.part')
+        self.file = open(self.part_path, 'wb', buffering=0)
+        self.ring = ReplayRing()
+        self.slots = []  # PlayerState per slot, None once gone
+        self.slot_of = {}
+        self.inputs = []
+        self.car_ids = []
+        self.tick = 0
+        self.pending_ticks = 0
+        self.keyframe_ticks = REPLAY_KEYFRAME_SECONDS * server.TICK_HZ
+        self.started_at = time.time()
+        self.summary = {
+            'raceId': self.race_id,
+            'roomId': room.room_id,
+            'trackId': room.track_id,
+            'trackName': room.track_name,
+            'lapsToWin': room.laps_to_win,
+            'startedAt': self.started_at,
+            'cars': [],
+        }
+
+        rows = zlib.compress('\n'.join(room.track_rows).encode('utf-8'))
+        header = HEADER.pack(
+            REPLAY_MAGIC, REPLAY_VERSION, HEADER.size, server.TICK_HZ, self.keyframe_ticks,
+            room.laps_to_win, room.spawn_rotation_deg, self.started_at,
+        )
+        self.write(b''.join([
+            header,
+            encode_text(self.race_id),
+            encode_text(room.room_id),
+            encode_text(room.track_id),
+            encode_text(room.track_name),
+            BLOB_LENGTH.pack(len(rows)),
+            rows,
+        ]))
+
+    def write(self, data: bytes):
+        self.ring.append(data, self.file)
+
+    def write_record(self, tag: bytes, data: bytes):
+        if self.pending_ticks:
+            self.write(b'T' + TICKS.pack(self.pending_ticks))
+            self.pending_ticks = 0
+        self.write(tag + data)
+
+    def record_input(self, slot: int, player):
+        encoded = encode_input(player.input_state)
+        if encoded != self.inputs[slot]:
+            self.inputs[slot] = encoded
+            self.write_record(b'I', INPUT.pack(slot, *encoded))
+
+    def record_tick(self, room):
+        for slot, player in enumerate(self.slots):
+            if player is not None and room.players.get(player.player_id) is not player:
+                self.slots[slot] = None
+                self.write_record(b'L', SLOT.pack(slot))
+
+        joined = False
+        for player in room.players.values():
+            if player.player_id in self.slot_of or len(self.slots) >= MAX_SLOTS:
+                continue
+            slot = len(self.slots)
+            self.slot_of[player.player_id] = slot
+            self.slots.append(player)
+            self.inputs.append(NEUTRAL_INPUT)
+            self.car_ids.append(player.car_id)
+            payload = JOIN.pack(slot, player.is_bot, player.car_id) + encode_text(player.player_id) + encode_text(player.name)
+            self.write_record(b'J', BLOB_LENGTH.pack(len(payload)) + payload)
+            self.summary['cars'].append({'id': player.player_id, 'name': player.name, 'bot': player.is_bot})
+            joined = True
+
+        for slot, player in enumerate(self.slots):
+            if player is None:
+                continue
+            if not player.is_bot:
+                self.record_input(slot, player)
+            if player.car_id != self.car_ids[slot]:
+                self.car_ids[slot] = player.car_id
+                self.write_record(b'C', CAR.pack(slot, player.car_id))
+
+        if joined or self.tick % self.keyframe_ticks == 0:
+            payload = encode_keyframe(self.tick, room, self.slots)
+            self.write_record(b'K', BLOB_LENGTH.pack(len(payload)) + payload)
+        self.pending_ticks += 1
+        self.tick += 1
+        if self.pending_ticks == 0xFFFF:
+            self.flush_ticks()
+        if self.ring.pending >= REPLAY_FLUSH_BYTES:
+            self.ring.drain(self.file)
+
+    def flush_ticks(self):
+        self.write(b'T' + TICKS.pack(self.pending_ticks))
+        self.pending_ticks = 0
+
+    def note_respawn(self, player):
+        # Called from the respawn message, between ticks. The respawn heading
+        # depends on the input at that moment, so that goes first.
+        slot = self.slot_of.get(player.player_id)
+        if slot is None or self.slots[slot] is not player:
+            return
+        self.inputs[slot] = None
+        self.record_input(slot, player)
+        self.write_record(b'R', SLOT.pack(slot))
+        self.inputs[slot] = NEUTRAL_INPUT
+
+    def close(self):
+        try:
+            if self.pending_ticks:
+                self.flush_ticks()
+            self.write(b'E' + END.pack(self.tick))
+            self.ring.drain(self.file)
+        finally:
+            self.file.close()
+        os.replace(self.part_path, self.path)
+        replay_index(self.root).add(dict(
+            self.summary,
+            durationMs=int(self.tick * 1000 / server.TICK_HZ),
+            bytes=self.path.stat().st_size,
+            path=self.path.relative_to(self.root).as_posix(),
+        ))
+        return self.path
+
+
+def describe_replay(replay, path: str) -> dict:
+    # An index line for a replay the index has not seen.
+    return {
+        'raceId': replay.race_id,
+        'roomId': replay.room_id,
+        'trackId': replay.track_id,
+        'trackName': replay.track_name,
+        'lapsToWin': replay.laps_to_win,
+        'startedAt': replay.started_at,
+        'cars': [{'id': car[0], 'name': car[1], 'bot': car[3]} for car in replay.cars],
+        'durationMs': replay.duration_ms,
+        'bytes': len(replay.buffer),
+        'path': path,
+    }
+
+
+class ReplayIndex:
+    # The summaries of the replays under one root, oldest first. Races
+    # append a line as they end and pruning appends a tombstone; the file is
+    # rewritten once dead lines outnumber live ones. Loading also picks up
+    # replays the file does not know about (written before it existed, or
+    # left by a crash between closing and indexing) and forgets missing ones.
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.path = self.root / REPLAY_INDEX_NAME
+        self.lock = threading.Lock()
+        self.entries = None  # race id -> summary
+        self.lines = 0
+
+    def load(self):
+        with self.lock:
+            self.ensure_loaded()
+
+    def ensure_loaded(self):
+        if self.entries is not None:
+            return
+        entries = {}
+        self.lines = 0
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    self.lines += 1
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # a line cut short by a crash
+                    if not isinstance(entry, dict) or not isinstance(entry.get('raceId'), str):
+                        continue
+                    if entry.get('removed'):
+                        entries.pop(entry['raceId'], None)
+                    else:
+                        entries[entry['raceId']] = entry
+        except OSError:
+            pass
+
+        on_disk = {path.relative_to(self.root).as_posix(): path for path in self.root.glob(f'*/*{REPLAY_SUFFIX}')}
+        known = set()
+        for race_id, entry in list(entries.items()):
+            if entry.get('path') in on_disk:
+                known.add(entry['path'])
+            else:
+                del entries[race_id]
+        found = []
+        for relative, path in on_disk.items():
+            if relative in known:
+                continue
+            try:
+                found.append(describe_replay(ReplayFile(path), relative))
+            except (OSError, ReplayError):
+                continue
+        self.entries = {entry['raceId']: entry for entry in sorted([*entries.values(), *found], key=lambda entry: entry['startedAt'])}
+        if found or self.lines != len(self.entries):
+            self.rewrite()
+
+    def add(self, entry: dict):
+        with self.lock:
+            self.ensure_loaded()
+            self.entries.pop(entry['raceId'], None)
+            self.entries[entry['raceId']] = entry
+            lines = [entry]
+            for removed in self.prune():
+                lines.append({'raceId': removed['raceId'], 'removed': True})
+                try:
+                    (self.root / removed['path']).unlink()
+                except OSError:
+                    pass
+            if self.lines + len(lines) > 2 * len(self.entries) + 64:
+                self.rewrite()
+            else:
+                self.append(lines)
+
+    def prune(self) -> list:
+        # Oldest first: past the age limit, past the per-room cap (counted per
+        # room directory), then past the total cap.
+        cutoff = time.time() - REPLAY_MAX_AGE_DAYS * 86400
+        per_room = {}
+        for entry in self.entries.values():
+            room = entry['path'].split('/')[0]
+            per_room[room] = per_room.get(room, 0) + 1
+        total = len(self.entries)
+        removed = []
+        for entry in list(self.entries.values()):
+            room = entry['path'].split('/')[0]
+            if entry['startedAt'] < cutoff or per_room[room] > REPLAY_KEEP_PER_ROOM or total > REPLAY_KEEP_TOTAL:
+                del self.entries[entry['raceId']]
+                per_room[room] -= 1
+                total -= 1
+                removed.append(entry)
+        return removed
+
+    def append(self, lines: list):
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as file:
+                file.write(''.join(json.dumps(line, separators=(',', ':')) + '\n' for line in lines))
+            self.lines += len(lines)
+        except OSError:
+            logger.exception('Could not update the replay index')
+
+    def rewrite(self):
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_name(self.path.name + '.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                file.write(''.join(json.dumps(entry, separators=(',', ':')) + '\n' for entry in self.entries.values()))
+            os.replace(tmp_path, self.path)
+            self.lines = len(self.entries)
+        except OSError:
+            logger.exception('Could not rewrite the replay index')
+
+    def find(self, race_id: str) -> Path | None:
+        with self.lock:
+            self.ensure_loaded()
+            entry = self.entries.get(race_id)
+        return self.root / entry['path'] if entry is not None else None
+
+    def page(self, room_id: str | None = None, offset: int = 0, limit: int = REPLAY_LIST_LIMIT) -> tuple:
+        # Newest first; returns the page and the number of matching replays.
+        with self.lock:
+            self.ensure_loaded()
+            entries = [entry for entry in reversed(self.entries.values()) if room_id is None or entry['roomId'] == room_id]
+        return [{key: value for key, value in entry.items() if key != 'path'} for entry in entries[offset:offset + limit]], len(entries)
+
+
+REPLAY_INDEXES = {}
+REPLAY_INDEXES_LOCK = threading.Lock()
+
+
+def replay_index(root: Path | None = None) -> ReplayIndex:
+    root = Path(root or REPLAY_DIR)
+    with REPLAY_INDEXES_LOCK:
+        index = REPLAY_INDEXES.get(root)
+        if index is None:
+            index = REPLAY_INDEXES[root] = ReplayIndex(root)
+        return index
+
+
+def start_recording(room):
+    room.recorder = None
+    if room.headless:
+        return
+    try:
+        room.recorder = ReplayRecorder(room)
+    except OSError:
+        logger.exception('Could not start a replay for room %s', room.room_id)
+
+
+def record_tick(room):
+    recorder = room.recorder
+    if recorder is None:
+        return
+    try:
+        recorder.record_tick(room)
+    except OSError:
+        logger.exception('Replay for room %s failed; recording stopped', room.room_id)
+        abandon_recording(room)
+
+
+def note_respawn(room, player):
+    recorder = room.recorder
+    if recorder is None:
+        return
+    try:
+        recorder.note_respawn(player)
+    except OSError:
+        logger.exception('Replay for room %s failed; recording stopped', room.room_id)
+        abandon_recording(room)
+
+
+def finish_recording(room):
+    recorder = room.recorder
+    if recorder is None:
+        return None
+    room.recorder = None
+    try:
+        path = recorder.close()
+    except OSError:
+        logger.exception('Could not finish the replay for room %s', room.room_id)
+        return None
+    room.last_replay_id = recorder.race_id
+    return path
+
+
+def abandon_recording(room):
+    recorder = room.recorder
+    room.recorder = None
+    try:
+        recorder.file.close()
+        recorder.part_path.unlink()
+    except OSError:
+        pass
+
+
+def find_replay(race_id: str, directory: Path | None = None):
+    if not RACE_ID_PATTERN.match(race_id):
+        return None
+    return replay_index(directory).find(race_id)
+
+
+class ReplayFile:
+    # A finished replay, mapped read-only. Opening it scans the records once
+    # for the car table and the keyframe offsets; a truncated tail (a crash
+    # mid-race) just ends the replay early.
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, 'rb') as file:
+            try:
+                self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise ReplayError(f'{path} is empty') from None
+        view = memoryview(self.buffer)
+        if len(view) < HEADER.size:
+            raise ReplayError('Replay is truncated')
+        (magic, version, header_size, self.tick_hz, self.keyframe_ticks, self.laps_to_win,
+         self.spawn_rotation_deg, self.started_at) = HEADER.unpack_from(view)
+        if magic != REPLAY_MAGIC:
+            raise ReplayError('Not a replay')
+        if version > REPLAY_VERSION:
+            raise ReplayError(f'Unsupported replay version {version}')
+
+        try:
+            offset = header_size
+            self.race_id, offset = self.read_text(view, offset)
+            self.room_id, offset = self.read_text(view, offset)
+            self.track_id, offset = self.read_text(view, offset)
+            self.track_name, offset = self.read_text(view, offset)
+            (length,) = BLOB_LENGTH.unpack_from(view, offset)
+            offset += BLOB_LENGTH.size
+            self.rows = zlib.decompress(view[offset:offset + length]).decode('utf-8').split('\n')
+        except (struct.error, zlib.error, UnicodeDecodeError):
+            raise ReplayError('Replay header is corrupt') from None
+        self.body_offset = offset + length
+
+        self.cars = []  # (player id, name, car id, bot) per slot
+        self.keyframes = []  # (tick, record offset)
+        self.ticks = 0
+        self.complete = False
+        for tag, payload, record_offset in self.records(self.body_offset):
+            if tag == b'T':
+                self.ticks += TICKS.unpack_from(payload)[0]
+            elif tag == b'J':
+                slot, bot, car_id = JOIN.unpack_from(payload)
+                player_id, end = self.read_text(payload, JOIN.size)
+                name, _ = self.read_text(payload, end)
+                self.cars.append((player_id, name, car_id, bool(bot)))
+            elif tag == b'K':
+                self.keyframes.append((KEY_HEADER.unpack_from(payload)[0], record_offset))
+            elif tag == b'E':
+                self.ticks = END.unpack_from(payload)[0]
+                self.complete = True
+        if not self.keyframes:
+            raise ReplayError('Replay has no keyframes')
+
+    @staticmethod
+    def read_text(view, offset: int):
+        (length,) = TEXT_LENGTH.unpack_from(view, offset)
+        offset += TEXT_LENGTH.size
+        return bytes(view[offset:offset + length]).decode('utf-8'), offset + length
+
+    def records(self, offset: int):
+        # Yields (tag, payload, offset of the record).
+        view = memoryview(self.buffer)
+        end = len(view)
+        sizes = {b'T': TICKS.size, b'I': INPUT.size, b'R': SLOT.size, b'C': CAR.size, b'L': SLOT.size, b'E': END.size}
+        while offset < end:
+            tag = bytes(view[offset:offset + 1])
+            start = offset + 1
+            if tag in (b'J', b'K'):
+                if start + BLOB_LENGTH.size > end:
+                    return
+                (size,) = BLOB_LENGTH.unpack_from(view, start)
+                start += BLOB_LENGTH.size
+            elif tag in sizes:
+                size = sizes[tag]
+            else:
+                raise ReplayError(f'Unknown replay record {tag!r} at byte {offset}')
+            if start + size > end:
+                return
+            yield tag, view[start:start + size], offset
+            offset = start + size
+
+    @property
+    def duration_ms(self) -> int:
+        return int(self.ticks * 1000 / self.tick_hz)
+
+
+def simulate_tick(room, dt: float):
+    # The racing part of room_tick_loop, in the same order.
+    players = list(room.players.values())
+    server.drive_bots(room, [player for player in players if player.is_bot])
+    for player in players:
+        if not player.asleep:
+            server.step_player_physics(room, player, dt)
+    server.solve_car_collisions(players)
+    server.update_laps_and_finish(room, dt)
+    server.update_sleep_states(room)
+    room.tick += 1
+
+
+class ReplayPlayer:
+    # Re-simulates a ReplayFile on a headless room. seek() restores the
+    # nearest keyframe at or before the target and simulates forward from
+    # there, so any tick is at most keyframe_ticks of physics away.
+    def __init__(self, replay: ReplayFile):
+        self.replay = replay
+        self.dt = 1.0 / replay.tick_hz
+        room = server.RoomState(room_id=f'replay-{replay.race_id}', headless=True)
+        server.set_room_track(room, replay.track_id, replay.rows, replay.track_name, replay.spawn_rotation_deg)
+        room.track_sectors, room.progress_field, room.flow_field = server.build_track_geometry(tuple(room.track_rows), room.spawn_rotation_deg)
+        room.laps_to_win = replay.laps_to_win
+        self.room = room
+        self.cars = []
+        for player_id, name, car_id, bot in replay.cars:
+            player = server.PlayerState(
+                player_id=player_id,
+                name=name,
+                x=room.spawn_x,
+                y=room.spawn_y,
+                rotation_deg=room.spawn_rotation_deg,
+                websocket=None,
+                ready=True,
+                bot=server.BotState() if bot else None,
+            )
+            server.set_player_car(player, car_id)
+            self.cars.append(player)
+        self.records = None
+        self.tick = 0
+        self.ticks_left = 0
+        self.ended = False
+        self.snap = True  # apply keyframes met during playback
+        self.seek(0)
+
+    @property
+    def finished(self) -> bool:
+        return self.ended or self.tick >= self.replay.ticks
+
+    def seek(self, tick: int):
+        tick = max(0, min(self.replay.ticks, tick))
+        if self.records is None or tick < self.tick or tick - self.tick > self.replay.keyframe_ticks:
+            key_tick, offset = self.replay.keyframes[0]
+            for candidate in self.replay.keyframes:
+                if candidate[0] > tick:
+                    break
+                key_tick, offset = candidate
+            if self.records is None or tick < self.tick or key_tick > self.tick:
+                self.records = self.replay.records(offset)
+                self.ticks_left = 0
+                self.ended = False
+                self.room.progress_times.clear()
+                self.room.standings = []
+                self.read_record()
+        self.advance(tick - self.tick)
+
+    def advance(self, ticks: int):
+        while ticks > 0 and not self.ended:
+            if self.ticks_left == 0:
+                self.read_record()
+                continue
+            simulate_tick(self.room, self.dt)
+            self.ticks_left -= 1
+            self.tick += 1
+            ticks -= 1
+
+    def read_record(self):
+        record = next(self.records, None)
+        if record is None:
+            self.ended = True
+            return
+        tag, payload, _ = record
+        room = self.room
+        if tag == b'T':
+            self.ticks_left = TICKS.unpack_from(payload)[0]
+        elif tag == b'I':
+            slot, flags, throttle, brake, steer = INPUT.unpack_from(payload)
+            player = self.cars[slot]
+            player.input_state = decode_input(flags, throttle, brake, steer)
+            if not server.input_is_neutral(player.input_state):
+                server.wake_player(player)
+        elif tag == b'R':
+            player = self.cars[SLOT.unpack_from(payload)[0]]
+            server.respawn_player_on_track_center(room, player)
+            server.wake_player(player)
+        elif tag == b'C':
+            slot, car_id = CAR.unpack_from(payload)
+            server.set_player_car(self.cars[slot], car_id)
+            server.wake_player(self.cars[slot])
+        elif tag == b'L':
+            room.players.pop(self.cars[SLOT.unpack_from(payload)[0]].player_id, None)
+        elif tag == b'K':
+            if self.snap:
+                self.tick = apply_keyframe(room, payload, self.cars)
+            else:
+                # Cars that joined mid-race are only in the keyframes.
+                apply_keyframe(room, payload, self.cars, joined_only=True)
+        elif tag == b'E':
+            self.ended = True
+
+    def frame(self, now: float, speed: float, paused: bool) -> str:
+        # A spectator-style state frame, so the client renders it unchanged.
+        room = self.room
+        room.race_start_time = now - room.race_clock
+        header = server.room_state_header(room, now, False)
+        replay_payload = {
+            'raceId': self.replay.race_id,
+            'positionMs': int(self.tick * 1000 / self.replay.tick_hz),
+            'durationMs': self.replay.duration_ms,
+            'speed': speed,
+            'paused': paused,
+        }
+        return ''.join(
+            [
+                header,
+                ',"snapshotHz":',
+                str(REPLAY_FRAME_HZ),
+                ',"roster":',
+                json.dumps(list(room.players.keys()), separators=server.JSON_SEPARATORS),
+                ',"players":[',
+                ','.join(server.encoded_player_entry(p) for p in room.players.values()),
+                '],"replay":',
+                json.dumps(replay_payload, separators=server.JSON_SEPARATORS),
+                '}',
+            ]
+        )
+
+
+def open_replay(race_id: str):
+    path = find_replay(race_id)
+    if path is None:
+        return None
+    return ReplayPlayer(ReplayFile(path))
+
+
+async def serve_replay(websocket: WebSocket, race_id: str):
+    # Streams a replay to one client at REPLAY_FRAME_HZ. The client steers
+    # it with {'type': 'replay_control', 'speed': 1..8, 'paused': bool,
+    # 'seekMs': ms}; any of the three may be left out.
+    try:
+        player = await asyncio.to_thread(open_replay, race_id)
+    except (OSError, ReplayError) as exc:
+        logger.warning('Could not open replay %s: %s', race_id, exc)
+        player = None
+    if player is None:
+        await server.safe_send_json(websocket, {'type': 'error', 'message': 'Replay not found.'})
+        try:
+            await websocket.close(code=1008)
+        except Exception:
+            pass
+        return
+
+    replay = player.replay
+    room = player.room
+    await server.safe_send_json(
+        websocket,
+        {
+            'type': 'welcome',
+            'spectator': True,
+            'playerId': None,
+            'roomId': replay.room_id,
+            'map': server.room_map_payload(room),
+            'tracks': server.available_tracks_payload(),
+            'cars': server.WEB_CAR_MODELS,
+            'replay': {'raceId': replay.race_id, 'durationMs': replay.duration_ms, 'startedAt': replay.started_at},
+        },
+    )
+
+    control = {'speed': 1, 'paused': False, 'seek': None}
+    stream = asyncio.create_task(stream_replay(websocket, player, control))
+    try:
+        while True:
+            raw = await websocket.receive_text()
+            server.count_inbound('replay', len(raw))
+            try:
+                message = json.loads(raw)
+            except ValueError:
+                continue
+            if not isinstance(message, dict) or message.get('type') != 'replay_control':
+                continue
+            if 'speed' in message:
+                control['speed'] = max(1, min(REPLAY_MAX_SPEED, int(server.safe_float(message['speed'], 1))))
+            if 'paused' in message:
+                control['paused'] = bool(message['paused'])
+            if 'seekMs' in message:
+                control['seek'] = int(server.safe_float(message['seekMs'], 0.0) * replay.tick_hz / 1000.0)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        stream.cancel()
+
+
+async def stream_replay(websocket: WebSocket, player: ReplayPlayer, control: dict):
+    interval = 1.0 / REPLAY_FRAME_HZ
+    ticks_per_frame = player.replay.tick_hz / REPLAY_FRAME_HZ
+    carry = 0.0
+    next_frame = time.perf_counter()
+    while True:
+        if control['seek'] is not None:
+            player.seek(control['seek'])
+            control['seek'] = None
+            carry = 0.0
+        elif not control['paused'] and not player.finished:
+            carry += ticks_per_frame * control['speed']
+            ticks = int(carry)
+            carry -= ticks
+            player.advance(ticks)
+        frame = player.frame(server.now_seconds(), control['speed'], control['paused'] or player.finished)
+        server.count_outbound('replay_state', len(frame))
+        await server.safe_send_text(websocket, frame)
+
+        next_frame += interval
+        delay = next_frame - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        else:
+            next_frame = time.perf_counter()
+
+
+def list_replays(room_id: str | None = None, directory: Path | None = None, offset: int = 0, limit: int | None = None) -> dict:
+    offset = max(0, offset)
+    limit = max(1, min(REPLAY_LIST_MAX, limit or REPLAY_LIST_LIMIT))
+    replays, total = replay_index(directory).page(room_id, offset, limit)
+    return {'replays': replays, 'total': total, 'offset': offset, 'limit': limit}
+
+
+def resolve_replay_path(value: str) -> Path:
+    path = find_replay(value)
+    return path if path is not None else Path(value)
+
+
+def command_list(args):
+    for entry in list_replays(args.room, limit=args.limit)['replays']:
+        started = time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['startedAt']))
+        print(f"{entry['raceId']}  {entry['roomId']:<16} {entry['trackName']:<20} {started}  {entry['durationMs'] / 1000:7.1f}s  {len(entry['cars'])} cars  {entry['bytes']}B")
+
+
+def command_show(args):
+    replay = ReplayFile(resolve_replay_path(args.replay))
+    started = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(replay.started_at))
+    print(f'{replay.race_id}: room {replay.room_id}, {replay.track_name} ({replay.track_id}), {replay.laps_to_win} laps, started {started}')
+    print(f'{replay.ticks} ticks at {replay.tick_hz} Hz ({replay.duration_ms / 1000:.1f}s), {len(replay.keyframes)} keyframes, {len(replay.buffer)} bytes{"" if replay.complete else ", incomplete"}')
+    for slot, (player_id, name, car_id, bot) in enumerate(replay.cars):
+        print(f'  {slot:>3} {player_id} {name} car {car_id}{" bot" if bot else ""}')
+
+
+def command_verify(args):
+    # Plays the whole race without snapping to keyframes and reports how far
+    # the re-simulation drifts from each one.
+    replay = ReplayFile(resolve_replay_path(args.replay))
+    player = ReplayPlayer(replay)
+    player.snap = False
+    reference = ReplayPlayer(replay)
+    worst = 0.0
+    for key_tick, _ in replay.keyframes[1:]:
+        started = player.tick
+        player.advance(key_tick - player.tick)
+        reference.seek(key_tick)
+        drift = max(
+            (math.hypot(car.x - ref.x, car.y - ref.y) for car, ref in zip(player.cars, reference.cars) if car.player_id in player.room.players),
+            default=0.0,
+        )
+        worst = max(worst, drift)
+        if args.verbose:
+            print(f'tick {key_tick:>6}: drift {drift:.6f} px over {key_tick - started} ticks')
+    print(f'{len(replay.keyframes)} keyframes, worst drift {worst:.6f} px')
+    return worst
+
+
+def main():
+    parser = argparse.ArgumentParser(description='List, inspect and verify ChunkyDrift race replays.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    list_parser = subparsers.add_parser('list', help='list stored replays, newest first')
+    list_parser.add_argument('room', nargs='?')
+    list_parser.add_argument('--limit', type=int, default=REPLAY_LIST_MAX)
+    list_parser.set_defaults(handler=command_list)
+
+    show_parser = subparsers.add_parser('show', help='print a replay header and its cars')
+    show_parser.add_argument('replay', help='race id or path')
+    show_parser.set_defaults(handler=command_show)
+
+    verify_parser = subparsers.add_parser('verify', help='re-simulate a replay and compare it with its keyframes')
+    verify_parser.add_argument('replay', help='race id or path')
+    verify_parser.add_argument('--verbose', action='store_true')
+    verify_parser.set_defaults(handler=command_verify)
+
+    args = parser.parse_args()
+    try:
+        args.handler(args)
+    except (OSError, ReplayError) as exc:
+        sys.exit(f'Error: {exc}')
+
+
+if __name__ == '__main__':
+    main()
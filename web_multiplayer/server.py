@@ -1,17 +1,40 @@
 import asyncio
 import json
+import logging
 import math
+import os
+import secrets
+import threading
 import time
 import uuid
+from collections import deque
+from contextlib import asynccontextmanager
 from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Dict, List
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.responses import FileResponse
+IMPORT_STARTED_AT = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 
-from settings import BRANDS_HATCH_MAP, CAR_MODELS, GAME_MAP, TILESIZE
+try:
+    from watchfiles import awatch
+except ModuleNotFoundError:
+    awatch = None
+
+from track_data import BRANDS_HATCH_MAP, CAR_MODELS, GAME_MAP, TILESIZE
+from track_geometry import FlowField, ProgressField, TrackSectors, flow_field_for, progress_field_for, track_sectors_for
+from track_pack import NO_ROAD, load_pack
+from web_multiplayer.ghosts import GHOST_SAMPLE_TICKS, GhostStore
+from web_multiplayer.heatmaps import HeatmapStore
+from web_multiplayer.metrics import MetricsRegistry
+from web_multiplayer.profiler import SamplingProfiler
+from web_multiplayer import replay, verification
+from web_multiplayer.event_log import EventLog
+from web_multiplayer.tracing import tracer_from_env
+from web_multiplayer.track_store import TrackStore, track_hash
 
 
 ROAD_TILES = {'.', 'P', 'F', 'C'}
@@ -23,8 +46,49 @@ LEADERBOARD_PUSH_INTERVAL_SECONDS = 0.5
 CUSTOM_TRACK_ID = 'custom'
 ALLOWED_MAP_TILES = ROAD_TILES | {'1', 'W'}
 CUSTOM_TRACKS_FILE = Path(__file__).parent / 'custom_tracks.json'
+TRACK_STORE_DIR = Path(__file__).parent / 'tracks'
+GHOST_DIR = Path(__file__).parent / 'ghosts'
+EVENT_LOG_DIR = Path(__file__).parent / 'events'
+HEATMAP_DIR = Path(__file__).parent / 'heatmaps'
+HEATMAP_FLUSH_SECONDS = 30.0
+HEATMAP_SPEED_SAMPLE_TICKS = 6
+TRACK_CACHE_SIZE = 64
+TRACK_POLL_SECONDS = 2.0
 DEFAULT_SPAWN_ROTATION_DEG = 90.0
 SPAWN_Y_OFFSET = 4.0
+INTEREST_NEAR_RADIUS = 30 * TILESIZE
+INTEREST_FAR_INTERVAL_TICKS = 4
+INTEREST_SUMMARY_INTERVAL_TICKS = 15
+SNAPSHOT_BYTE_BUDGET = 4096
+PROGRESS_BUCKETS_PER_LAP = 200
+MAX_BOTS_PER_ROOM = 7
+BOT_STEER_GAIN = 2.5  # steer per radian of heading error
+BOT_BRAKE_ANGLE = 0.9  # radians of heading error above which a fast bot lifts and brakes
+BOT_BRAKE_SPEED = 220.0
+BOT_STUCK_SPEED = 12.0
+BOT_REVERSE_AFTER_TICKS = TICK_HZ // 3  # this long below BOT_STUCK_SPEED: back out
+BOT_REVERSE_TICKS = TICK_HZ // 2
+BOT_STUCK_TICKS = 3 * TICK_HZ  # this long without reaching a new progress bucket: respawn
+SNAPSHOT_RATE_TIERS_HZ = (60, 30, 20, 10)
+SNAPSHOT_RTT_TIER_LIMITS_MS = (90.0, 180.0, 300.0)
+SNAPSHOT_RATE_RECOVERY_SENDS = 120
+SPECTATOR_SNAPSHOT_HZ = 10
+SPECTATOR_DELAY_SECONDS = 2.0
+SLEEP_SPEED_THRESHOLD = 3.0
+INPUT_AXIS_STEPS = 1000  # analog inputs are kept to this resolution so replays store them exactly
+GOVERNOR_SAMPLE_INTERVAL_SECONDS = 0.1
+GOVERNOR_LEVEL_LAG_MS = (12.0, 25.0, 40.0, 70.0)
+GOVERNOR_RECOVERY_SECONDS = 5.0
+GOVERNOR_LEVEL_NAMES = ('normal', 'lobby_throttled', 'spectators_throttled', 'distant_cars_throttled', 'refusing_rooms')
+GOVERNOR_LOBBY_INTERVAL_TICKS = 6
+GOVERNOR_SPECTATOR_RATE_DIVISOR = 2
+GOVERNOR_FAR_INTERVAL_MULTIPLIER = 2
+
+ADMIN_TOKEN = os.environ.get('CHUNKYDRIFT_ADMIN_TOKEN', '')
+PROFILE_DEFAULT_INTERVAL_MS = 5.0
+
+logger = logging.getLogger('uvicorn.error')
+JSON_SEPARATORS = (',', ':')
 
 PRESET_TRACKS = {
     'brands_hatch': {
@@ -42,29 +106,31 @@ PRESET_TRACKS = {
 }
 
 
+TRACK_STORE = TrackStore(TRACK_STORE_DIR, TRACK_CACHE_SIZE)
+GHOST_STORE = GhostStore(GHOST_DIR)
+GHOST_WRITES = set()  # in-flight GHOST_STORE.offer tasks
+EVENT_LOG = EventLog(EVENT_LOG_DIR)
+HEATMAPS = HeatmapStore(HEATMAP_DIR)
+
+
 def load_persisted_tracks() -> dict:
-    if not CUSTOM_TRACKS_FILE.exists():
-        return {}
-    try:
-        with open(CUSTOM_TRACKS_FILE, 'r', encoding='utf-8') as file:
-            data = json.load(file)
-        items = data.get('tracks', []) if isinstance(data, dict) else []
-    except Exception:
-        return {}
+    # Only the index is read here. Track bodies are loaded and validated by
+    # resolve_track the first time a track is picked.
+    TRACK_STORE.migrate_from_json(CUSTOM_TRACKS_FILE)
+    return read_track_index()
+
 
+def read_track_index() -> dict:
     loaded = {}
-    for item in items:
-        track_id = str(item.get('id', '')).strip()
-        track_name = str(item.get('name', track_id)).strip() or track_id
-        rows = normalize_map_rows(item.get('rows', []))
-        is_valid, _, validated_rows = validate_map_rows(rows)
-        if not is_valid:
+    for entry in TRACK_STORE.list_entries():
+        track_id = str(entry.get('id', '')).strip()
+        if not track_id or not entry.get('hash'):
             continue
         loaded[track_id] = {
             'id': track_id,
-            'name': track_name,
-            'rows': validated_rows,
-            'spawnRotationDeg': normalize_spawn_rotation(item.get('spawnRotationDeg', DEFAULT_SPAWN_ROTATION_DEG)),
+            'name': str(entry.get('name', track_id)).strip() or track_id,
+            'hash': entry['hash'],
+            'spawnRotationDeg': normalize_spawn_rotation(entry.get('spawnRotationDeg', DEFAULT_SPAWN_ROTATION_DEG)),
         }
     return loaded
 
@@ -141,7 +207,66 @@ def validate_map_rows(rows: List[str]):
 
 
 TRACK_LIBRARY = {**PRESET_TRACKS, **load_persisted_tracks()}
-DEFAULT_TRACK = TRACK_LIBRARY.get('brands_hatch', next(iter(TRACK_LIBRARY.values())))
+TRACK_LIBRARY_VERSION = 0  # bumped when a reload changes the track list
+
+
+VALIDATED_TRACK_HASHES = set()
+
+
+def resolve_track(track_id: str):
+    # Presets carry their rows; stored tracks are fetched through the store's
+    # LRU and validated once per content hash.
+    track = TRACK_LIBRARY.get(track_id)
+    if track is None or 'hash' not in track:
+        return track
+    rows = TRACK_STORE.load_rows(track['hash'])
+    if rows is not None and track['hash'] not in VALIDATED_TRACK_HASHES:
+        is_valid, _, validated_rows = validate_map_rows(rows)
+        if is_valid and validated_rows == rows:
+            VALIDATED_TRACK_HASHES.add(track['hash'])
+        else:
+            rows = None
+    if rows is None:
+        logger.warning('Dropping unreadable or invalid stored track %s', track_id)
+        TRACK_LIBRARY.pop(track_id, None)
+        return None
+    return {**track, 'rows': rows}
+
+
+async def persist_custom_track(rows: List[str], name: str, spawn_rotation_deg: float) -> dict:
+    # Uploads are keyed by content, so re-hosting the same map reuses its
+    # entry instead of adding another one.
+    track_id = f'{CUSTOM_TRACK_ID}_{track_hash(rows)[:12]}'
+    existing = TRACK_LIBRARY.get(track_id)
+    if existing is not None:
+        return existing
+    entry = await asyncio.to_thread(TRACK_STORE.save_track, track_id, name, rows, spawn_rotation_deg)
+    VALIDATED_TRACK_HASHES.add(entry['hash'])
+    track = {
+        'id': track_id,
+        'name': name,
+        'hash': entry['hash'],
+        'spawnRotationDeg': normalize_spawn_rotation(spawn_rotation_deg),
+    }
+    TRACK_LIBRARY[track_id] = track
+    return track
+
+
+# A stored track can override a preset id (the editor saves edits to
+# Brands Hatch under its own id).
+DEFAULT_TRACK = resolve_track('brands_hatch') or PRESET_TRACKS['brands_hatch']
+
+
+def preset_nearest_road(track_id: str, rows: List[str]):
+    # Preset packs carry a precomputed nearby-road layer. It only applies
+    # while the rows are exactly the packed ones (a stored track may override
+    # a preset id).
+    if track_id not in PRESET_TRACKS:
+        return None
+    pack = load_pack(track_id)
+    return pack.nearest_road if pack.rows == rows else None
+
+
 DEFAULT_SPAWN_X, DEFAULT_SPAWN_Y = find_spawn(DEFAULT_TRACK['rows'])
 
 
@@ -183,6 +308,14 @@ class InputState:
     steer: float = 0.0
 
 
+@dataclass
+class BotState:
+    slow_ticks: int = 0
+    reverse_ticks: int = 0
+    idle_ticks: int = 0
+    best_bucket: int = -1
+
+
 @dataclass
 class PlayerState:
     player_id: str
@@ -190,47 +323,220 @@ class PlayerState:
     x: float
     y: float
     rotation_deg: float
-    websocket: WebSocket
+    websocket: WebSocket | None  # None for server bots
     car_id: int = 0
+    bot: BotState | None = None  # set for server bots
     color: str = '#3B82F6'
     ready: bool = False
     finished: bool = False
     laps: int = 0
-    checkpoint_passed: bool = False
+    next_sector: int = 0  # index into the room's TrackSectors gates
+    lap_splits: List[int] = field(default_factory=list)  # ms from lap start at each gate this lap
+    best_lap_splits: List[int] = field(default_factory=list)
     last_finish_cross_time: float = 0.0
     lap_start_time: float = 0.0
     best_lap_time: float = 0.0
     race_total_time: float = 0.0
+    lap_progress: float = 0.0
+    progress_bucket: int = -1
+    lap_check_position: tuple | None = None  # where the last lap check left the car
+    ghost_trace: List[float] = field(default_factory=list)  # this lap's x, y, rotation every GHOST_SAMPLE_TICKS
+    ghost_offset: float = 0.0  # seconds from the lap start to the trace's first sample
+    wants_ghost: bool = False
+    ghost_sent: bool = False  # the track ghost goes out once per race
+    wall_hit_tick: int = -2  # last tick the car was against a wall
     input_state: InputState = field(default_factory=InputState)
     vx: float = 0.0
     vy: float = 0.0
     grip_state: float = 1.0
+    asleep: bool = False
+    sleep_tick: int = 0
+    cached_entry: str | None = None
+    interest_priority: Dict[str, float] = field(default_factory=dict)
+    entry_sent_tick: Dict[str, int] = field(default_factory=dict)
+    roster_version_sent: int = -1
+    last_summary_tick: int = -INTEREST_SUMMARY_INTERVAL_TICKS
+    rtt_ms: float = 0.0
+    send_latency_ms: float = 0.0
+    send_task: asyncio.Task | None = None
+    send_started_at: float = 0.0
+    snapshot_tier: int = 0
+    backlog_penalty: int = 0
+    clean_sends: int = 0
+    skipped_snapshots: int = 0
+
+    @property
+    def is_bot(self) -> bool:
+        return self.bot is not None
+
+
+@dataclass
+class SpectatorState:
+    spectator_id: str
+    websocket: WebSocket
+    send_task: asyncio.Task | None = None
 
 
 @dataclass
 class RoomState:
     room_id: str
     players: Dict[str, PlayerState] = field(default_factory=dict)
+    spectators: Dict[str, SpectatorState] = field(default_factory=dict)
+    spectator_frames: deque = field(default_factory=deque)
+    track_sectors: TrackSectors | None = None
+    progress_field: ProgressField | None = None
+    flow_field: FlowField | None = None
+    recorder: 'replay.ReplayRecorder | None' = None  # the running race's replay
+    last_replay_id: str | None = None
+    race_id: str | None = None  # the running race's id in replays and the event log
+    leaderboard_claim: dict | None = None  # the first human home, waiting on the race's replay to be verified
+    headless: bool = False  # racing_env rooms: results never reach the global leaderboard
+    progress_times: Dict[int, float] = field(default_factory=dict)
+    standings: List[list] = field(default_factory=list)
+    last_spectator_leaderboard_time: float = 0.0
     tick_task: asyncio.Task | None = None
+    tick: int = 0
+    roster_version: int = 0
+    tick_cost_ms: float = 0.0
+    bytes_sent: int = 0
     phase: str = 'lobby'  # lobby | countdown | racing | finished
     countdown_end_time: float = 0.0
     race_start_time: float = 0.0
+    race_clock: float = 0.0  # simulated seconds since the start, advanced one tick at a time
     laps_to_win: int = 3
     winner_id: str | None = None
     last_leaderboard_push_time: float = 0.0
     track_id: str = DEFAULT_TRACK['id']
     track_name: str = DEFAULT_TRACK['name']
     track_rows: List[str] = field(default_factory=lambda: list(DEFAULT_TRACK['rows']))
+    track_hash: str = ''  # of track_rows, set at the countdown
     track_width_tiles: int = len(DEFAULT_TRACK['rows'][0])
     track_height_tiles: int = len(DEFAULT_TRACK['rows'])
     spawn_x: float = DEFAULT_SPAWN_X
     spawn_y: float = DEFAULT_SPAWN_Y
     spawn_rotation_deg: float = normalize_spawn_rotation(DEFAULT_TRACK.get('spawnRotationDeg', DEFAULT_SPAWN_ROTATION_DEG))
+    nearest_road: memoryview | None = field(default_factory=lambda: preset_nearest_road(DEFAULT_TRACK['id'], DEFAULT_TRACK['rows']))
+    track_library_version: int = field(default_factory=lambda: TRACK_LIBRARY_VERSION)  # the track list its clients were last sent
 
 
 ROOMS: Dict[str, RoomState] = {}
 
 
+@dataclass
+class GovernorState:
+    level: int = 0
+    lag_ms: float = 0.0
+    max_lag_ms: float = 0.0
+    level_changes: int = 0
+    calm_since: float = 0.0
+    refused_rooms: int = 0
+
+
+GOVERNOR = GovernorState()
+PROFILER_LOCK = asyncio.Lock()
+
+TRACER = tracer_from_env()
+TRACE_MAX_SECONDS = 60.0
+
+INBOUND_MESSAGE_TYPES = {'input', 'garage', 'ghost', 'set_track', 'set_bots', 'start_race', 'reset_lobby', 'respawn', 'ping'}
+
+METRICS = MetricsRegistry()
+TICK_PHASE_SECONDS = METRICS.histogram(
+    'chunkydrift_tick_phase_seconds',
+    'Time spent in each phase of a room tick.',
+    ('phase',),
+)
+TICK_LATENESS_SECONDS = METRICS.histogram(
+    'chunkydrift_tick_lateness_seconds',
+    'How late a room tick started compared to its schedule.',
+)
+MESSAGES_TOTAL = METRICS.counter(
+    'chunkydrift_messages_total',
+    'Websocket messages by direction and type.',
+    ('direction', 'type'),
+)
+MESSAGE_BYTES_TOTAL = METRICS.counter(
+    'chunkydrift_message_bytes_total',
+    'Websocket payload bytes by direction and type.',
+    ('direction', 'type'),
+)
+LEADERBOARD_SUBMISSIONS_TOTAL = METRICS.counter(
+    'chunkydrift_leaderboard_submissions_total',
+    'Global leaderboard claims by verification result.',
+    ('result',),
+)
+SKIPPED_SNAPSHOTS_TOTAL = METRICS.counter(
+    'chunkydrift_skipped_snapshots_total',
+    'Snapshots dropped because the previous send to that client was still in flight.',
+)
+METRICS.gauge('chunkydrift_rooms', 'Active rooms.', collect=lambda: {(): len(ROOMS)})
+METRICS.gauge(
+    'chunkydrift_players',
+    'Connected players by sleep state.',
+    ('state',),
+    collect=lambda: {
+        ('awake',): sum(1 for room in ROOMS.values() for p in room.players.values() if not p.asleep),
+        ('asleep',): sum(1 for room in ROOMS.values() for p in room.players.values() if p.asleep),
+    },
+)
+METRICS.gauge(
+    'chunkydrift_spectators',
+    'Connected spectators.',
+    collect=lambda: {(): sum(len(room.spectators) for room in ROOMS.values())},
+)
+METRICS.gauge(
+    'chunkydrift_room_tick_cost_seconds',
+    'Smoothed tick cost per active room.',
+    ('room',),
+    collect=lambda: {(room.room_id,): room.tick_cost_ms / 1000.0 for room in ROOMS.values()},
+)
+METRICS.gauge(
+    'chunkydrift_room_sent_bytes',
+    'Bytes pushed to clients by each active room since it was created.',
+    ('room',),
+    collect=lambda: {(room.room_id,): room.bytes_sent for room in ROOMS.values()},
+)
+METRICS.gauge(
+    'chunkydrift_leaderboard_verifications_pending',
+    'Leaderboard claims waiting on re-simulation.',
+    collect=lambda: {(): len(verification.VERIFY_TASKS)},
+)
+METRICS.gauge('chunkydrift_governor_level', 'Overload governor level (0 = normal).', collect=lambda: {(): GOVERNOR.level})
+METRICS.gauge(
+    'chunkydrift_event_loop_lag_seconds',
+    'Smoothed event loop wakeup lag.',
+    collect=lambda: {(): GOVERNOR.lag_ms / 1000.0},
+)
+METRICS.gauge(
+    'chunkydrift_governor_level_changes',
+    'Overload governor state transitions since start.',
+    collect=lambda: {(): GOVERNOR.level_changes},
+)
+METRICS.gauge(
+    'chunkydrift_governor_refused_rooms',
+    'Room creations refused by the overload governor since start.',
+    collect=lambda: {(): GOVERNOR.refused_rooms},
+)
+
+
+def room_trace_track(room: 'RoomState') -> str:
+    return f'room {room.room_id}'
+
+
+def count_outbound(msg_type: str, size: int, room: 'RoomState | None' = None):
+    key = ('out', msg_type)
+    MESSAGES_TOTAL.inc(key)
+    MESSAGE_BYTES_TOTAL.inc(key, size)
+    if room is not None:
+        room.bytes_sent += size
+
+
+def count_inbound(msg_type, size: int):
+    key = ('in', msg_type if msg_type in INBOUND_MESSAGE_TYPES else 'other')
+    MESSAGES_TOTAL.inc(key)
+    MESSAGE_BYTES_TOTAL.inc(key, size)
+
+
 def available_tracks_payload():
     tracks = sorted(TRACK_LIBRARY.values(), key=lambda track: track['name'].lower())
     return [
@@ -247,6 +553,7 @@ def set_room_track(room: RoomState, track_id: str, rows: List[str], track_name:
     room.track_id = track_id
     room.track_name = track_name
     room.track_rows = list(rows)
+    room.nearest_road = preset_nearest_road(track_id, room.track_rows)
     room.track_width_tiles = len(rows[0])
     room.track_height_tiles = len(rows)
     room.spawn_x, room.spawn_y = find_spawn(rows)
@@ -255,25 +562,48 @@ def set_room_track(room: RoomState, track_id: str, rows: List[str], track_name:
     room.winner_id = None
     room.last_leaderboard_push_time = 0.0
     for index, player in enumerate(room.players.values()):
-        player.ready = False
+        player.ready = player.is_bot
         player.finished = False
         player.laps = 0
-        player.checkpoint_passed = False
+        player.next_sector = 0
+        player.lap_splits = []
         player.vx = 0.0
         player.vy = 0.0
         player.x = room.spawn_x + index * 18
         player.y = room.spawn_y
+        player.lap_check_position = None
+        wake_player(player)
+
+
+async def send_room_tracks(room: RoomState, text: str | None = None):
+    room.track_library_version = TRACK_LIBRARY_VERSION
+    if text is None:
+        text = json.dumps({'type': 'tracks', 'tracks': available_tracks_payload()}, separators=JSON_SEPARATORS)
+    sockets = [
+        player.websocket
+        for player in [*list(room.players.values()), *list(room.spectators.values())]
+        if player.websocket is not None
+    ]
+    for _ in sockets:
+        count_outbound('tracks', len(text), room)
+    if sockets:
+        await asyncio.gather(*(safe_send_text(socket, text) for socket in sockets), return_exceptions=True)
 
 
 async def broadcast_room_map(room: RoomState):
+    room.track_library_version = TRACK_LIBRARY_VERSION
     payload = {
         'type': 'map',
         'map': room_map_payload(room),
         'tracks': available_tracks_payload(),
     }
-    recipients = [player.websocket for player in list(room.players.values())]
+    text = json.dumps(payload, separators=JSON_SEPARATORS)
+    recipients = [player.websocket for player in list(room.players.values()) if not player.is_bot]
+    recipients.extend(spectator.websocket for spectator in list(room.spectators.values()))
+    for _ in recipients:
+        count_outbound('map', len(text), room)
     if recipients:
-        await asyncio.gather(*(safe_send_json(socket, payload) for socket in recipients), return_exceptions=True)
+        await asyncio.gather(*(safe_send_text(socket, text) for socket in recipients), return_exceptions=True)
 
 
 def load_leaderboard_store():
@@ -297,15 +627,34 @@ def load_leaderboard_store():
     return data
 
 
-LEADERBOARD_STORE = load_leaderboard_store()
+LEADERBOARD_STORE = None
+
+
+def leaderboard_store() -> dict:
+    # Loaded on first use rather than at import to keep cold starts short.
+    global LEADERBOARD_STORE
+    if LEADERBOARD_STORE is None:
+        LEADERBOARD_STORE = load_leaderboard_store()
+    return LEADERBOARD_STORE
+
+
+LEADERBOARD_SAVE_LOCK = threading.Lock()
 
 
 def save_leaderboard_store():
-    try:
-        with open(LEADERBOARD_FILE, 'w', encoding='utf-8') as file:
-            json.dump(LEADERBOARD_STORE, file, indent=2)
-    except Exception:
-        pass
+    # Runs on a worker thread. Entry lists are only ever replaced, never
+    # changed in place, so a shallow copy taken under the lock is a
+    # consistent snapshot and the last save to finish writes the newest one.
+    with LEADERBOARD_SAVE_LOCK:
+        snapshot = {
+            track_id: dict(categories) if isinstance(categories, dict) else categories
+            for track_id, categories in list(leaderboard_store().items())
+        }
+        try:
+            with open(LEADERBOARD_FILE, 'w', encoding='utf-8') as file:
+                json.dump(snapshot, file, indent=2)
+        except Exception:
+            pass
 
 
 def leaderboard_category(laps: int) -> str:
@@ -317,31 +666,218 @@ def leaderboard_category(laps: int) -> str:
 
 
 def ensure_track_leaderboard(track_id: str):
-    if track_id not in LEADERBOARD_STORE or not isinstance(LEADERBOARD_STORE[track_id], dict):
-        LEADERBOARD_STORE[track_id] = {'1_laps': [], '3_laps': [], '5_laps': []}
+    store = leaderboard_store()
+    if track_id not in store or not isinstance(store[track_id], dict):
+        store[track_id] = {'1_laps': [], '3_laps': [], '5_laps': []}
     for category in ['1_laps', '3_laps', '5_laps']:
-        if category not in LEADERBOARD_STORE[track_id] or not isinstance(LEADERBOARD_STORE[track_id][category], list):
-            LEADERBOARD_STORE[track_id][category] = []
+        if category not in store[track_id] or not isinstance(store[track_id][category], list):
+            store[track_id][category] = []
 
 
-def update_global_leaderboard(track_id: str, player: PlayerState, laps_to_win: int):
+def update_global_leaderboard(track_id: str, laps_to_win: int, entry: dict) -> bool:
+    # Only called with runs that passed verification, on the event loop.
+    # Returns whether the entry made the top 20; the caller then saves with
+    # save_leaderboard_store on a worker thread.
     ensure_track_leaderboard(track_id)
     category = leaderboard_category(laps_to_win)
-    entries = LEADERBOARD_STORE[track_id][category]
-    entries.append(
-        {
-            'name': player.name,
-            'timeMs': int(player.race_total_time),
-            'carId': player.car_id,
-            'carName': WEB_CAR_MODELS[player.car_id]['name'],
-        }
+    store = leaderboard_store()
+    entries = sorted(store[track_id][category] + [entry], key=lambda item: item['timeMs'])[:20]
+    store[track_id][category] = entries
+    return any(item is entry for item in entries)
+
+
+def leaderboard_race_ids() -> set:
+    return {
+        entry['raceId']
+        for categories in leaderboard_store().values() if isinstance(categories, dict)
+        for entries in categories.values() if isinstance(entries, list)
+        for entry in entries if isinstance(entry, dict) and 'raceId' in entry
+    }
+
+
+def claim_leaderboard_place(room: RoomState, player: PlayerState):
+    # The claim waits for the race's replay to be closed; see close_race.
+    if room.recorder is None:
+        logger.warning('Race in room %s has no replay; %s stays off the global board', room.room_id, player.name)
+        return
+    room.leaderboard_claim = {
+        'raceId': room.recorder.race_id,
+        'roomId': room.room_id,
+        'trackId': room.track_id,
+        'trackHash': room.track_hash,
+        'lapsToWin': room.laps_to_win,
+        'playerId': player.player_id,
+        'name': player.name,
+        'carId': player.car_id,
+        'carName': WEB_CAR_MODELS[player.car_id]['name'],
+        'raceTimeMs': player.race_total_time,
+        'claimedAt': round(time.time(), 3),
+    }
+
+
+def close_race(room: RoomState):
+    # Runs once the race is over, reset or abandoned, and is a no-op on
+    # every tick after that.
+    path = replay.finish_recording(room)
+    claim, room.leaderboard_claim = room.leaderboard_claim, None
+    if claim is not None:
+        verification.submit_claim(claim, path)
+    if room.race_id is None:
+        return
+    reason = {'finished': 'finished', 'racing': 'abandoned'}.get(room.phase, 'reset')
+    for player in room.players.values():
+        if not player.finished:
+            log_race_event(room, 'dnf', laps=player.laps, **player_event_fields(player))
+    log_race_event(
+        room,
+        'race_end',
+        reason=reason,
+        durationMs=int(room.race_clock * 1000.0),
+        finished=sum(1 for player in room.players.values() if player.finished),
     )
-    entries.sort(key=lambda entry: entry['timeMs'])
-    LEADERBOARD_STORE[track_id][category] = entries[:20]
-    save_leaderboard_store()
+    room.race_id = None
+
 
+def player_event_fields(player: PlayerState) -> dict:
+    return {
+        'player': player.player_id,
+        'name': player.name,
+        'car': player.car_id,
+        'carName': WEB_CAR_MODELS[player.car_id]['name'],
+        'bot': player.is_bot,
+    }
+
+
+def log_race_event(room: RoomState, event_type: str, **fields):
+    if room.headless:
+        return
+    EVENT_LOG.emit(event_type, room=room.room_id, race=room.race_id, track=room.track_id, **fields)
 
-app = FastAPI(title='Racing Game Web Multiplayer')
+
+def validate_stored_tracks(tracks: List[dict]) -> set:
+    # Runs in a worker thread; only entries whose content changed get here.
+    valid_hashes = set()
+    for track in tracks:
+        rows = TRACK_STORE.load_rows(track['hash'])
+        if rows is None:
+            continue
+        is_valid, _, validated_rows = validate_map_rows(rows)
+        if is_valid and validated_rows == rows:
+            valid_hashes.add(track['hash'])
+    return valid_hashes
+
+
+async def reload_track_library():
+    global TRACK_LIBRARY, TRACK_LIBRARY_VERSION
+    entries = await asyncio.to_thread(read_track_index)
+    changed = [
+        track for track_id, track in entries.items()
+        if (TRACK_LIBRARY.get(track_id) or {}).get('hash') != track['hash']
+        and track['hash'] not in VALIDATED_TRACK_HASHES
+    ]
+    VALIDATED_TRACK_HASHES.update(await asyncio.to_thread(validate_stored_tracks, changed))
+    changed_ids = {track['id'] for track in changed}
+
+    library = dict(PRESET_TRACKS)
+    for track_id, track in entries.items():
+        if track_id in changed_ids and track['hash'] not in VALIDATED_TRACK_HASHES:
+            logger.warning('Skipping unreadable or invalid stored track %s', track_id)
+            continue
+        library[track_id] = track
+
+    previous_payload = available_tracks_payload()
+    # Rooms hold their own copy of the rows from set_room_track, so swapping
+    # the library never touches a race in progress.
+    TRACK_LIBRARY = library
+    tracks_payload = available_tracks_payload()
+    if tracks_payload == previous_payload:
+        return
+    TRACK_LIBRARY_VERSION += 1
+    logger.info('Track library reloaded: %d tracks (%d revalidated)', len(library), len(changed))
+
+    # Racing rooms are sent the list by their tick loop once the race is over.
+    text = json.dumps({'type': 'tracks', 'tracks': tracks_payload}, separators=JSON_SEPARATORS)
+    rooms = [room for room in list(ROOMS.values()) if room.phase != 'racing']
+    await asyncio.gather(*(send_room_tracks(room, text) for room in rooms))
+
+
+def track_index_signature():
+    try:
+        stat = TRACK_STORE.index_path.stat()
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+async def watch_track_store(stop_event: asyncio.Event):
+    TRACK_STORE_DIR.mkdir(parents=True, exist_ok=True)
+    index_name = TRACK_STORE.index_path.name
+    if awatch is not None:
+        # awatch blocks a worker thread; stopping through the event rather than
+        # cancelling lets that thread exit before the loop shuts down.
+        try:
+            async for changes in awatch(TRACK_STORE_DIR, recursive=False, debounce=300, stop_event=stop_event):
+                if any(Path(path).name == index_name for _, path in changes):
+                    await reload_track_library()
+            return
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception('Track store watcher failed; falling back to polling')
+
+    last_seen = track_index_signature()
+    while not stop_event.is_set():
+        await asyncio.sleep(TRACK_POLL_SECONDS)
+        seen = track_index_signature()
+        if seen != last_seen:
+            last_seen = seen
+            await reload_track_library()
+
+
+async def flush_heatmaps(stop_event: asyncio.Event):
+    # Runs until shutdown, then flushes once more.
+    while not stop_event.is_set():
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=HEATMAP_FLUSH_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        pending = HEATMAPS.take_pending()
+        if pending:
+            try:
+                await asyncio.to_thread(HEATMAPS.write_pending, pending)
+            except OSError:
+                logger.exception('Could not write track heatmaps')
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    STARTUP['readyMs'] = round((time.perf_counter() - IMPORT_STARTED_AT) * 1000.0, 1)
+    logger.info('Server ready %.1f ms after import (module import took %.1f ms)', STARTUP['readyMs'], STARTUP['importMs'])
+    monitor_task = asyncio.create_task(event_loop_lag_monitor())
+    stop_watching = asyncio.Event()
+    watcher_task = asyncio.create_task(watch_track_store(stop_watching))
+    heatmap_task = asyncio.create_task(flush_heatmaps(stop_watching))
+    # Races index their replays as they end, on the loop; load the index
+    # (which may mean describing replays it has not seen) before they do.
+    await asyncio.to_thread(replay.replay_index().load)
+    try:
+        yield
+    finally:
+        monitor_task.cancel()
+        stop_watching.set()
+        try:
+            await asyncio.wait_for(watcher_task, timeout=1.0)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            pass
+        try:
+            await asyncio.wait_for(heatmap_task, timeout=5.0)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            pass
+        verification.shutdown_pool()
+        await asyncio.to_thread(EVENT_LOG.close)
+
+
+app = FastAPI(title='Racing Game Web Multiplayer', lifespan=lifespan)
 
 CLIENT_DIR = Path(__file__).parent / 'client'
 app.mount('/client', StaticFiles(directory=str(CLIENT_DIR)), name='client')
@@ -376,7 +912,128 @@ async def get_cars():
 @app.get('/api/leaderboard')
 async def get_leaderboard():
     ensure_track_leaderboard(DEFAULT_TRACK['id'])
-    return LEADERBOARD_STORE[DEFAULT_TRACK['id']]
+    return leaderboard_store()[DEFAULT_TRACK['id']]
+
+
+@app.get('/api/replays')
+async def get_replays(room: str | None = None, offset: int = 0, limit: int | None = None):
+    return await asyncio.to_thread(replay.list_replays, room, None, offset, limit)
+
+
+@app.get('/api/heatmap/{track_id}')
+async def get_heatmap(track_id: str):
+    unflushed = HEATMAPS.active.get(track_id)
+    heatmap = await asyncio.to_thread(HEATMAPS.read, track_id, TILESIZE, unflushed.copy() if unflushed else None)
+    if heatmap is None:
+        raise HTTPException(status_code=404, detail='No heatmap for this track yet')
+    return await asyncio.to_thread(heatmap.payload)
+
+
+@app.get('/api/status')
+async def get_status():
+    return {
+        'rooms': len(ROOMS),
+        'players': sum(len(room.players) for room in ROOMS.values()),
+        'spectators': sum(len(room.spectators) for room in ROOMS.values()),
+        'startup': STARTUP,
+        'governor': {
+            'level': GOVERNOR.level,
+            'state': GOVERNOR_LEVEL_NAMES[GOVERNOR.level],
+            'eventLoopLagMs': round(GOVERNOR.lag_ms, 2),
+            'maxEventLoopLagMs': round(GOVERNOR.max_lag_ms, 2),
+            'levelChanges': GOVERNOR.level_changes,
+            'refusedRooms': GOVERNOR.refused_rooms,
+        },
+    }
+
+
+@app.get('/metrics')
+async def get_metrics():
+    return PlainTextResponse(METRICS.render(), media_type='text/plain; version=0.0.4')
+
+
+def require_admin(request: Request):
+    # Admin endpoints do not exist unless a token is configured.
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail='Not Found')
+    supplied = request.headers.get('x-admin-token') or request.query_params.get('token') or ''
+    if not secrets.compare_digest(supplied.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail='Invalid admin token')
+
+
+def room_debug_payload(room: RoomState):
+    return {
+        'id': room.room_id,
+        'phase': room.phase,
+        'trackId': room.track_id,
+        'tick': room.tick,
+        'tickCostMs': round(room.tick_cost_ms, 3),
+        'bytesSent': room.bytes_sent,
+        'spectators': len(room.spectators),
+        'spectatorFrameQueue': len(room.spectator_frames),
+        'spectatorSendsInFlight': sum(
+            1 for s in room.spectators.values() if s.send_task is not None and not s.send_task.done()
+        ),
+        'players': [
+            {
+                'id': p.player_id,
+                'name': p.name,
+                'bot': p.is_bot,
+                'asleep': p.asleep,
+                'finished': p.finished,
+                'laps': p.laps,
+                'snapshotHz': SNAPSHOT_RATE_TIERS_HZ[p.snapshot_tier],
+                'rttMs': round(p.rtt_ms, 1),
+                'sendLatencyMs': round(p.send_latency_ms, 2),
+                'sendInFlight': p.send_task is not None and not p.send_task.done(),
+                'skippedSnapshots': p.skipped_snapshots,
+            }
+            for p in room.players.values()
+        ],
+    }
+
+
+@app.get('/admin/rooms')
+async def admin_rooms(request: Request):
+    require_admin(request)
+    return {
+        'governorLevel': GOVERNOR.level,
+        'eventLoopLagMs': round(GOVERNOR.lag_ms, 2),
+        'asyncioTasks': len(asyncio.all_tasks()),
+        'rooms': [room_debug_payload(room) for room in list(ROOMS.values())],
+    }
+
+
+@app.get('/admin/profile')
+async def admin_profile(
+    request: Request,
+    seconds: float = 5.0,
+    interval_ms: float = PROFILE_DEFAULT_INTERVAL_MS,
+    format: str = 'collapsed',
+):
+    require_admin(request)
+    if format not in ('collapsed', 'speedscope'):
+        raise HTTPException(status_code=400, detail='format must be collapsed or speedscope')
+    if PROFILER_LOCK.locked():
+        raise HTTPException(status_code=409, detail='A profile is already running')
+
+    async with PROFILER_LOCK:
+        # Handlers run on the event loop thread, which is the one to sample.
+        profiler = SamplingProfiler(threading.get_ident(), seconds, interval_ms / 1000.0)
+        profiler.start()
+        await asyncio.to_thread(profiler.thread.join)
+
+    logger.info('Profiled event loop for %.1fs (%d samples)', profiler.elapsed, profiler.sample_count)
+    if format == 'speedscope':
+        return profiler.speedscope()
+    return PlainTextResponse(profiler.collapsed())
+
+
+@app.get('/debug/trace')
+async def get_trace(seconds: float = 5.0):
+    if not TRACER.enabled:
+        raise HTTPException(status_code=404, detail='Tracing is disabled; start the server with CHUNKYDRIFT_TRACE=1')
+    return TRACER.export(max(0.0, min(TRACE_MAX_SECONDS, seconds)))
 
 
 def is_on_road(room: RoomState, x: float, y: float) -> bool:
@@ -395,13 +1052,70 @@ def current_tile(room: RoomState, x: float, y: float):
     return room.track_rows[row][col]
 
 
+def segment_tile_entries(x0: float, y0: float, x1: float, y1: float):
+    # Grid traversal (Amanatides & Woo) of the move from (x0, y0) to (x1, y1):
+    # (fraction, col, row) for every tile entered after the first, where
+    # fraction is how far along the move the car crossed into it.
+    col, row = int(x0 // TILESIZE), int(y0 // TILESIZE)
+    end_col, end_row = int(x1 // TILESIZE), int(y1 // TILESIZE)
+    if col == end_col and row == end_row:
+        return []
+    dx = x1 - x0
+    dy = y1 - y0
+    step_col = 1 if dx > 0 else -1
+    step_row = 1 if dy > 0 else -1
+    next_x = ((col + (step_col > 0)) * TILESIZE - x0) / dx if dx else math.inf
+    next_y = ((row + (step_row > 0)) * TILESIZE - y0) / dy if dy else math.inf
+    delta_x = TILESIZE / abs(dx) if dx else math.inf
+    delta_y = TILESIZE / abs(dy) if dy else math.inf
+
+    entries = []
+    for _ in range(abs(end_col - col) + abs(end_row - row)):
+        if next_x < next_y:
+            col += step_col
+            fraction = next_x
+            next_x += delta_x
+        else:
+            row += step_row
+            fraction = next_y
+            next_y += delta_y
+        entries.append((min(1.0, fraction), col, row))
+    return entries
+
+
 def find_nearest_road_tile(room: RoomState, x: float, y: float):
+    width, height = room.track_width_tiles, room.track_height_tiles
+    if room.nearest_road is None:
+        return scan_nearest_road_tile(room, x, y, 0, width - 1, 0, height - 1)
+
+    # The pack layer gives a road tile near the point's tile, not always the
+    # nearest. Any nearer centre lies within that distance, so only that box
+    # is scanned, in the same order and with the same tie-breaking as the
+    # full scan.
+    col = min(width - 1, max(0, int(x // TILESIZE)))
+    row = min(height - 1, max(0, int(y // TILESIZE)))
+    bound = room.nearest_road[row * width + col]
+    if bound == NO_ROAD:
+        return None
+    reach = math.hypot((bound % width + 0.5) * TILESIZE - x, (bound // width + 0.5) * TILESIZE - y) / TILESIZE + 1.0
+    return scan_nearest_road_tile(
+        room,
+        x,
+        y,
+        max(0, int(x / TILESIZE - reach)),
+        min(width - 1, int(x / TILESIZE + reach)),
+        max(0, int(y / TILESIZE - reach)),
+        min(height - 1, int(y / TILESIZE + reach)),
+    )
+
+
+def scan_nearest_road_tile(room: RoomState, x: float, y: float, first_col: int, last_col: int, first_row: int, last_row: int):
     best_tile = None
     best_dist_sq = float('inf')
 
-    for row in range(room.track_height_tiles):
+    for row in range(first_row, last_row + 1):
         row_data = room.track_rows[row]
-        for col in range(room.track_width_tiles):
+        for col in range(first_col, last_col + 1):
             if row_data[col] not in ROAD_TILES:
                 continue
 
@@ -453,9 +1167,33 @@ def track_center_position(room: RoomState, x: float, y: float):
     return center_col * TILESIZE, center_row * TILESIZE
 
 
+def room_heatmap(room: RoomState):
+    return HEATMAPS.track(room.track_id, room.track_hash, room.track_width_tiles, room.track_height_tiles, TILESIZE)
+
+
+def note_wall_hit(room: RoomState, player: PlayerState, x: float, y: float):
+    # A car held against a wall touches it every tick; only the first tick
+    # of each contact counts, at the wall tile it ran into.
+    if room.tick > player.wall_hit_tick + 1 and not player.is_bot and not room.headless:
+        room_heatmap(room).add_wall_hit(x, y)
+    player.wall_hit_tick = room.tick
+
+
+def record_heatmap_samples(room: RoomState):
+    if room.headless or room.tick % HEATMAP_SPEED_SAMPLE_TICKS:
+        return
+    heatmap = room_heatmap(room)
+    for player in room.players.values():
+        if not player.is_bot and not player.finished and not player.asleep:
+            heatmap.add_speed(player.x, player.y, math.hypot(player.vx, player.vy))
+
+
 def respawn_player_on_track_center(room: RoomState, player: PlayerState):
+    if room.phase == 'racing' and not player.is_bot and not room.headless:
+        room_heatmap(room).add_respawn(player.x, player.y)
     tile = find_nearest_road_tile(room, player.x, player.y)
     player.x, player.y = track_center_position(room, player.x, player.y)
+    player.lap_check_position = None
 
     if tile is None:
         target_rotation = normalize_spawn_rotation(player.rotation_deg, room.spawn_rotation_deg)
@@ -511,8 +1249,14 @@ def respawn_player_on_track_center(room: RoomState, player: PlayerState):
 
 
 async def safe_send_json(ws: WebSocket, payload: dict):
+    text = json.dumps(payload, separators=JSON_SEPARATORS)
+    count_outbound(str(payload.get('type', 'other')), len(text))
+    await safe_send_text(ws, text)
+
+
+async def safe_send_text(ws: WebSocket, text: str):
     try:
-        await ws.send_json(payload)
+        await ws.send_text(text)
     except Exception:
         pass
 
@@ -544,7 +1288,7 @@ def final_results_snapshot(room: RoomState):
     finished.sort(key=lambda p: p.race_total_time)
 
     unfinished = [p for p in room.players.values() if not p.finished]
-    unfinished.sort(key=lambda p: (-p.laps, p.best_lap_time if p.best_lap_time > 0 else float('inf'), p.name.lower()))
+    unfinished.sort(key=lambda p: (-(p.laps + p.lap_progress), p.best_lap_time if p.best_lap_time > 0 else float('inf'), p.name.lower()))
 
     results = []
     position = 1
@@ -557,6 +1301,7 @@ def final_results_snapshot(room: RoomState):
                 'position': position,
                 'timeMs': int(p.race_total_time),
                 'finished': True,
+                'bestLapSplits': p.best_lap_splits,
             }
         )
         position += 1
@@ -569,6 +1314,7 @@ def final_results_snapshot(room: RoomState):
                 'position': position,
                 'timeMs': None,
                 'finished': False,
+                'bestLapSplits': p.best_lap_splits,
             }
         )
         position += 1
@@ -576,16 +1322,7 @@ def final_results_snapshot(room: RoomState):
     return results
 
 
-async def broadcast_room_state(room: RoomState):
-    now = now_seconds()
-    include_leaderboards = (
-        room.phase in ('lobby', 'finished')
-        or room.last_leaderboard_push_time <= 0
-        or (now - room.last_leaderboard_push_time) >= LEADERBOARD_PUSH_INTERVAL_SECONDS
-    )
-    if include_leaderboards:
-        room.last_leaderboard_push_time = now
-
+def room_state_header(room: RoomState, now: float, include_leaderboards: bool) -> str:
     room_payload = {
         'phase': room.phase,
         'lapsToWin': room.laps_to_win,
@@ -599,50 +1336,309 @@ async def broadcast_room_state(room: RoomState):
     if include_leaderboards:
         ensure_track_leaderboard(room.track_id)
         room_payload['roomLeaderboard'] = room_leaderboard_snapshot(room)
-        room_payload['globalLeaderboard'] = LEADERBOARD_STORE[room.track_id][leaderboard_category(room.laps_to_win)]
+        room_payload['globalLeaderboard'] = leaderboard_store()[room.track_id][leaderboard_category(room.laps_to_win)]
+
+    if room.phase in ('racing', 'finished') and room.standings:
+        # [playerId, gapMs] in race order.
+        room_payload['standings'] = room.standings
 
     if room.phase == 'finished':
         final_results = final_results_snapshot(room)
         room_payload['finalResults'] = final_results
         winner_result = final_results[0] if final_results else None
         room_payload['winnerTimeMs'] = winner_result['timeMs'] if winner_result else None
+        if room.last_replay_id is not None:
+            room_payload['replayId'] = room.last_replay_id
 
-    payload = {
-        'type': 'state',
-        'serverTime': now,
-        'room': room_payload,
-        'players': [
-            {
-                'id': p.player_id,
-                'name': p.name,
-                'color': p.color,
-                'carId': p.car_id,
-                'x': p.x,
-                'y': p.y,
-                'rotationDeg': p.rotation_deg,
-                'vx': p.vx,
-                'vy': p.vy,
-                'speed': math.sqrt(p.vx * p.vx + p.vy * p.vy),
-                'turnState': (
-                    -1 if p.input_state.steer < -0.1
-                    else 1 if p.input_state.steer > 0.1
-                    else -1 if p.input_state.left and not p.input_state.right
-                    else 1 if p.input_state.right and not p.input_state.left
-                    else 0
-                ),
-                'isDrifting': bool(p.input_state.handbrake and math.sqrt(p.vx * p.vx + p.vy * p.vy) > 50),
-                'ready': p.ready,
-                'laps': p.laps,
-                'finished': p.finished,
-                'bestLapMs': int(p.best_lap_time) if p.best_lap_time > 0 else 0,
-            }
-            for p in room.players.values()
-        ],
+    return json.dumps(
+        {'type': 'state', 'serverTime': now, 'room': room_payload},
+        separators=JSON_SEPARATORS,
+    )[:-1]
+
+
+async def broadcast_room_state(room: RoomState, from_tick: bool = False):
+    # The tick loop passes from_tick=True. Every other call is a push after a
+    # join, leave or lobby change: it goes to each recipient straight away
+    # and leaves their rate tiers and interest accumulators alone.
+    now = now_seconds()
+    include_leaderboards = (
+        room.phase in ('lobby', 'finished')
+        or room.last_leaderboard_push_time <= 0
+        or (now - room.last_leaderboard_push_time) >= LEADERBOARD_PUSH_INTERVAL_SECONDS
+    )
+    if include_leaderboards:
+        room.last_leaderboard_push_time = now
+
+    with TRACER.span('encode', room_trace_track(room)):
+        header = room_state_header(room, now, include_leaderboards)
+        entries = {p.player_id: encoded_player_entry(p) for p in room.players.values()}
+
+    for recipient in list(room.players.values()):
+        if recipient.is_bot:
+            continue
+        interval_ticks = snapshot_interval_ticks(recipient)
+        if from_tick and room.tick % interval_ticks != 0:
+            continue
+        if recipient.send_task is not None and not recipient.send_task.done():
+            # The previous snapshot is still being written; drop this one rather
+            # than queueing frames the client cannot take.
+            if not from_tick:
+                continue
+            recipient.skipped_snapshots += 1
+            SKIPPED_SNAPSHOTS_TOTAL.inc()
+            if time.perf_counter() - recipient.send_started_at > interval_ticks / TICK_HZ:
+                note_snapshot_backlog(recipient)
+            continue
+        text = header + recipient_snapshot_body(room, recipient, entries, interval_ticks if from_tick else 0) + '}'
+        count_outbound('state', len(text), room)
+        recipient.send_started_at = time.perf_counter()
+        recipient.send_task = asyncio.create_task(send_snapshot(room, recipient, text, from_tick))
+
+
+def build_spectator_frame(room: RoomState, now: float) -> str:
+    include_leaderboards = (
+        room.phase in ('lobby', 'finished')
+        or (now - room.last_spectator_leaderboard_time) >= LEADERBOARD_PUSH_INTERVAL_SECONDS
+    )
+    if include_leaderboards:
+        room.last_spectator_leaderboard_time = now
+
+    header = room_state_header(room, now, include_leaderboards)
+    return ''.join(
+        [
+            header,
+            ',"snapshotHz":',
+            str(SPECTATOR_SNAPSHOT_HZ),
+            ',"roster":',
+            json.dumps(list(room.players.keys()), separators=JSON_SEPARATORS),
+            ',"players":[',
+            ','.join(encoded_player_entry(p) for p in room.players.values()),
+            ']}',
+        ]
+    )
+
+
+def broadcast_spectator_frame(room: RoomState):
+    # One frame is built per room and the same string is fanned out to every
+    # spectator after SPECTATOR_DELAY_SECONDS, so viewers cost a send each and
+    # nothing per-viewer on the tick.
+    if not room.spectators:
+        room.spectator_frames.clear()
+        return
+    if room.tick % spectator_interval_ticks() != 0:
+        return
+
+    now = now_seconds()
+    with TRACER.span('spectator_encode', room_trace_track(room)):
+        room.spectator_frames.append((now, build_spectator_frame(room, now)))
+
+    frame = None
+    while room.spectator_frames and now - room.spectator_frames[0][0] >= SPECTATOR_DELAY_SECONDS:
+        frame = room.spectator_frames.popleft()[1]
+    if frame is None:
+        return
+
+    for spectator in list(room.spectators.values()):
+        if spectator.send_task is not None and not spectator.send_task.done():
+            continue
+        count_outbound('spectator_state', len(frame), room)
+        spectator.send_task = asyncio.create_task(send_spectator_frame(room, spectator, frame))
+
+
+async def send_spectator_frame(room: RoomState, spectator: SpectatorState, frame: str):
+    started_at = time.perf_counter()
+    await safe_send_text(spectator.websocket, frame)
+    TRACER.add('spectator_send', room_trace_track(room) + ' sends', started_at, time.perf_counter(), {'bytes': len(frame)})
+
+
+def spectator_interval_ticks() -> int:
+    interval_ticks = max(1, TICK_HZ // SPECTATOR_SNAPSHOT_HZ)
+    if GOVERNOR.level >= 2:
+        interval_ticks *= GOVERNOR_SPECTATOR_RATE_DIVISOR
+    return interval_ticks
+
+
+def room_broadcast_due(room: RoomState) -> bool:
+    if GOVERNOR.level >= 1 and room.phase == 'lobby':
+        return room.tick % GOVERNOR_LOBBY_INTERVAL_TICKS == 0
+    return True
+
+
+def snapshot_interval_ticks(player: PlayerState) -> int:
+    return max(1, TICK_HZ // SNAPSHOT_RATE_TIERS_HZ[player.snapshot_tier])
+
+
+def update_snapshot_tier(player: PlayerState):
+    rtt_tier = sum(1 for limit in SNAPSHOT_RTT_TIER_LIMITS_MS if player.rtt_ms > limit)
+    player.snapshot_tier = min(len(SNAPSHOT_RATE_TIERS_HZ) - 1, rtt_tier + player.backlog_penalty)
+
+
+def note_snapshot_backlog(player: PlayerState):
+    player.clean_sends = 0
+    player.backlog_penalty = min(len(SNAPSHOT_RATE_TIERS_HZ) - 1, player.backlog_penalty + 1)
+    update_snapshot_tier(player)
+
+
+async def send_snapshot(room: RoomState, player: PlayerState, text: str, from_tick: bool = True):
+    await safe_send_text(player.websocket, text)
+    finished_at = time.perf_counter()
+    TRACER.add(
+        'send',
+        room_trace_track(room) + ' sends',
+        player.send_started_at,
+        finished_at,
+        {'player': player.name, 'bytes': len(text)},
+    )
+    if not from_tick:
+        return  # only tick-driven sends move the rate tier
+    elapsed_ms = (finished_at - player.send_started_at) * 1000.0
+    player.send_latency_ms += (elapsed_ms - player.send_latency_ms) * 0.2
+
+    if elapsed_ms > 1000.0 / SNAPSHOT_RATE_TIERS_HZ[player.snapshot_tier]:
+        note_snapshot_backlog(player)
+        return
+
+    player.clean_sends += 1
+    if player.backlog_penalty > 0 and player.clean_sends >= SNAPSHOT_RATE_RECOVERY_SENDS:
+        player.backlog_penalty -= 1
+        player.clean_sends = 0
+    update_snapshot_tier(player)
+
+
+def player_snapshot_entry(p: PlayerState):
+    speed = math.sqrt(p.vx * p.vx + p.vy * p.vy)
+    return {
+        'id': p.player_id,
+        'name': p.name,
+        'color': p.color,
+        'carId': p.car_id,
+        'x': p.x,
+        'y': p.y,
+        'rotationDeg': p.rotation_deg,
+        'vx': p.vx,
+        'vy': p.vy,
+        'speed': speed,
+        'turnState': (
+            -1 if p.input_state.steer < -0.1
+            else 1 if p.input_state.steer > 0.1
+            else -1 if p.input_state.left and not p.input_state.right
+            else 1 if p.input_state.right and not p.input_state.left
+            else 0
+        ),
+        'isDrifting': bool(p.input_state.handbrake and speed > 50),
+        'ready': p.ready,
+        'laps': p.laps,
+        'finished': p.finished,
+        'bot': p.is_bot,
+        'bestLapMs': int(p.best_lap_time) if p.best_lap_time > 0 else 0,
+        'splits': p.lap_splits,
     }
 
-    recipients = [player.websocket for player in list(room.players.values())]
-    if recipients:
-        await asyncio.gather(*(safe_send_json(socket, payload) for socket in recipients), return_exceptions=True)
+
+def encoded_player_entry(p: PlayerState) -> str:
+    if p.asleep and p.cached_entry is not None:
+        return p.cached_entry
+    text = json.dumps(player_snapshot_entry(p), separators=JSON_SEPARATORS)
+    p.cached_entry = text if p.asleep else None
+    return text
+
+
+def already_delivered(recipient: PlayerState, other: PlayerState) -> bool:
+    # A sleeping car's state cannot change until it wakes, so once a recipient
+    # has its entry from after it fell asleep there is nothing left to send.
+    return other.asleep and recipient.entry_sent_tick.get(other.player_id, -1) >= other.sleep_tick
+
+
+def select_relevant_players(room: RoomState, recipient: PlayerState, entries: Dict[str, str], elapsed_ticks: int = 1):
+    # Priority accumulator: nearby cars gain a full point per tick, distant cars a
+    # fraction, so distant cars come due every few ticks. Due cars are packed into
+    # the byte budget highest priority first; cars that do not fit keep their
+    # priority and win a slot on a later tick. elapsed_ticks 0 is a push
+    # between ticks: every undelivered car is due, nearest first, and the
+    # accumulators are left as they are.
+    pushed = elapsed_ticks == 0
+    budget = SNAPSHOT_BYTE_BUDGET - len(entries[recipient.player_id])
+    near_radius_sq = INTEREST_NEAR_RADIUS * INTEREST_NEAR_RADIUS
+    near_weight = float(elapsed_ticks)
+    far_interval_ticks = INTEREST_FAR_INTERVAL_TICKS
+    if GOVERNOR.level >= 3:
+        far_interval_ticks *= GOVERNOR_FAR_INTERVAL_MULTIPLIER
+    far_weight = elapsed_ticks / far_interval_ticks
+
+    due = []
+    for other in room.players.values():
+        if other is recipient or already_delivered(recipient, other):
+            continue
+        dx = other.x - recipient.x
+        dy = other.y - recipient.y
+        dist_sq = dx * dx + dy * dy
+        if pushed:
+            due.append((0.0, dist_sq, other.player_id))
+            continue
+        weight = near_weight if dist_sq <= near_radius_sq else far_weight
+        priority = recipient.interest_priority.get(other.player_id, 0.0) + weight
+        recipient.interest_priority[other.player_id] = priority
+        if priority >= 1.0:
+            due.append((-priority, dist_sq, other.player_id))
+
+    due.sort()
+    included = []
+    if not already_delivered(recipient, recipient):
+        included.append(recipient.player_id)
+    for _, _, other_id in due:
+        size = len(entries[other_id]) + 1
+        if size > budget:
+            continue
+        budget -= size
+        included.append(other_id)
+        if not pushed:
+            recipient.interest_priority[other_id] = 0.0
+
+    for player_id in included:
+        recipient.entry_sent_tick[player_id] = room.tick
+    return included
+
+
+def recipient_snapshot_body(room: RoomState, recipient: PlayerState, entries: Dict[str, str], interval_ticks: int = 1) -> str:
+    included = select_relevant_players(room, recipient, entries, interval_ticks)
+    parts = [
+        ',"snapshotHz":',
+        str(SNAPSHOT_RATE_TIERS_HZ[recipient.snapshot_tier]),
+        ',"players":[',
+        ','.join(entries[player_id] for player_id in included),
+        ']',
+    ]
+
+    include_summary = room.tick - recipient.last_summary_tick >= INTEREST_SUMMARY_INTERVAL_TICKS
+    if include_summary and len(included) < len(room.players):
+        included_ids = set(included)
+        summary = [
+            [p.player_id, round(p.x, 1), round(p.y, 1)]
+            for p in room.players.values()
+            if p.player_id not in included_ids and not already_delivered(recipient, p)
+        ]
+        if summary:
+            recipient.last_summary_tick = room.tick
+            parts.append(',"summary":')
+            parts.append(json.dumps(summary, separators=JSON_SEPARATORS))
+
+    if recipient.roster_version_sent != room.roster_version:
+        recipient.roster_version_sent = room.roster_version
+        roster = list(room.players.keys())
+        recipient.interest_priority = {
+            player_id: priority
+            for player_id, priority in recipient.interest_priority.items()
+            if player_id in room.players
+        }
+        recipient.entry_sent_tick = {
+            player_id: sent_tick
+            for player_id, sent_tick in recipient.entry_sent_tick.items()
+            if player_id in room.players
+        }
+        parts.append(',"roster":')
+        parts.append(json.dumps(roster, separators=JSON_SEPARATORS))
+
+    return ''.join(parts)
 
 
 def set_player_car(player: PlayerState, car_id: int):
@@ -660,25 +1656,90 @@ def reset_player_for_race(room: RoomState, player: PlayerState, index_in_grid: i
     player.rotation_deg = room.spawn_rotation_deg
     player.vx = 0.0
     player.vy = 0.0
-    player.ready = False
+    player.ready = player.is_bot
     player.finished = False
     player.laps = 0
-    player.checkpoint_passed = False
+    player.next_sector = 0
+    player.lap_splits = []
+    player.best_lap_splits = []
     player.last_finish_cross_time = 0.0
-    player.lap_start_time = now_seconds()
+    player.lap_start_time = 0.0
+    player.lap_check_position = None
+    player.ghost_trace = []
+    player.ghost_sent = False
     player.best_lap_time = 0.0
     player.race_total_time = 0.0
+    player.lap_progress = 0.0
+    player.progress_bucket = -1
     player.input_state = InputState()
     player.grip_state = WEB_CAR_MODELS[player.car_id]['grip']
+    if player.bot is not None:
+        player.bot = BotState()
+    wake_player(player)
+
 
+def quantize_axis(value: float, low: float, high: float) -> float:
+    return round(max(low, min(high, value)) * INPUT_AXIS_STEPS) / INPUT_AXIS_STEPS
+
+
+def input_is_neutral(state: InputState) -> bool:
+    return (
+        not (state.up or state.down or state.left or state.right or state.handbrake)
+        and state.throttle <= 0
+        and state.brake <= 0
+        and abs(state.steer) < 0.05
+    )
 
-def start_countdown(room: RoomState):
+
+def wake_player(player: PlayerState):
+    player.asleep = False
+    player.cached_entry = None
+
+
+def update_sleep_states(room: RoomState):
+    # Cars at rest with neutral input (or already finished) drop out of the
+    # physics step, the collision broadphase and snapshot deltas until input,
+    # a lobby change or a collision wakes them.
+    threshold_sq = SLEEP_SPEED_THRESHOLD * SLEEP_SPEED_THRESHOLD
+    for player in room.players.values():
+        if player.asleep:
+            continue
+        if player.vx * player.vx + player.vy * player.vy >= threshold_sq:
+            continue
+        if player.finished or input_is_neutral(player.input_state):
+            player.vx = 0.0
+            player.vy = 0.0
+            player.asleep = True
+            player.sleep_tick = room.tick
+            player.cached_entry = None
+
+
+def build_track_geometry(rows: tuple, spawn_rotation_deg: float) -> tuple:
+    # Sectors, progress field and flow field, cached per map. A cold build
+    # is Dijkstra over every tile (a tenth of a second on the presets, most
+    # of a second on a large open map), so the server runs it on a worker
+    # thread before the countdown.
+    return track_sectors_for(rows), progress_field_for(rows), flow_field_for(rows, spawn_rotation_deg)
+
+
+def start_countdown(room: RoomState, geometry: tuple | None = None):
+    # geometry is build_track_geometry's result for the room's rows; rooms
+    # with no event loop to protect (envs, replays, benchmarks) leave it out
+    # and build inline.
     if not room.players:
         return
 
     room.phase = 'countdown'
     room.winner_id = None
+    room.last_replay_id = None
+    room.leaderboard_claim = None
     room.countdown_end_time = now_seconds() + 3.0
+    room.progress_times.clear()
+    room.standings = []
+    room.track_hash = track_hash(room.track_rows)
+    if geometry is None:
+        geometry = build_track_geometry(tuple(room.track_rows), room.spawn_rotation_deg)
+    room.track_sectors, room.progress_field, room.flow_field = geometry
 
     for idx, player in enumerate(room.players.values()):
         reset_player_for_race(room, player, idx)
@@ -692,242 +1753,632 @@ def maybe_begin_race(room: RoomState):
 
     room.phase = 'racing'
     room.race_start_time = now_seconds()
+    room.race_clock = 0.0
     for player in room.players.values():
-        player.lap_start_time = room.race_start_time
+        player.lap_start_time = 0.0
+    replay.start_recording(room)
+    room.race_id = room.recorder.race_id if room.recorder is not None else uuid.uuid4().hex[:12]
+    log_race_event(
+        room,
+        'race_start',
+        laps=room.laps_to_win,
+        humans=sum(1 for player in room.players.values() if not player.is_bot),
+        bots=sum(1 for player in room.players.values() if player.is_bot),
+    )
 
 
 def step_player_physics(room: RoomState, player: PlayerState, dt: float):
-    car = WEB_CAR_MODELS[player.car_id]
-    accel = car['accel']
-    brake_accel = car['accel'] * 0.5
-    max_speed = car['maxSpeed']
-    drag = car['drag']
-    friction = car['friction']
-    base_grip = car['grip']
-    turn_rate = 150.0
-
+    # Runs for every awake car every tick (and for every car-step in
+    # racing_env), so state lives in locals and is written back once; the
+    # arithmetic is kept in the same order so results are unchanged.
     if player.finished:
         player.vx *= 0.9
         player.vy *= 0.9
         return
 
-    analog_steer = max(-1.0, min(1.0, float(player.input_state.steer)))
+    car = WEB_CAR_MODELS[player.car_id]
+    accel = car['accel']
+    brake_accel = accel * 0.5
+    turn_rate = 150.0
+    state = player.input_state
+    up, down, handbrake = state.up, state.down, state.handbrake
+    vx, vy = player.vx, player.vy
+
+    analog_steer = float(state.steer)
+    analog_steer = 1.0 if analog_steer > 1.0 else -1.0 if analog_steer < -1.0 else analog_steer
     if abs(analog_steer) < 0.05:
         turn_dir = 0.0
-        if player.input_state.left:
+        if state.left:
             turn_dir -= 1.0
-        if player.input_state.right:
+        if state.right:
             turn_dir += 1.0
     else:
         turn_dir = analog_steer
 
-    speed = math.sqrt(player.vx * player.vx + player.vy * player.vy)
+    speed = math.sqrt(vx * vx + vy * vy)
     if speed > 2 and turn_dir != 0.0:
-        turn_multiplier = 1.3 if player.input_state.handbrake else 0.6
+        turn_multiplier = 1.3 if handbrake else 0.6
         player.rotation_deg = (player.rotation_deg + turn_dir * turn_rate * turn_multiplier * dt) % 360
 
     radians = math.radians(player.rotation_deg)
     fx = math.cos(radians)
     fy = math.sin(radians)
 
-    throttle_amount = max(0.0, min(1.0, float(player.input_state.throttle)))
-    brake_amount = max(0.0, min(1.0, float(player.input_state.brake)))
-    if throttle_amount <= 0 and player.input_state.up:
+    throttle_amount = float(state.throttle)
+    throttle_amount = 1.0 if throttle_amount > 1.0 else 0.0 if throttle_amount < 0.0 else throttle_amount
+    brake_amount = float(state.brake)
+    brake_amount = 1.0 if brake_amount > 1.0 else 0.0 if brake_amount < 0.0 else brake_amount
+    if throttle_amount <= 0 and up:
         throttle_amount = 1.0
-    if brake_amount <= 0 and player.input_state.down:
+    if brake_amount <= 0 and down:
         brake_amount = 1.0
 
     if throttle_amount > 0:
-        player.vx -= fx * accel * throttle_amount * dt
-        player.vy -= fy * accel * throttle_amount * dt
+        vx -= fx * accel * throttle_amount * dt
+        vy -= fy * accel * throttle_amount * dt
     if brake_amount > 0:
-        player.vx += fx * brake_accel * brake_amount * dt
-        player.vy += fy * brake_accel * brake_amount * dt
+        vx += fx * brake_accel * brake_amount * dt
+        vy += fy * brake_accel * brake_amount * dt
 
-    speed = math.sqrt(player.vx * player.vx + player.vy * player.vy)
+    speed = math.sqrt(vx * vx + vy * vy)
     if speed > 0.0001:
-        friction_force = friction * dt
-        player.vx -= (player.vx / speed) * friction_force
-        player.vy -= (player.vy / speed) * friction_force
+        friction_force = car['friction'] * dt
+        vx -= (vx / speed) * friction_force
+        vy -= (vy / speed) * friction_force
 
-    player.vx *= drag
-    player.vy *= drag
+    drag = car['drag']
+    vx *= drag
+    vy *= drag
 
     right_x = -fy
     right_y = fx
 
-    forward_dot = player.vx * fx + player.vy * fy
-    sideways_dot = player.vx * right_x + player.vy * right_y
+    forward_dot = vx * fx + vy * fy
+    sideways_dot = vx * right_x + vy * right_y
 
-    vel_forward_x = fx * forward_dot
-    vel_forward_y = fy * forward_dot
     vel_side_x = right_x * sideways_dot
     vel_side_y = right_y * sideways_dot
 
-    if player.input_state.handbrake:
+    if handbrake:
         target_grip = 0.05
         player.grip_state += (target_grip - player.grip_state) * 4.0 * dt
     else:
-        player.grip_state = base_grip
+        player.grip_state = car['grip']
 
     friction_factor = 0.99 - (player.grip_state * 0.25)
     vel_side_x *= friction_factor
     vel_side_y *= friction_factor
 
-    if not player.input_state.handbrake:
+    if not handbrake:
         vel_side_x *= 0.55
         vel_side_y *= 0.55
 
-    player.vx = vel_forward_x + vel_side_x
-    player.vy = vel_forward_y + vel_side_y
+    vx = fx * forward_dot + vel_side_x
+    vy = fy * forward_dot + vel_side_y
 
-    speed = math.sqrt(player.vx * player.vx + player.vy * player.vy)
+    speed = math.sqrt(vx * vx + vy * vy)
+    max_speed = car['maxSpeed']
     if speed > max_speed:
         scale = max_speed / speed
-        player.vx *= scale
-        player.vy *= scale
+        vx *= scale
+        vy *= scale
 
-    if speed < 3 and not player.input_state.up and not player.input_state.down:
-        player.vx = 0.0
-        player.vy = 0.0
+    if speed < 3 and not up and not down:
+        vx = 0.0
+        vy = 0.0
 
     # sub-step movement to avoid tunneling through walls
-    move_x = player.vx * dt
-    move_y = player.vy * dt
+    move_x = vx * dt
+    move_y = vy * dt
     max_component = max(abs(move_x), abs(move_y))
     steps = max(1, int(max_component // (TILESIZE / 3)) + 1)
 
     step_x = move_x / steps
     step_y = move_y / steps
 
+    rows = room.track_rows
+    width, height = room.track_width_tiles, room.track_height_tiles
+    x, y = player.x, player.y
     for _ in range(steps):
-        next_x = player.x + step_x
-        next_y = player.y + step_y
-        if is_on_road(room, next_x, next_y):
-            player.x = next_x
-            player.y = next_y
+        next_x = x + step_x
+        next_y = y + step_y
+        # is_on_road, inlined
+        col = int(next_x // TILESIZE)
+        row = int(next_y // TILESIZE)
+        if 0 <= row < height and 0 <= col < width and rows[row][col] in ROAD_TILES:
+            x = next_x
+            y = next_y
         else:
-            player.vx *= -0.25
-            player.vy *= -0.25
+            vx *= -0.25
+            vy *= -0.25
+            note_wall_hit(room, player, next_x, next_y)
             break
+    player.x, player.y = x, y
+    player.vx, player.vy = vx, vy
 
 
 def solve_car_collisions(players: List[PlayerState]):
+    awake = [p for p in players if not p.asleep]
+    sleeping = [p for p in players if p.asleep]
+
+    for i in range(len(awake)):
+        a = awake[i]
+        for j in range(i + 1, len(awake)):
+            resolve_car_contact(a, awake[j])
+        for b in sleeping:
+            resolve_car_contact(a, b)
+
+
+def resolve_car_contact(a: PlayerState, b: PlayerState):
     restitution = 0.35
     radius = CAR_COLLISION_RADIUS
 
-    for i in range(len(players)):
-        for j in range(i + 1, len(players)):
-            a = players[i]
-            b = players[j]
+    dx = b.x - a.x
+    dy = b.y - a.y
+    dist_sq = dx * dx + dy * dy
+    min_dist = radius * 2
+    min_dist_sq = min_dist * min_dist
 
-            dx = b.x - a.x
-            dy = b.y - a.y
-            dist_sq = dx * dx + dy * dy
-            min_dist = radius * 2
-            min_dist_sq = min_dist * min_dist
+    if dist_sq <= 0.0001 or dist_sq >= min_dist_sq:
+        return
 
-            if dist_sq <= 0.0001 or dist_sq >= min_dist_sq:
-                continue
+    if b.asleep:
+        wake_player(b)
+
+    dist = math.sqrt(dist_sq)
+    nx = dx / dist
+    ny = dy / dist
+
+    # positional correction
+    overlap = min_dist - dist
+    correction = overlap * 0.5
+    a.x -= nx * correction
+    a.y -= ny * correction
+    b.x += nx * correction
+    b.y += ny * correction
+
+    # resolve velocity along normal
+    rvx = b.vx - a.vx
+    rvy = b.vy - a.vy
+    vel_along_normal = rvx * nx + rvy * ny
+    if vel_along_normal > 0:
+        return
 
-            dist = math.sqrt(dist_sq)
-            nx = dx / dist
-            ny = dy / dist
-
-            # positional correction
-            overlap = min_dist - dist
-            correction = overlap * 0.5
-            a.x -= nx * correction
-            a.y -= ny * correction
-            b.x += nx * correction
-            b.y += ny * correction
-
-            # resolve velocity along normal
-            rvx = b.vx - a.vx
-            rvy = b.vy - a.vy
-            vel_along_normal = rvx * nx + rvy * ny
-            if vel_along_normal > 0:
-                continue
+    impulse = -(1.0 + restitution) * vel_along_normal / 2.0
+    ix = impulse * nx
+    iy = impulse * ny
 
-            impulse = -(1.0 + restitution) * vel_along_normal / 2.0
-            ix = impulse * nx
-            iy = impulse * ny
+    a.vx -= ix
+    a.vy -= iy
+    b.vx += ix
+    b.vy += iy
 
-            a.vx -= ix
-            a.vy -= iy
-            b.vx += ix
-            b.vy += iy
 
+def update_player_laps(room: RoomState, player: PlayerState, tick_start: float, dt: float):
+    sectors = room.track_sectors
+    if player.lap_check_position is None:
+        # Just spawned or respawned: only the tile the car is on counts.
+        entries = [(1.0, int(player.x // TILESIZE), int(player.y // TILESIZE))]
+    else:
+        x0, y0 = player.lap_check_position
+        entries = segment_tile_entries(x0, y0, player.x, player.y)
+    player.lap_check_position = (player.x, player.y)
+
+    for fraction, col, row in entries:
+        # Gates only count in order, so a later checkpoint group or the
+        # finish cannot be reached by cutting across the infield.
+        gate = sectors.gate_at(col, row)
+        if gate != player.next_sector:
+            continue
 
-def update_laps_and_finish(room: RoomState):
-    if room.phase != 'racing':
+        crossed_at = tick_start + fraction * dt
+        if gate < sectors.finish_index:
+            player.lap_splits.append(int((crossed_at - player.lap_start_time) * 1000.0))
+            player.next_sector += 1
+            continue
+        if crossed_at - player.last_finish_cross_time <= 1.0:
+            continue
+        player.last_finish_cross_time = crossed_at
+        lap_time_ms = (crossed_at - player.lap_start_time) * 1000.0
+        player.lap_start_time = crossed_at
+        player.laps += 1
+        player.next_sector = 0
+        lap_splits = player.lap_splits + [int(lap_time_ms)]
+        player.lap_splits = []
+
+        if player.best_lap_time == 0 or lap_time_ms < player.best_lap_time:
+            player.best_lap_time = lap_time_ms
+            player.best_lap_splits = lap_splits
+            if not player.is_bot and not room.headless:
+                offer_lap_ghost(room, player, lap_time_ms)
+        player.ghost_trace = []
+        log_race_event(room, 'lap', lap=player.laps, lapMs=round(lap_time_ms, 3), **player_event_fields(player))
+
+        if player.laps >= room.laps_to_win:
+            player.finished = True
+            player.race_total_time = crossed_at * 1000.0
+            log_race_event(
+                room,
+                'finish',
+                timeMs=round(player.race_total_time, 3),
+                place=sum(1 for p in room.players.values() if p.finished),
+                **player_event_fields(player),
+            )
+            record = not player.is_bot and not room.headless and not any(
+                p.finished and not p.is_bot for p in room.players.values() if p is not player
+            )
+            if room.winner_id is None:
+                room.winner_id = player.player_id
+            if record:
+                # Bots never go on the global board; the first human
+                # home claims a place, even behind a bot, and gets it once
+                # the run re-simulates to the same time.
+                claim_leaderboard_place(room, player)
+            return
+
+
+def offer_lap_ghost(room: RoomState, player: PlayerState, lap_time_ms: float):
+    # The compare and the file write happen on a worker thread, so a new
+    # record never stalls the tick.
+    if len(player.ghost_trace) < 6:
         return
+    task = asyncio.get_running_loop().create_task(
+        asyncio.to_thread(
+            GHOST_STORE.offer,
+            room.track_id,
+            leaderboard_category(room.laps_to_win),
+            room.track_hash,
+            player.name,
+            lap_time_ms,
+            GHOST_SAMPLE_TICKS * 1000.0 / TICK_HZ,
+            player.ghost_offset * 1000.0,
+            player.ghost_trace,
+        )
+    )
+    GHOST_WRITES.add(task)
+    task.add_done_callback(finish_ghost_write)
 
-    now = now_seconds()
 
+def finish_ghost_write(task: asyncio.Task):
+    GHOST_WRITES.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error('Could not store a lap ghost', exc_info=task.exception())
+
+
+def record_ghost_samples(room: RoomState):
+    # Humans' poses every GHOST_SAMPLE_TICKS ticks after the lap check; the
+    # trace restarts whenever update_player_laps completes a lap.
+    if room.headless or room.tick % GHOST_SAMPLE_TICKS:
+        return
     for player in room.players.values():
-        if player.finished:
+        if player.is_bot or player.finished:
             continue
+        if not player.ghost_trace:
+            player.ghost_offset = room.race_clock - player.lap_start_time
+        player.ghost_trace += (player.x, player.y, player.rotation_deg)
 
-        tile = current_tile(room, player.x, player.y)
-
-        if tile == 'C':
-            player.checkpoint_passed = True
 
-        if tile == 'F' and player.checkpoint_passed and (now - player.last_finish_cross_time) > 1.0:
-            player.last_finish_cross_time = now
-            lap_time_ms = (now - player.lap_start_time) * 1000.0
-            player.lap_start_time = now
-            player.laps += 1
-            player.checkpoint_passed = False
+async def send_track_ghost(room: RoomState, player: PlayerState):
+    # Once per race to players who opted in, with None when there is no
+    # ghost, so the client can drop the last track's.
+    if not player.wants_ghost or player.ghost_sent or player.websocket is None:
+        return
+    player.ghost_sent = True
+    ghost = await asyncio.to_thread(GHOST_STORE.get, room.track_id, leaderboard_category(room.laps_to_win), room.track_hash)
+    await safe_send_json(player.websocket, {'type': 'ghost', 'ghost': ghost})
 
-            if player.best_lap_time == 0 or lap_time_ms < player.best_lap_time:
-                player.best_lap_time = lap_time_ms
 
-            if player.laps >= room.laps_to_win:
-                player.finished = True
-                player.race_total_time = (now - room.race_start_time) * 1000.0
-                if room.winner_id is None:
-                    room.winner_id = player.player_id
-                    update_global_leaderboard(room.track_id, player, room.laps_to_win)
+def update_laps_and_finish(room: RoomState, dt: float):
+    if room.phase != 'racing':
+        return
 
-    finished_count = sum(1 for p in room.players.values() if p.finished)
-    player_count = len(room.players)
-    if player_count > 0 and finished_count >= race_finish_threshold(player_count):
+    # Times come from the race clock, not the wall clock, and each crossing is
+    # placed inside the tick by where the move crossed into the gate tile, so
+    # lap times do not snap to ticks or pick up scheduling lateness.
+    room.race_clock += dt
+    tick_start = room.race_clock - dt
+    if room.track_sectors is not None:
+        for player in room.players.values():
+            if not player.finished:
+                update_player_laps(room, player, tick_start, dt)
+
+    update_standings(room, room.race_clock)
+
+    # Bots fill the grid but do not count towards ending the race: it runs
+    # until the usual share of the humans are home, or every car is.
+    humans = [p for p in room.players.values() if not p.is_bot]
+    finished_count = sum(1 for p in humans if p.finished)
+    if humans and (
+        finished_count >= race_finish_threshold(len(humans))
+        or all(p.finished for p in room.players.values())
+    ):
         room.phase = 'finished'
 
 
-def get_or_create_room(room_id: str) -> RoomState:
+def update_standings(room: RoomState, now: float):
+    # Live order from the track's progress field. Gaps use timing loops: the
+    # first car into each progress bucket stamps it, and everyone behind is
+    # as far back as the time since that stamp.
+    progress_field = room.progress_field
+    if progress_field is None:
+        room.standings = []
+        return
+
+    for player in room.players.values():
+        if player.finished:
+            continue
+        player.lap_progress = progress_field.progress(player.x, player.y, player.next_sector, TILESIZE)
+        bucket = player.laps * PROGRESS_BUCKETS_PER_LAP + int(player.lap_progress * PROGRESS_BUCKETS_PER_LAP)
+        for passed in range(max(player.progress_bucket + 1, bucket - PROGRESS_BUCKETS_PER_LAP), bucket + 1):
+            room.progress_times.setdefault(passed, now)
+        player.progress_bucket = max(player.progress_bucket, bucket)
+
+    finished = sorted((p for p in room.players.values() if p.finished), key=lambda p: p.race_total_time)
+    running = sorted(
+        (p for p in room.players.values() if not p.finished),
+        key=lambda p: p.laps + p.lap_progress,
+        reverse=True,
+    )
+    standings = []
+    for player in finished:
+        gap_ms = player.race_total_time - finished[0].race_total_time
+        standings.append([player.player_id, int(gap_ms)])
+    for player in running:
+        if not standings:
+            standings.append([player.player_id, 0])
+            continue
+        stamped = room.progress_times.get(int((player.laps + player.lap_progress) * PROGRESS_BUCKETS_PER_LAP))
+        gap_ms = (now - stamped) * 1000.0 if stamped is not None else 0.0
+        standings.append([player.player_id, int(gap_ms)])
+    room.standings = standings
+
+
+def has_humans(room: RoomState) -> bool:
+    return any(not p.is_bot for p in room.players.values())
+
+
+def set_room_bots(room: RoomState, count: int):
+    # Bots are ordinary PlayerStates with no socket: they take grid slots,
+    # collide, score laps and show up in snapshots like anyone else, but
+    # nothing is ever encoded or sent for them.
+    count = max(0, min(MAX_BOTS_PER_ROOM, count))
+    bots = [p for p in room.players.values() if p.is_bot]
+    for bot in bots[count:]:
+        del room.players[bot.player_id]
+    for number in range(len(bots), count):
+        bot = PlayerState(
+            player_id=str(uuid.uuid4())[:8],
+            name=f'Bot {number + 1}',
+            x=room.spawn_x + len(room.players) * 18,
+            y=room.spawn_y,
+            rotation_deg=room.spawn_rotation_deg,
+            websocket=None,
+            ready=True,
+            bot=BotState(),
+        )
+        set_player_car(bot, len(room.players) % max(1, len(WEB_CAR_MODELS)))
+        room.players[bot.player_id] = bot
+    if len(bots) != count:
+        room.roster_version += 1
+
+
+def drive_bots(room: RoomState, bots: List[PlayerState]):
+    # One pass over every bot in the room before physics. Each bot steers at
+    # its near flow-field target and lifts and brakes at speed when either
+    # that or the far target is well off its nose. A bot pinned against a
+    # wall backs out; one that stops making progress altogether is put back
+    # on the road facing along the field.
+    flow_field = room.flow_field
+    if flow_field is None or not bots:
+        return
+    targets = flow_field.targets
+    brake_targets = flow_field.brake_targets
+    width = flow_field.width
+    last_col, last_row = width - 1, flow_field.height - 1
+    half_tile = TILESIZE * 0.5
+    brake_speed_sq = BOT_BRAKE_SPEED * BOT_BRAKE_SPEED
+    stuck_speed_sq = BOT_STUCK_SPEED * BOT_STUCK_SPEED
+    atan2 = math.atan2
+    pi = math.pi
+    two_pi = 2.0 * pi
+
+    for player in bots:
+        state = player.input_state
+        if player.finished:
+            state.up = state.down = False
+            state.throttle = state.brake = state.steer = 0.0
+            continue
+
+        bot = player.bot
+        if player.progress_bucket > bot.best_bucket:
+            bot.best_bucket = player.progress_bucket
+            bot.idle_ticks = 0
+        else:
+            bot.idle_ticks += 1
+        speed_sq = player.vx * player.vx + player.vy * player.vy
+        respawned = False
+        if bot.idle_ticks >= BOT_STUCK_TICKS:
+            respawn_player_on_track_center(room, player)
+            bot.idle_ticks = bot.slow_ticks = bot.reverse_ticks = 0
+            respawned = True
+            log_race_event(room, 'respawn', **player_event_fields(player))
+        elif speed_sq < stuck_speed_sq:
+            bot.slow_ticks += 1
+            if bot.slow_ticks >= BOT_REVERSE_AFTER_TICKS and bot.reverse_ticks == 0:
+                bot.slow_ticks = 0
+                bot.reverse_ticks = BOT_REVERSE_TICKS
+        else:
+            bot.slow_ticks = 0
+
+        tile = min(last_row, max(0, int(player.y // TILESIZE))) * width + min(last_col, max(0, int(player.x // TILESIZE)))
+        near = targets[player.next_sector][tile]
+        far = brake_targets[player.next_sector][tile]
+        near_angle = atan2((near // width) * TILESIZE + half_tile - player.y, (near % width) * TILESIZE + half_tile - player.x)
+        far_angle = atan2((far // width) * TILESIZE + half_tile - player.y, (far % width) * TILESIZE + half_tile - player.x)
+        if respawned:
+            player.rotation_deg = (math.degrees(near_angle) - 180.0) % 360
+        # Throttle pushes the car along -(cos, sin) of its rotation.
+        heading = math.radians(player.rotation_deg) + pi
+        error = (near_angle - heading + pi) % two_pi - pi
+        far_error = (far_angle - heading + pi) % two_pi - pi
+
+        if bot.reverse_ticks > 0:
+            # Backing out swings the nose the other way round.
+            bot.reverse_ticks -= 1
+            state.steer = -1.0 if error > 0.0 else 1.0
+            state.up, state.down = False, True
+            state.throttle, state.brake = 0.0, 1.0
+        elif speed_sq > brake_speed_sq and max(abs(error), abs(far_error)) > BOT_BRAKE_ANGLE:
+            state.steer = max(-1.0, min(1.0, error * BOT_STEER_GAIN))
+            state.up, state.down = False, True
+            state.throttle, state.brake = 0.0, 1.0
+        else:
+            state.steer = max(-1.0, min(1.0, error * BOT_STEER_GAIN))
+            state.up, state.down = True, False
+            state.throttle, state.brake = 1.0, 0.0
+        if player.asleep:
+            wake_player(player)
+
+
+def get_or_create_room(room_id: str) -> RoomState | None:
     room = ROOMS.get(room_id)
     if room:
         return room
 
+    if GOVERNOR.level >= 4:
+        GOVERNOR.refused_rooms += 1
+        return None
+
     room = RoomState(room_id=room_id)
     ROOMS[room_id] = room
     return room
 
 
+async def refuse_connection(
+    websocket: WebSocket,
+    message: str = 'Server is busy and not opening new rooms right now. Try again shortly.',
+    code: int = 1013,
+):
+    await safe_send_json(websocket, {'type': 'error', 'message': message})
+    try:
+        await websocket.close(code=code)
+    except Exception:
+        pass
+
+
+def update_governor(lag_ms: float, now: float):
+    # Load is shed one level at a time in a fixed order (lobby broadcasts,
+    # spectator frames, distant cars, new rooms) so racers' physics is the
+    # last thing to suffer. Levels only step down after a calm period.
+    GOVERNOR.lag_ms += (lag_ms - GOVERNOR.lag_ms) * 0.3
+    GOVERNOR.max_lag_ms = max(GOVERNOR.max_lag_ms, lag_ms)
+    target_level = sum(1 for limit in GOVERNOR_LEVEL_LAG_MS if GOVERNOR.lag_ms > limit)
+
+    new_level = GOVERNOR.level
+    if target_level > GOVERNOR.level:
+        new_level = GOVERNOR.level + 1
+        GOVERNOR.calm_since = now
+    elif target_level < GOVERNOR.level:
+        if now - GOVERNOR.calm_since >= GOVERNOR_RECOVERY_SECONDS:
+            new_level = GOVERNOR.level - 1
+            GOVERNOR.calm_since = now
+    else:
+        GOVERNOR.calm_since = now
+
+    if new_level != GOVERNOR.level:
+        logger.warning(
+            'Overload governor %s -> %s (event loop lag %.1f ms)',
+            GOVERNOR_LEVEL_NAMES[GOVERNOR.level],
+            GOVERNOR_LEVEL_NAMES[new_level],
+            GOVERNOR.lag_ms,
+        )
+        GOVERNOR.level = new_level
+        GOVERNOR.level_changes += 1
+
+
+async def event_loop_lag_monitor():
+    interval = GOVERNOR_SAMPLE_INTERVAL_SECONDS
+    expected = time.perf_counter() + interval
+    while True:
+        await asyncio.sleep(interval)
+        now = time.perf_counter()
+        update_governor(max(0.0, (now - expected) * 1000.0), now)
+        expected = now + interval
+
+
 async def room_tick_loop(room: RoomState):
     dt = 1.0 / TICK_HZ
     next_tick = now_seconds()
 
     try:
         while True:
-            if not room.players:
+            if not has_humans(room) and not room.spectators:
                 await asyncio.sleep(0.2)
-                if not room.players:
+                if not has_humans(room) and not room.spectators:
                     break
 
+            tick_started = time.perf_counter()
+            lateness = max(0.0, now_seconds() - next_tick)
+            TICK_LATENESS_SECONDS.observe(lateness)
+            track = room_trace_track(room)
             maybe_begin_race(room)
 
             if room.phase == 'racing':
                 player_list = list(room.players.values())
+                replay.record_tick(room)
+                drive_bots(room, [player for player in player_list if player.is_bot])
                 for player in player_list:
-                    step_player_physics(room, player, dt)
-                solve_car_collisions(player_list)
-                update_laps_and_finish(room)
+                    if not player.asleep:
+                        step_player_physics(room, player, dt)
+                mark = time.perf_counter()
+                TICK_PHASE_SECONDS.observe(mark - tick_started, ('physics',))
+                TRACER.add('physics', track, tick_started, mark)
 
-            await broadcast_room_state(room)
+                solve_car_collisions(player_list)
+                phase_end = time.perf_counter()
+                TICK_PHASE_SECONDS.observe(phase_end - mark, ('collisions',))
+                TRACER.add('collisions', track, mark, phase_end)
+                mark = phase_end
+
+                update_laps_and_finish(room, dt)
+                record_ghost_samples(room)
+                record_heatmap_samples(room)
+                if room.phase != 'racing':
+                    close_race(room)
+                phase_end = time.perf_counter()
+                TICK_PHASE_SECONDS.observe(phase_end - mark, ('laps',))
+                TRACER.add('laps', track, mark, phase_end)
+                mark = phase_end
+            else:
+                # Also ends a recording cut short by a lobby reset.
+                close_race(room)
+                if room.track_library_version != TRACK_LIBRARY_VERSION:
+                    await send_room_tracks(room)
+                mark = time.perf_counter()
+
+            update_sleep_states(room)
+            if room_broadcast_due(room):
+                await broadcast_room_state(room, from_tick=True)
+            phase_end = time.perf_counter()
+            TICK_PHASE_SECONDS.observe(phase_end - mark, ('broadcast',))
+            TRACER.add('broadcast', track, mark, phase_end)
+            mark = phase_end
+
+            broadcast_spectator_frame(room)
+            phase_end = time.perf_counter()
+            TICK_PHASE_SECONDS.observe(phase_end - mark, ('spectators',))
+            TICK_PHASE_SECONDS.observe(phase_end - tick_started, ('total',))
+            if TRACER.enabled:
+                TRACER.add('spectators', track, mark, phase_end)
+                TRACER.add(
+                    'tick',
+                    track,
+                    tick_started,
+                    phase_end,
+                    {'tick': room.tick, 'phase': room.phase, 'players': len(room.players), 'lateMs': lateness * 1000.0},
+                )
+            room.tick_cost_ms += ((phase_end - tick_started) * 1000.0 - room.tick_cost_ms) * 0.1
+            room.tick += 1
 
             next_tick += dt
             sleep_for = next_tick - now_seconds()
@@ -937,15 +2388,71 @@ async def room_tick_loop(room: RoomState):
                 next_tick = now_seconds()
     finally:
         room.tick_task = None
-        if not room.players and room.room_id in ROOMS:
+        close_race(room)
+        if not has_humans(room) and not room.spectators and room.room_id in ROOMS:
             del ROOMS[room.room_id]
 
 
+def ensure_room_tick_task(room: RoomState):
+    if room.tick_task is None or room.tick_task.done():
+        room.tick_task = asyncio.create_task(room_tick_loop(room))
+
+
+@app.websocket('/ws/replay/{race_id}')
+async def websocket_replay(websocket: WebSocket, race_id: str):
+    # Registered before the player route, which would otherwise take
+    # /ws/replay/<id> as room 'replay'.
+    await websocket.accept()
+    await replay.serve_replay(websocket, race_id)
+
+
+@app.websocket('/ws/{room_id}/spectate')
+async def websocket_spectate(websocket: WebSocket, room_id: str):
+    await websocket.accept()
+
+    # Spectating never opens a room: there would be no race to watch, only an
+    # empty room ticking for as long as the viewer stayed.
+    room = ROOMS.get(room_id)
+    if room is None:
+        await refuse_connection(websocket, f'Room {room_id} does not exist.', code=1008)
+        return
+    spectator_id = str(uuid.uuid4())[:8]
+    room.spectators[spectator_id] = SpectatorState(spectator_id=spectator_id, websocket=websocket)
+    ensure_room_tick_task(room)
+
+    await safe_send_json(
+        websocket,
+        {
+            'type': 'welcome',
+            'spectator': True,
+            'playerId': None,
+            'roomId': room_id,
+            'map': room_map_payload(room),
+            'tracks': available_tracks_payload(),
+            'cars': WEB_CAR_MODELS,
+            'spectatorDelayMs': int(SPECTATOR_DELAY_SECONDS * 1000),
+        },
+    )
+
+    try:
+        while True:
+            # Spectators are watch-only; anything they send is ignored.
+            raw = await websocket.receive_text()
+            count_inbound('spectator', len(raw))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        room.spectators.pop(spectator_id, None)
+
+
 @app.websocket('/ws/{room_id}/{player_name}')
 async def websocket_game(websocket: WebSocket, room_id: str, player_name: str):
     await websocket.accept()
 
     room = get_or_create_room(room_id)
+    if room is None:
+        await refuse_connection(websocket)
+        return
 
     player_id = str(uuid.uuid4())[:8]
 
@@ -959,9 +2466,9 @@ async def websocket_game(websocket: WebSocket, room_id: str, player_name: str):
     )
     set_player_car(player, len(room.players) % max(1, len(WEB_CAR_MODELS)))
     room.players[player_id] = player
+    room.roster_version += 1
 
-    if room.tick_task is None or room.tick_task.done():
-        room.tick_task = asyncio.create_task(room_tick_loop(room))
+    ensure_room_tick_task(room)
 
     await safe_send_json(
         websocket,
@@ -979,8 +2486,10 @@ async def websocket_game(websocket: WebSocket, room_id: str, player_name: str):
 
     try:
         while True:
-            message = await websocket.receive_json()
+            raw = await websocket.receive_text()
+            message = json.loads(raw)
             msg_type = message.get('type')
+            count_inbound(msg_type, len(raw))
 
             if msg_type == 'input':
                 input_payload = message.get('input', {})
@@ -990,10 +2499,12 @@ async def websocket_game(websocket: WebSocket, room_id: str, player_name: str):
                     left=bool(input_payload.get('left', False)),
                     right=bool(input_payload.get('right', False)),
                     handbrake=bool(input_payload.get('handbrake', False)),
-                    throttle=max(0.0, min(1.0, safe_float(input_payload.get('throttle', 0.0), 0.0))),
-                    brake=max(0.0, min(1.0, safe_float(input_payload.get('brake', 0.0), 0.0))),
-                    steer=max(-1.0, min(1.0, safe_float(input_payload.get('steer', 0.0), 0.0))),
+                    throttle=quantize_axis(safe_float(input_payload.get('throttle', 0.0), 0.0), 0.0, 1.0),
+                    brake=quantize_axis(safe_float(input_payload.get('brake', 0.0), 0.0), 0.0, 1.0),
+                    steer=quantize_axis(safe_float(input_payload.get('steer', 0.0), 0.0), -1.0, 1.0),
                 )
+                if not input_is_neutral(player.input_state):
+                    wake_player(player)
 
             elif msg_type == 'garage':
                 requested_car_id = int(message.get('carId', 0))
@@ -1004,6 +2515,7 @@ async def websocket_game(websocket: WebSocket, room_id: str, player_name: str):
                 if room.phase in ('lobby', 'finished'):
                     room.laps_to_win = max(1, min(5, requested_laps))
                     player.ready = requested_ready
+                wake_player(player)
 
             elif msg_type == 'set_track':
                 if room.phase not in ('lobby', 'finished'):
@@ -1031,10 +2543,16 @@ async def websocket_game(websocket: WebSocket, room_id: str, player_name: str):
                                 },
                             )
                         else:
-                            set_room_track(room, CUSTOM_TRACK_ID, validated_rows, f'Custom by {player.name}', requested_rotation)
+                            track_name = f'Custom by {player.name}'
+                            track_id = CUSTOM_TRACK_ID
+                            try:
+                                stored = await persist_custom_track(validated_rows, track_name, requested_rotation)
+                                track_id, track_name = stored['id'], stored['name']
+                            except OSError:
+                                logger.exception('Could not persist custom track')
+                            set_room_track(room, track_id, validated_rows, track_name, requested_rotation)
                             await broadcast_room_map(room)
-                    elif requested_track_id in TRACK_LIBRARY:
-                        preset = TRACK_LIBRARY[requested_track_id]
+                    elif (preset := resolve_track(requested_track_id)) is not None:
                         set_room_track(
                             room,
                             preset['id'],
@@ -1052,10 +2570,39 @@ async def websocket_game(websocket: WebSocket, room_id: str, player_name: str):
                             },
                         )
 
+            elif msg_type == 'set_bots':
+                if room.phase in ('lobby', 'finished'):
+                    set_room_bots(room, int(message.get('count', 0)))
+                else:
+                    await safe_send_json(
+                        websocket,
+                        {
+                            'type': 'error',
+                            'message': 'Bots can only be changed in lobby or after race finish.',
+                        },
+                    )
+
+            elif msg_type == 'ghost':
+                player.wants_ghost = bool(message.get('enabled', False))
+                if room.phase in ('countdown', 'racing'):
+                    await send_track_ghost(room, player)
+
             elif msg_type == 'start_race':
                 if room.phase in ('lobby', 'finished') and room.players:
                     if all(p.ready for p in room.players.values()):
-                        start_countdown(room)
+                        rows, spawn_rotation_deg = tuple(room.track_rows), room.spawn_rotation_deg
+                        geometry = await asyncio.to_thread(build_track_geometry, rows, spawn_rotation_deg)
+                        # The room may have started, emptied or changed track meanwhile.
+                        if (
+                            room.phase in ('lobby', 'finished')
+                            and room.players
+                            and all(p.ready for p in room.players.values())
+                            and tuple(room.track_rows) == rows
+                            and room.spawn_rotation_deg == spawn_rotation_deg
+                        ):
+                            start_countdown(room, geometry)
+                            for p in list(room.players.values()):
+                                await send_track_ghost(room, p)
                     else:
                         await safe_send_json(
                             websocket,
@@ -1069,12 +2616,17 @@ async def websocket_game(websocket: WebSocket, room_id: str, player_name: str):
                 room.phase = 'lobby'
                 room.winner_id = None
                 for p in room.players.values():
-                    p.ready = False
+                    p.ready = p.is_bot
                     p.finished = False
                     p.laps = 0
+                    wake_player(p)
 
             elif msg_type == 'respawn':
+                replay.note_respawn(room, player)
                 respawn_player_on_track_center(room, player)
+                wake_player(player)
+                if room.phase == 'racing':
+                    log_race_event(room, 'respawn', **player_event_fields(player))
                 await safe_send_json(
                     websocket,
                     {
@@ -1086,6 +2638,8 @@ async def websocket_game(websocket: WebSocket, room_id: str, player_name: str):
                 )
 
             elif msg_type == 'ping':
+                player.rtt_ms = max(0.0, min(5000.0, safe_float(message.get('rttMs', player.rtt_ms), player.rtt_ms)))
+                update_snapshot_tier(player)
                 await safe_send_json(
                     websocket,
                     {
@@ -1095,11 +2649,28 @@ async def websocket_game(websocket: WebSocket, room_id: str, player_name: str):
                     },
                 )
 
-            await broadcast_room_state(room)
+            if msg_type not in ('input', 'ghost', 'ping'):
+                await broadcast_room_state(room)
 
     except WebSocketDisconnect:
         pass
     finally:
         if player_id in room.players:
             del room.players[player_id]
+            room.roster_version += 1
+            log_race_event(
+                room,
+                'disconnect',
+                phase=room.phase,
+                racing=room.phase == 'racing' and not player.finished,
+                laps=player.laps,
+                **player_event_fields(player),
+            )
+        if not has_humans(room):
+            set_room_bots(room, 0)
         await broadcast_room_state(room)
+
+
+# Measured last so it covers the whole module import; lifespan fills in
+# readyMs once uvicorn starts serving.
+STARTUP = {'importMs': round((time.perf_counter() - IMPORT_STARTED_AT) * 1000.0, 1), 'readyMs': None}
@@ -0,0 +1,91 @@
+import os
+import time
+from collections import deque
+
+
+DEFAULT_TRACE_CAPACITY = 50000
+
+
+class Span:
+    __slots__ = ('tracer', 'name', 'track', 'args', 'start')
+
+    def __init__(self, tracer: 'Tracer', name: str, track: str, args):
+        self.tracer = tracer
+        self.name = name
+        self.track = track
+        self.args = args
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.tracer.add(self.name, self.track, self.start, time.perf_counter(), self.args)
+        return False
+
+
+class NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Tracer:
+    # Spans are (name, track, start, duration, args) tuples in perf_counter
+    # seconds, kept in a ring buffer so the tracer can stay on indefinitely.
+    def __init__(self, enabled: bool = False, capacity: int = DEFAULT_TRACE_CAPACITY):
+        self.enabled = enabled
+        self.spans = deque(maxlen=max(1, capacity))
+
+    def add(self, name: str, track: str, start: float, end: float, args=None):
+        if self.enabled:
+            self.spans.append((name, track, start, end - start, args))
+
+    def span(self, name: str, track: str, args=None):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, track, args)
+
+    def export(self, seconds: float | None = None) -> dict:
+        cutoff = time.perf_counter() - seconds if seconds is not None else None
+        pid = os.getpid()
+        track_ids = {}
+        events = [
+            {'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0, 'args': {'name': 'chunkydrift server'}},
+        ]
+        for name, track, start, duration, args in list(self.spans):
+            if cutoff is not None and start + duration < cutoff:
+                continue
+            tid = track_ids.get(track)
+            if tid is None:
+                tid = track_ids[track] = len(track_ids) + 1
+                events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': track}})
+            event = {
+                'name': name,
+                'ph': 'X',
+                'pid': pid,
+                'tid': tid,
+                'ts': start * 1_000_000.0,
+                'dur': duration * 1_000_000.0,
+            }
+            if args:
+                event['args'] = args
+            events.append(event)
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def tracer_from_env() -> Tracer:
+    enabled = os.environ.get('CHUNKYDRIFT_TRACE', '').lower() in ('1', 'true', 'yes', 'on')
+    try:
+        capacity = int(os.environ.get('CHUNKYDRIFT_TRACE_SPANS', DEFAULT_TRACE_CAPACITY))
+    except ValueError:
+        capacity = DEFAULT_TRACE_CAPACITY
+    return Tracer(enabled, capacity)
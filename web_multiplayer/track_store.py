@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+
+TRACK_STORE_VERSION = 1
+DEFAULT_CACHE_SIZE = 64
+
+
+def track_hash(rows) -> str:
+    return hashlib.sha256('\n'.join(rows).encode('utf-8')).hexdigest()
+
+
+def atomic_write_json(path: Path, payload, indent=None):
+    # Write next to the target and rename over it so readers (the server,
+    # another editor) only ever see a complete file.
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=f'.{path.name}.', suffix='.tmp', dir=path.parent)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            json.dump(payload, file, indent=indent, separators=None if indent else (',', ':'))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class TrackStore:
+    # Track bodies live in blobs/<hh>/<sha256>.json keyed by their rows, so
+    # identical uploads share one file. index.json only holds the small
+    # per-track metadata, which is all that is needed to list tracks.
+    def __init__(self, root: Path, cache_size: int = DEFAULT_CACHE_SIZE):
+        self.root = Path(root)
+        self.index_path = self.root / 'index.json'
+        self.blob_dir = self.root / 'blobs'
+        self.cache_size = max(1, cache_size)
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def blob_path(self, digest: str) -> Path:
+        return self.blob_dir / digest[:2] / f'{digest}.json'
+
+    def read_index(self) -> dict:
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return {}
+        tracks = data.get('tracks', {}) if isinstance(data, dict) else {}
+        return tracks if isinstance(tracks, dict) else {}
+
+    def write_index(self, tracks: dict):
+        atomic_write_json(self.index_path, {'version': TRACK_STORE_VERSION, 'tracks': tracks}, indent=1)
+
+    def list_entries(self):
+        return sorted(self.read_index().values(), key=lambda entry: str(entry.get('name', '')).lower())
+
+    def get_entry(self, track_id: str):
+        return self.read_index().get(track_id)
+
+    def load_rows(self, digest: str):
+        with self.lock:
+            rows = self.cache.get(digest)
+            if rows is not None:
+                self.cache.move_to_end(digest)
+                return rows
+        try:
+            with open(self.blob_path(digest), 'r', encoding='utf-8') as file:
+                rows = json.load(file).get('rows')
+        except (OSError, ValueError, AttributeError):
+            return None
+        if not isinstance(rows, list) or track_hash(rows) != digest:
+            return None
+        with self.lock:
+            self.cache[digest] = rows
+            self.cache.move_to_end(digest)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return rows
+
+    def load_track(self, track_id: str):
+        entry = self.get_entry(track_id)
+        if entry is None:
+            return None
+        rows = self.load_rows(entry['hash'])
+        if rows is None:
+            return None
+        return {**entry, 'rows': list(rows)}
+
+    def put_blob(self, rows) -> str:
+        rows = [str(row) for row in rows]
+        digest = track_hash(rows)
+        path = self.blob_path(digest)
+        if not path.exists():
+            atomic_write_json(path, {'rows': rows})
+        return digest
+
+    def save_track(self, track_id: str, name: str, rows, spawn_rotation_deg: float) -> dict:
+        rows = [str(row) for row in rows]
+        digest = self.put_blob(rows)
+        entry = {
+            'id': track_id,
+            'name': name,
+            'hash': digest,
+            'width': len(rows[0]) if rows else 0,
+            'height': len(rows),
+            'spawnRotationDeg': float(spawn_rotation_deg),
+            'updatedAt': round(time.time(), 3),
+        }
+        with self.lock:
+            tracks = self.read_index()
+            tracks[track_id] = entry
+            self.write_index(tracks)
+        return entry
+
+    def delete_track(self, track_id: str):
+        # Blobs are left in place; another entry may share them.
+        with self.lock:
+            tracks = self.read_index()
+            if tracks.pop(track_id, None) is not None:
+                self.write_index(tracks)
+
+    def migrate_from_json(self, legacy_path: Path) -> int:
+        # Imports tracks from the old monolithic custom_tracks.json that the
+        # index does not know yet, so running it on every start is cheap and
+        # idempotent.
+        legacy_path = Path(legacy_path)
+        if not legacy_path.exists():
+            return 0
+        try:
+            with open(legacy_path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return 0
+        items = data.get('tracks', []) if isinstance(data, dict) else []
+
+        with self.lock:
+            tracks = self.read_index()
+            added = 0
+            for item in items:
+                if not isinstance(item, dict):
+                    continue
+                track_id = str(item.get('id', '')).strip()
+                rows = [str(row).rstrip('\n\r') for row in item.get('rows', []) if str(row).strip()]
+                if not track_id or not rows or track_id in tracks:
+                    continue
+                try:
+                    rotation = float(item.get('spawnRotationDeg', 90.0))
+                except (TypeError, ValueError):
+                    rotation = 90.0
+                tracks[track_id] = {
+                    'id': track_id,
+                    'name': str(item.get('name', track_id)).strip() or track_id,
+                    'hash': self.put_blob(rows),
+                    'width': len(rows[0]),
+                    'height': len(rows),
+                    'spawnRotationDeg': rotation,
+                    'updatedAt': round(time.time(), 3),
+                }
+                added += 1
+            if added:
+                self.write_index(tracks)
+        return added
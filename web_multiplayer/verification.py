@@ -0,0 +1,221 @@
+# Global leaderboard verification. The first human home in a race claims a
+# place on the board; the claim is only promoted once a worker process has
+# re-simulated the race's replay from its recorded inputs alone (keyframes
+# are not snapped to) on the replay's own track and arrived at the same
+# finishing time.
+#
+#     python -m web_multiplayer.verification <race id or .cdr path> [--player ID]
+#
+# Each claim's replay is kept apart from the per-room replay folders, which
+# are pruned: submissions/<race id>-<player id>.cdr while the claim is being
+# verified or the run is on the board, submissions/rejected/ for runs that
+# failed. Every verdict is appended to submissions/submissions.jsonl.
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from web_multiplayer import replay
+from web_multiplayer.track_store import track_hash
+
+
+logger = logging.getLogger('web_multiplayer.verification')
+
+SUBMISSION_DIR = Path(__file__).parent / 'submissions'
+SUBMISSION_LOG = 'submissions.jsonl'
+VERIFY_TOLERANCE_MS = 1.0  # boards show whole milliseconds
+VERIFY_WORKERS = int(os.environ.get('CHUNKYDRIFT_VERIFY_WORKERS', '0')) or max(1, (os.cpu_count() or 2) - 1)
+
+VERIFY_POOL = None
+VERIFY_TASKS = set()
+PENDING_CLAIMS = set()  # replay names of claims not yet recorded
+RECORD_LOCK = asyncio.Lock()  # one verdict at a time prunes submissions/
+
+
+def verify_run(path: str, player_id: str, claimed_ms: float, rows_hash: str) -> dict:
+    # Runs in a worker process. Returns the verdict as a plain dict.
+    try:
+        replay_file = replay.ReplayFile(path)
+    except (OSError, replay.ReplayError) as exc:
+        return {'status': 'error', 'reason': f'unreadable replay: {exc}'}
+    if not replay_file.complete:
+        return {'status': 'rejected', 'reason': 'replay is incomplete'}
+    if track_hash(replay_file.rows) != rows_hash:
+        return {'status': 'rejected', 'reason': 'replay was not driven on the claimed track'}
+    slot = next((index for index, car in enumerate(replay_file.cars) if car[0] == player_id), None)
+    if slot is None or replay_file.cars[slot][3]:
+        return {'status': 'rejected', 'reason': 'claimed driver is not a human in the replay'}
+
+    started = time.perf_counter()
+    player = replay.ReplayPlayer(replay_file)
+    player.snap = False
+    player.advance(replay_file.ticks)
+    car = player.cars[slot]
+    verdict = {'simulatedMs': round(car.race_total_time, 3) if car.finished else None, 'simulationSeconds': round(time.perf_counter() - started, 3)}
+    if not car.finished:
+        verdict.update(status='rejected', reason='driver does not finish in the re-simulation')
+    elif abs(car.race_total_time - claimed_ms) > VERIFY_TOLERANCE_MS:
+        verdict.update(status='rejected', reason=f're-simulated time {car.race_total_time:.3f} ms differs from the claim')
+    else:
+        verdict['status'] = 'verified'
+    return verdict
+
+
+def verify_pool() -> ProcessPoolExecutor:
+    # Spawned rather than forked: the server process has an event loop and
+    # worker threads running, which a fork would copy mid-flight.
+    global VERIFY_POOL
+    if VERIFY_POOL is None:
+        VERIFY_POOL = ProcessPoolExecutor(max_workers=VERIFY_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return VERIFY_POOL
+
+
+def shutdown_pool():
+    global VERIFY_POOL
+    for task in list(VERIFY_TASKS):
+        task.cancel()
+    if VERIFY_POOL is not None:
+        VERIFY_POOL.shutdown(wait=False, cancel_futures=True)
+        VERIFY_POOL = None
+
+
+def claim_replay_name(claim: dict) -> str:
+    return f"{claim['raceId']}-{claim['playerId']}{replay.REPLAY_SUFFIX}"
+
+
+def submit_claim(claim: dict, path: Path | None):
+    # Called on the event loop once the claimed race's replay is closed.
+    if path is None:
+        logger.warning('No replay for race %s; %s stays off the global board', claim['raceId'], claim['name'])
+        return
+    task = asyncio.get_running_loop().create_task(verify_and_promote(claim, Path(path)))
+    VERIFY_TASKS.add(task)
+    task.add_done_callback(finish_verification)
+
+
+def finish_verification(task: asyncio.Task):
+    VERIFY_TASKS.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error('Leaderboard verification failed', exc_info=task.exception())
+
+
+async def verify_and_promote(claim: dict, path: Path, directory: Path | None = None):
+    from web_multiplayer import server
+
+    directory = Path(directory or SUBMISSION_DIR)
+    name = claim_replay_name(claim)
+    PENDING_CLAIMS.add(name)
+    try:
+        archived = await asyncio.to_thread(archive_replay, path, directory / name)
+        try:
+            verdict = await asyncio.get_running_loop().run_in_executor(
+                verify_pool(), verify_run, str(archived), claim['playerId'], claim['raceTimeMs'], claim['trackHash']
+            )
+        except Exception as exc:  # a crashed or shut down pool
+            verdict = {'status': 'error', 'reason': f'{type(exc).__name__}: {exc}'}
+        server.LEADERBOARD_SUBMISSIONS_TOTAL.inc((verdict['status'],))
+
+        placed = False
+        if verdict['status'] == 'verified':
+            with server.TRACER.span('leaderboard_write', f"room {claim['roomId']}"):
+                placed = server.update_global_leaderboard(
+                    claim['trackId'],
+                    claim['lapsToWin'],
+                    {
+                        'name': claim['name'],
+                        'timeMs': int(claim['raceTimeMs']),
+                        'carId': claim['carId'],
+                        'carName': claim['carName'],
+                        'raceId': claim['raceId'],
+                    },
+                )
+                if placed:
+                    await asyncio.to_thread(server.save_leaderboard_store)
+        else:
+            logger.warning('Leaderboard claim by %s in race %s %s: %s', claim['name'], claim['raceId'], verdict['status'], verdict.get('reason'))
+        # A claim stays pending until its verdict is recorded, so a concurrent
+        # prune either sees its file as pending or sees its board entry.
+        async with RECORD_LOCK:
+            PENDING_CLAIMS.discard(name)
+            await asyncio.to_thread(record_verdict, claim, verdict, placed, archived, server.leaderboard_race_ids(), PENDING_CLAIMS, directory)
+    finally:
+        PENDING_CLAIMS.discard(name)
+    return verdict
+
+
+def archive_replay(path: Path, archived: Path) -> Path:
+    archived.parent.mkdir(parents=True, exist_ok=True)
+    if not archived.exists():
+        try:
+            os.link(path, archived)
+        except OSError:
+            shutil.copyfile(path, archived)
+    return archived
+
+
+def record_verdict(claim: dict, verdict: dict, placed: bool, archived: Path, on_board: set, pending: set, directory: Path):
+    # on_board: race ids with a run on a board; pending: the live set of
+    # replay names of claims still in flight, whose files are left alone.
+    entry = dict(claim, verdict=verdict, placed=placed, verifiedAt=round(time.time(), 3))
+    with open(directory / SUBMISSION_LOG, 'a', encoding='utf-8') as file:
+        file.write(json.dumps(entry, separators=(',', ':')) + '\n')
+
+    if verdict['status'] != 'verified':
+        rejected = directory / 'rejected'
+        rejected.mkdir(exist_ok=True)
+        os.replace(archived, rejected / archived.name)
+    # Only runs still on a board keep their replay.
+    for path in directory.glob(f'*{replay.REPLAY_SUFFIX}'):
+        if path.name not in pending and path.stem.split('-')[0] not in on_board:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+
+def resolve_submission(value: str) -> Path:
+    if replay.RACE_ID_PATTERN.match(value):
+        for directory in (SUBMISSION_DIR, SUBMISSION_DIR / 'rejected'):
+            candidate = next(directory.glob(f'{value}-*{replay.REPLAY_SUFFIX}'), None)
+            if candidate is not None:
+                return candidate
+    return replay.resolve_replay_path(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Re-simulate a race from its inputs and print each human finisher\'s time.')
+    parser.add_argument('replay', help='race id or path')
+    parser.add_argument('--player', help='only this player id')
+    args = parser.parse_args()
+
+    try:
+        path = resolve_submission(args.replay)
+        replay_file = replay.ReplayFile(path)
+    except (OSError, replay.ReplayError) as exc:
+        sys.exit(f'Error: {exc}')
+    # The replay's own keyframes stand in for the claim: a verified run
+    # re-simulates to the time the live race recorded.
+    reference = replay.ReplayPlayer(replay_file)
+    reference.seek(replay_file.ticks)
+    rows_hash = track_hash(replay_file.rows)
+    for car, (player_id, name, _, bot) in zip(reference.cars, replay_file.cars):
+        if bot or (args.player and player_id != args.player):
+            continue
+        if not car.finished:
+            print(f'{player_id} {name}: did not finish')
+            continue
+        verdict = verify_run(str(path), player_id, car.race_total_time, rows_hash)
+        print(f'{player_id} {name}: recorded {car.race_total_time:.3f} ms, {verdict["status"]}'
+              + (f' ({verdict["reason"]})' if 'reason' in verdict else f' in {verdict["simulationSeconds"]}s'))
+
+
+if __name__ == '__main__':
+    main()